@@ -0,0 +1,53 @@
+"""
+Jetons d'accès en lecture aux données des comptes (équité, événements temps réel)
+
+    <base64url(JSON {"accounts": [...], "exp": epoch})>.<base64url(HMAC-SHA256)>
+
+La signature porte sur la première partie, avec la clé ACCOUNT_TOKEN_SECRET partagée
+avec Next.js: le dashboard émet un jeton pour les comptes de l'utilisateur connecté
+(external_account_id et/ou numéros de compte), le proxy vérifie chaque compte demandé
+"""
+import hmac
+import time
+import base64
+import hashlib
+import json as json_lib
+from typing import Iterable, Optional, Set
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(secret: str, payload: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(secret: str, accounts: Iterable[str], ttl: float = 3600) -> str:
+    """Jeton valable ttl secondes pour les comptes donnés (outils, tests; Next.js en production)"""
+    body = json_lib.dumps(
+        {"accounts": sorted({str(a) for a in accounts}), "exp": int(time.time() + ttl)},
+        separators=(",", ":"),
+    )
+    payload = _b64encode(body.encode())
+    return f"{payload}.{_sign(secret, payload)}"
+
+
+def token_accounts(secret: str, token: str) -> Optional[Set[str]]:
+    """Comptes autorisés par un jeton, ou None (jeton invalide ou expiré)"""
+    if not secret or not token:
+        return None
+    payload, sep, signature = token.partition(".")
+    if not sep or not hmac.compare_digest(signature, _sign(secret, payload)):
+        return None
+    try:
+        body = json_lib.loads(_b64decode(payload))
+        if float(body["exp"]) < time.time():
+            return None
+        return {str(a) for a in body["accounts"]}
+    except (ValueError, KeyError, TypeError):
+        return None
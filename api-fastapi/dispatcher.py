@@ -0,0 +1,158 @@
+"""
+Répartition des transmissions vers Next.js en files par compte
+Chaque compte (external_account_id) est associé à une file fixe parmi N:
+les trades d'un même compte sont transmis un par un dans l'ordre de réception
+(ouverture puis fermeture d'un ticket), les comptes de files différentes en parallèle
+Les envois par lot ne remplissent une file que jusqu'à max_depth - batch_reserve:
+la réserve reste disponible pour les trades unitaires des autres comptes de la file
+"""
+import time
+import zlib
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (fonction, arguments, future du résultat, heure de mise en file)
+Job = Tuple[Callable[..., Awaitable[Any]], tuple, asyncio.Future, float]
+
+
+class Shard:
+    def __init__(self, index: int, max_depth: int, batch_depth: int):
+        self.index = index
+        self.max_depth = max_depth
+        # Profondeur au-delà de laquelle les envois par lot attendent
+        self.batch_depth = batch_depth
+        self.jobs: deque = deque()
+        # Créés au démarrage, dans la boucle d'événements du serveur
+        self._ready: Optional[asyncio.Event] = None
+        # Signalée à chaque tâche retirée de la file (envois par lot en attente de place)
+        self._space: Optional[asyncio.Condition] = None
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        # Attente de la dernière tâche traitée (secondes)
+        self.last_wait = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.jobs)
+
+    def lag(self, now: float) -> float:
+        """Ancienneté de la plus vieille tâche en attente (secondes)"""
+        return now - self.jobs[0][3] if self.jobs else 0.0
+
+    def push(self, job: Job):
+        self.jobs.append(job)
+        if self._ready is not None:
+            self._ready.set()
+
+    async def run(self):
+        while True:
+            if not self.jobs:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            # La tâche reste en tête de file pendant son exécution (calcul du retard)
+            func, args, future, enqueued_at = self.jobs[0]
+            self.last_wait = time.monotonic() - enqueued_at
+            try:
+                result = await func(*args)
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.jobs.popleft()
+                self.processed += 1
+            async with self._space:
+                self._space.notify_all()
+
+    async def wait_for_space(self, limit: int):
+        """Attend que la profondeur de la file passe sous limit"""
+        async with self._space:
+            await self._space.wait_for(lambda: self.depth < limit)
+
+
+class ShardedDispatcher:
+    def __init__(self, shards: int = 8, max_depth: int = 1000, batch_reserve: Optional[int] = None):
+        # Par défaut, 10% de chaque file réservés aux trades unitaires
+        reserve = max_depth // 10 if batch_reserve is None else batch_reserve
+        batch_depth = min(max(max_depth - reserve, 1), max_depth)
+        self.shards = [Shard(index, max_depth, batch_depth) for index in range(max(shards, 1))]
+
+    def start(self):
+        for shard in self.shards:
+            if shard.task is None:
+                shard._ready = asyncio.Event()
+                shard._space = asyncio.Condition()
+                shard.task = asyncio.create_task(shard.run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Laisse les files se vider (au plus timeout secondes) puis arrête les workers"""
+        deadline = time.monotonic() + timeout
+        while any(shard.jobs for shard in self.shards) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for shard in self.shards:
+            if shard.task is not None:
+                shard.task.cancel()
+                shard.task = None
+
+    def shard_for(self, key: str) -> Shard:
+        # crc32 plutôt que hash(): même répartition d'un redémarrage à l'autre
+        return self.shards[zlib.crc32(key.encode("utf-8")) % len(self.shards)]
+
+    async def enqueue(self, key: str, func: Callable[..., Awaitable[Any]], *args,
+                      wait: bool = False) -> asyncio.Future:
+        """
+        Place func(*args) dans la file du compte key
+        Returns: future du résultat, à attendre par l'appelant
+        File pleine: OverflowError, ou attente d'une place si wait (envois par lot,
+        limités à batch_depth pour laisser la réserve aux trades unitaires)
+        """
+        shard = self.shard_for(key)
+        limit = shard.batch_depth if wait else shard.max_depth
+        if shard.depth >= limit:
+            if not wait:
+                shard.rejected += 1
+                raise OverflowError(f"File {shard.index} pleine ({shard.max_depth} trades en attente)")
+            await shard.wait_for_space(limit)
+        future = asyncio.get_running_loop().create_future()
+        shard.push((func, args, future, time.monotonic()))
+        return future
+
+    async def submit(self, key: str, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Exécute func(*args) dans la file du compte key et retourne son résultat"""
+        future = await self.enqueue(key, func, *args)
+        # Déconnexion du client: la tâche reste en file pour préserver l'ordre
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        shards: List[dict] = [
+            {
+                "shard": shard.index,
+                "depth": shard.depth,
+                "lag_ms": round(shard.lag(now) * 1000, 1),
+                "last_wait_ms": round(shard.last_wait * 1000, 1),
+                "processed": shard.processed,
+                "failed": shard.failed,
+                "rejected": shard.rejected,
+            }
+            for shard in self.shards
+        ]
+        return {
+            "shards": len(self.shards),
+            "max_depth": self.shards[0].max_depth,
+            "batch_max_depth": self.shards[0].batch_depth,
+            "depth": sum(s["depth"] for s in shards),
+            "max_lag_ms": max(s["lag_ms"] for s in shards),
+            "per_shard": shards,
+        }
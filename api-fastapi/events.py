@@ -0,0 +1,134 @@
+"""
+Diffusion en temps réel des événements du proxy (trades, enregistrements, données de compte)
+Chaque abonné (SSE ou WebSocket) reçoit les événements des comptes qu'il suit
+dans une file bornée: un abonné trop lent est déconnecté au lieu de ralentir l'ingestion
+"""
+import time
+import asyncio
+import logging
+import itertools
+import json as json_lib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (id, type, JSON) d'un événement
+Event = Tuple[int, str, str]
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, accounts: Set[str], buffer_size: int):
+        self.accounts = accounts
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    async def next_event(self, timeout: float) -> Optional[Event]:
+        """
+        Prochain événement, () si aucun événement pendant timeout (keep-alive),
+        None si l'abonné a été déconnecté
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return ()
+
+    @staticmethod
+    def format_sse(event: Event) -> str:
+        event_id, event_type, payload = event
+        return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+class EventHub:
+    def __init__(self, buffer_size: int = 256, max_subscribers: int = 1000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._by_account: Dict[str, Set[Subscriber]] = {}
+        self._subscribers: Set[Subscriber] = set()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, accounts: Iterable[str]) -> Subscriber:
+        """Abonnement aux événements des comptes donnés (pas d'abonnement à tous les comptes)"""
+        account_set = {a for a in accounts if a}
+        if not account_set:
+            raise ValueError("Aucun compte suivi")
+        if self.subscriber_count >= self.max_subscribers:
+            raise OverflowError("Nombre maximal d'abonnés atteint")
+        subscriber = Subscriber(account_set, self.buffer_size)
+        self._subscribers.add(subscriber)
+        for account in subscriber.accounts:
+            self._by_account.setdefault(account, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        for account in subscriber.accounts:
+            subscribers = self._by_account.get(account)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_account[account]
+
+    def _drop(self, subscriber: Subscriber):
+        """Déconnecte un abonné dont la file est pleine"""
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        self.dropped_subscribers += 1
+        # Vider la file pour y placer le signal de fin (None)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        logger.warning("Abonné aux événements trop lent, déconnecté")
+
+    def publish(self, event_type: str, accounts: Iterable[str], data: dict) -> int:
+        """
+        Diffuse un événement aux abonnés des comptes concernés, sans jamais attendre
+        accounts: identifiants du compte (external_account_id, numéro de compte)
+        Returns: nombre d'abonnés servis
+        """
+        accounts = [str(a) for a in accounts if a]
+        targets: Set[Subscriber] = set()
+        for account in accounts:
+            targets |= self._by_account.get(account, set())
+        if not targets:
+            return 0
+
+        # Encodé une seule fois pour tous les abonnés
+        event_id = next(self._ids)
+        payload = json_lib.dumps({
+            "id": event_id,
+            "type": event_type,
+            "accounts": accounts,
+            "timestamp": time.time(),
+            "data": data,
+        }, default=str)
+        message = (event_id, event_type, payload)
+        self.published += 1
+
+        delivered = 0
+        for subscriber in targets:
+            try:
+                subscriber.queue.put_nowait(message)
+                delivered += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+        return delivered
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count,
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+def parse_accounts(accounts: Optional[str]) -> List[str]:
+    """Paramètre accounts=a,b,c -> liste (vide si absent: abonnement refusé)"""
+    if not accounts:
+        return []
+    return [a.strip() for a in accounts.split(",") if a.strip()]
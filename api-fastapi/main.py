@@ -2,15 +2,29 @@
 API FastAPI intermédiaire entre MetaTrader et Next.js
 Cette API sert de proxy pour éviter les problèmes de connexion WebRequest dans MetaTrader
 """
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
+from datetime import datetime, timedelta
 import httpx
+import asyncio
 import logging
+import os
+import hmac
+import time
+import pstats
 import json as json_lib
 
+from timeseries import TimeSeriesStore, RESOLUTIONS, RAW, MINUTE, HOUR
+from events import EventHub, Subscriber, parse_accounts
+from normalize import load_broker_timezones, load_symbol_normalizer, mt4_time_to_utc, parse_order_type
+from wire import TradeLineParser, WireFormatError, WIRE_VERSION
+from dispatcher import ShardedDispatcher
+from profiler import Profiler, ProfilerMiddleware, SAMPLE, REQUESTS
+from access import token_accounts
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -60,12 +74,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profilage à la demande (POST /api/admin/profile, désactivé sans ADMIN_TOKEN)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_DURATION = float(os.getenv("PROFILE_MAX_DURATION", "60"))
+profiler = Profiler()
+app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
+# Lecture des données de compte (équité, événements): jetons signés par Next.js
+ACCOUNT_TOKEN_SECRET = os.getenv("ACCOUNT_TOKEN_SECRET", "")
+# Écriture des données de compte: jeton partagé de RendrAccountMonitor (paramètre API_KEY)
+MT4_WORKER_TOKEN = os.getenv("MT4_WORKER_TOKEN", "")
+
 # URL du serveur Next.js
 NEXTJS_URL = "http://127.0.0.1:3000"
+# Next.js n'a pas de route /api/mt4/account-data: transmission désactivée par défaut
+FORWARD_ACCOUNT_DATA = os.getenv("FORWARD_ACCOUNT_DATA", "false").lower() in ("1", "true", "yes")
 
 # Client HTTP pour communiquer avec Next.js
 client = httpx.AsyncClient(timeout=30.0)
 
+# Séries temporelles balance/équité des comptes (envoyées par RendrAccountMonitor)
+TIMESERIES_DIR = os.getenv("TIMESERIES_DIR", "data/timeseries")
+TIMESERIES_FLUSH_INTERVAL = float(os.getenv("TIMESERIES_FLUSH_INTERVAL", "60"))
+timeseries_store = TimeSeriesStore(
+    TIMESERIES_DIR,
+    retention={
+        RAW: float(os.getenv("TIMESERIES_RAW_RETENTION_HOURS", "48")) * 3600,
+        MINUTE: float(os.getenv("TIMESERIES_1M_RETENTION_DAYS", "30")) * 86400,
+        HOUR: float(os.getenv("TIMESERIES_1H_RETENTION_DAYS", "730")) * 86400,
+    },
+)
+
+# Diffusion en temps réel des trades et données de compte (SSE / WebSocket)
+EVENTS_KEEPALIVE_SECONDS = 15.0
+event_hub = EventHub(
+    buffer_size=int(os.getenv("EVENTS_SUBSCRIBER_BUFFER", "256")),
+    max_subscribers=int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000")),
+)
+
+# Transmission des trades à Next.js: ordre garanti par compte, comptes en parallèle
+TRADE_DISPATCH_MAX_DEPTH = int(os.getenv("TRADE_DISPATCH_MAX_DEPTH", "1000"))
+# Attente maximale des transmissions d'un lot avant de répondre (sous le délai de 10 s de l'EA)
+TRADE_BATCH_WAIT_SECONDS = float(os.getenv("TRADE_BATCH_WAIT_SECONDS", "8"))
+trade_dispatcher = ShardedDispatcher(
+    shards=int(os.getenv("TRADE_DISPATCH_SHARDS", "8")),
+    max_depth=TRADE_DISPATCH_MAX_DEPTH,
+    batch_reserve=int(os.getenv("TRADE_DISPATCH_BATCH_RESERVE", str(TRADE_DISPATCH_MAX_DEPTH // 10))),
+)
+
+# Normalisation des trades (dates UTC, symboles canoniques, types d'ordre)
+broker_timezones = load_broker_timezones()
+symbol_normalizer = load_symbol_normalizer()
+
 
 class RegisterRequest(BaseModel):
     account_number: int
@@ -87,6 +147,93 @@ class TradeRequest(BaseModel):
     open_time: str
     close_time: Optional[str] = None
     signature: Optional[str] = None
+    # Serveur du compte et décalage horaire du serveur (TimeCurrent() - TimeGMT(), secondes)
+    server: Optional[str] = None
+    broker_utc_offset: Optional[int] = None
+
+
+def normalize_trade(request: TradeRequest) -> dict:
+    """
+    Trade MetaTrader -> données typées pour Next.js
+    Dates en ISO 8601 UTC, symbole canonique (symbole du broker conservé), type d'ordre normalisé
+    Lève ValueError si une date ou le type d'ordre est invalide
+    """
+    zone = broker_timezones.zone_for(request.external_account_id, request.server, request.broker_utc_offset)
+    return {
+        "external_account_id": request.external_account_id,
+        "ticket": request.ticket,
+        "symbol": symbol_normalizer.canonical(request.symbol),
+        "broker_symbol": request.symbol,
+        "type": parse_order_type(request.type).value,
+        "lots": request.lots,
+        "open_price": request.open_price,
+        "close_price": request.close_price,
+        "commission": request.commission,
+        "swap": request.swap,
+        "profit": request.profit,
+        "open_time": mt4_time_to_utc(request.open_time, zone),
+        "close_time": mt4_time_to_utc(request.close_time, zone) if request.close_time else None,
+        "broker_timezone": zone,
+    }
+
+
+class ProfileRequest(BaseModel):
+    # sample: piles échantillonnées; requests: cProfile sur une requête sur every_n
+    mode: str = SAMPLE
+    duration: float = 10
+    interval_ms: float = 5
+    every_n: int = 10
+    # Rapport pstats: nombre de fonctions et tri
+    limit: int = 50
+    sort: str = "cumulative"
+
+
+class AccountInfo(BaseModel):
+    accountNumber: int
+    server: Optional[str] = None
+    balance: float
+    equity: float
+    margin: float = 0.0
+    freeMargin: float = 0.0
+    profit: float = 0.0
+
+
+class AccountStatistics(BaseModel):
+    openPositionsCount: Optional[int] = None
+
+
+class AccountDataRequest(BaseModel):
+    # Envoi complet de RendrAccountMonitor (accountInfo, positions, statistiques)
+    accountInfo: Optional[AccountInfo] = None
+    openPositions: List[dict] = []
+    statistics: Optional[AccountStatistics] = None
+    # Envoi du seul statut de connexion
+    accountNumber: Optional[int] = None
+    isConnected: Optional[bool] = None
+
+
+async def _flush_timeseries_periodically():
+    while True:
+        await asyncio.sleep(TIMESERIES_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(timeseries_store.purge)
+            await asyncio.to_thread(timeseries_store.flush)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture des séries temporelles: {e}")
+
+
+@app.on_event("startup")
+async def load_timeseries():
+    await asyncio.to_thread(timeseries_store.load)
+    app.state.timeseries_task = asyncio.create_task(_flush_timeseries_periodically())
+    trade_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def flush_timeseries():
+    app.state.timeseries_task.cancel()
+    await trade_dispatcher.stop()
+    await asyncio.to_thread(timeseries_store.flush)
 
 
 @app.get("/")
@@ -112,7 +259,9 @@ async def health():
     return {
         "status": "ok",
         "fastapi": "running",
-        "nextjs": nextjs_status
+        "nextjs": nextjs_status,
+        "events": event_hub.stats(),
+        "dispatcher": trade_dispatcher.stats()
     }
 
 
@@ -177,6 +326,18 @@ async def register_account(request: RegisterRequest):
             # #endregion
             
             logger.info(f"Enregistrement réussi: {data}")
+            if isinstance(data, dict):
+                broker_timezones.remember_account(data.get("external_account_id"), request.server)
+            event_hub.publish(
+                "account_registered",
+                [data.get("external_account_id") if isinstance(data, dict) else None, request.account_number],
+                {
+                    "account_number": request.account_number,
+                    "server": request.server,
+                    "platform": request.platform,
+                    "result": data,
+                }
+            )
             return data
         else:
             # #region agent log
@@ -248,24 +409,26 @@ async def submit_trade(request: TradeRequest):
     Reçoit les données de MetaTrader et les transmet à Next.js
     """
     logger.info(f"Requête de trade reçue: ticket={request.ticket}, symbol={request.symbol}")
-    
     try:
-        # Préparer les données pour Next.js
-        trade_data = {
-            "external_account_id": request.external_account_id,
-            "ticket": request.ticket,
-            "symbol": request.symbol,
-            "type": request.type,
-            "lots": request.lots,
-            "open_price": request.open_price,
-            "close_price": request.close_price,
-            "commission": request.commission,
-            "swap": request.swap,
-            "profit": request.profit,
-            "open_time": request.open_time,
-            "close_time": request.close_time,
-        }
-        
+        return await trade_dispatcher.submit(request.external_account_id, forward_trade, request)
+    except OverflowError as e:
+        logger.error(f"Trade refusé (ticket={request.ticket}): {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def forward_trade(request: TradeRequest) -> dict:
+    """Normalise un trade, le transmet à Next.js et le diffuse aux abonnés"""
+    try:
+        trade_data = normalize_trade(request)
+    except ValueError as e:
+        logger.error(f"Trade invalide (ticket={request.ticket}): {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    return await transmit_trade(request, trade_data)
+
+
+async def transmit_trade(request: TradeRequest, trade_data: dict) -> dict:
+    """Transmet un trade normalisé à Next.js et le diffuse aux abonnés"""
+    try:
         if request.signature:
             trade_data["signature"] = request.signature
         
@@ -278,6 +441,12 @@ async def submit_trade(request: TradeRequest):
         if response.status_code == 200:
             data = response.json()
             logger.info(f"Trade soumis avec succès: {data}")
+            # La signature de l'EA n'est pas diffusée
+            event_hub.publish(
+                "trade",
+                [request.external_account_id],
+                {key: value for key, value in trade_data.items() if key != "signature"}
+            )
             return data
         else:
             logger.error(f"Erreur Next.js: {response.status_code} - {response.text}")
@@ -286,6 +455,8 @@ async def submit_trade(request: TradeRequest):
                 detail=f"Erreur Next.js: {response.text}"
             )
     
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Erreur de connexion à Next.js: {e}")
         raise HTTPException(
@@ -297,6 +468,337 @@ async def submit_trade(request: TradeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/trades/batch")
+async def submit_trades_batch(request: Request):
+    """
+    Soumission d'un lot de trades au format compact (voir wire.py)
+    Les lignes sont décodées au fil de la réception, validées et normalisées, puis
+    chaque trade est placé dans la file de son compte (dans l'ordre des lignes)
+    La réponse attend les transmissions à Next.js au plus TRADE_BATCH_WAIT_SECONDS
+    depuis le début de la requête (délai de l'EA): rejected contient les erreurs de
+    décodage, de validation et de transmission, et les trades encore en file (202).
+    L'EA n'avance son curseur que jusqu'au premier trade de rejected
+    """
+    deadline = time.monotonic() + TRADE_BATCH_WAIT_SECONDS
+    parser = TradeLineParser()
+    received = 0
+    rejected = []
+    # (ligne, champs, future de la transmission)
+    queued = []
+
+    def reject(line_no, fields, error):
+        rejected.append({
+            "line": line_no,
+            "ticket": fields.get("ticket") if fields else None,
+            "error": error,
+        })
+
+    async def process(records):
+        nonlocal received
+        for line_no, fields, error in records:
+            received += 1
+            if error is not None:
+                reject(line_no, fields, error)
+                continue
+            try:
+                trade = TradeRequest(**fields)
+            except ValidationError as e:
+                reject(line_no, fields, "; ".join(
+                    f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            try:
+                trade_data = normalize_trade(trade)
+            except ValueError as e:
+                reject(line_no, fields, str(e))
+                continue
+            # File pleine: la lecture du corps attend qu'une place se libère
+            future = await trade_dispatcher.enqueue(
+                trade.external_account_id, transmit_trade, trade, trade_data, wait=True
+            )
+            # Échecs de transmission déjà journalisés par transmit_trade
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            queued.append((line_no, fields, future))
+
+    try:
+        async for chunk in request.stream():
+            await process(parser.feed(chunk))
+        await process(parser.close())
+    except WireFormatError as e:
+        logger.error(f"Lot de trades invalide: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    futures = [future for _, _, future in queued]
+    if futures:
+        await asyncio.wait(futures, timeout=max(deadline - time.monotonic(), 0))
+
+    accepted = 0
+    pending = 0
+    for line_no, fields, future in queued:
+        if not future.done():
+            # Toujours en file: transmis plus tard, renvoyé par l'EA (doublon ignoré par Next.js)
+            pending += 1
+            reject(line_no, fields, "Transmission en cours")
+        elif future.cancelled() or future.exception() is not None:
+            error = None if future.cancelled() else future.exception()
+            reject(line_no, fields, str(error.detail) if isinstance(error, HTTPException) else str(error))
+        else:
+            accepted += 1
+    rejected.sort(key=lambda item: item["line"])
+
+    logger.info(f"Lot de trades: {accepted}/{received} transmis, {pending} en cours")
+    return JSONResponse(status_code=202 if pending else 200, content={
+        "version": WIRE_VERSION,
+        "received": received,
+        "accepted": accepted,
+        "pending": pending,
+        "rejected": rejected,
+    })
+
+
+@app.post("/api/mt4/account-data")
+async def ingest_account_data(payload: AccountDataRequest, request: Request):
+    """
+    Données de compte envoyées par RendrAccountMonitor
+    Balance, équité et P&L sont ajoutés à la série temporelle du compte,
+    puis la requête est transmise telle quelle à Next.js (FORWARD_ACCOUNT_DATA)
+    Jeton MT4_WORKER_TOKEN, ou jeton d'accès couvrant le compte, requis
+    """
+    info = payload.accountInfo
+    account_number = info.accountNumber if info is not None else payload.accountNumber
+    token = request_token(request.headers)
+    if not (MT4_WORKER_TOKEN and hmac.compare_digest(token.encode(), MT4_WORKER_TOKEN.encode())):
+        authorize_accounts(token, [str(account_number)] if account_number is not None else [])
+    if info is not None:
+        open_positions = len(payload.openPositions)
+        if payload.statistics is not None and payload.statistics.openPositionsCount is not None:
+            open_positions = payload.statistics.openPositionsCount
+        timeseries_store.append(
+            timeseries_store.account_key(info.accountNumber, info.server),
+            balance=info.balance,
+            equity=info.equity,
+            profit=info.profit,
+            margin=info.margin,
+            free_margin=info.freeMargin,
+            open_positions=open_positions,
+        )
+        event_hub.publish(
+            "account_update",
+            [info.accountNumber],
+            {
+                "account_number": info.accountNumber,
+                "server": info.server,
+                "balance": info.balance,
+                "equity": info.equity,
+                "profit": info.profit,
+                "margin": info.margin,
+                "free_margin": info.freeMargin,
+                "open_positions": open_positions,
+            }
+        )
+    elif payload.accountNumber is not None and payload.isConnected is not None:
+        event_hub.publish(
+            "account_connection",
+            [payload.accountNumber],
+            {"account_number": payload.accountNumber, "is_connected": payload.isConnected}
+        )
+
+    forwarded = False
+    if FORWARD_ACCOUNT_DATA:
+        headers = {"Content-Type": "application/json"}
+        for name in ("Authorization", "X-Account-Number"):
+            if name in request.headers:
+                headers[name] = request.headers[name]
+        try:
+            response = await client.post(
+                f"{NEXTJS_URL}/api/mt4/account-data",
+                content=await request.body(),
+                headers=headers
+            )
+            forwarded = 200 <= response.status_code < 300
+            if not forwarded:
+                logger.warning(f"Données de compte non acceptées par Next.js: {response.status_code} - {response.text}")
+        except httpx.RequestError as e:
+            # Les points sont conservés localement même si Next.js est injoignable
+            logger.warning(f"Erreur de connexion à Next.js (données de compte): {e}")
+
+    return {"status": "ok", "stored": info is not None, "forwarded": forwarded}
+
+
+def request_token(headers, token: Optional[str] = None) -> str:
+    """Jeton de lecture: X-Account-Token, Authorization: Bearer, sinon paramètre token (EventSource, WebSocket)"""
+    authorization = headers.get("Authorization", "")
+    if headers.get("X-Account-Token"):
+        return headers["X-Account-Token"]
+    if authorization.startswith("Bearer "):
+        return authorization[len("Bearer "):]
+    return token or ""
+
+
+def authorize_accounts(token: str, accounts: List[str]):
+    """
+    Vérifie que le jeton couvre chacun des comptes demandés (ADMIN_TOKEN: tous les comptes)
+    401 sans jeton valide, 403 si un compte n'est pas couvert
+    """
+    if ADMIN_TOKEN and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return
+    allowed = token_accounts(ACCOUNT_TOKEN_SECRET, token)
+    if allowed is None:
+        raise HTTPException(status_code=401, detail="Jeton d'accès absent, invalide ou expiré")
+    denied = [account for account in accounts if account not in allowed]
+    if denied:
+        raise HTTPException(status_code=403, detail=f"Accès refusé aux comptes: {', '.join(denied)}")
+
+
+@app.get("/api/accounts/{account_number}/equity")
+async def account_equity(
+    request: Request,
+    account_number: int,
+    server: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "auto",
+    max_points: int = 1000,
+    token: Optional[str] = None
+):
+    """
+    Courbe balance/équité d'un compte pour les graphiques du dashboard
+    Colonnes: ts (secondes epoch), balance, equity, equity_min, equity_max,
+    profit, margin, free_margin, open_positions
+    resolution: auto (la plus fine sous max_points), raw, 1m ou 1h
+    Jeton d'accès couvrant le numéro de compte requis (voir access.py)
+    """
+    authorize_accounts(request_token(request.headers, token), [str(account_number)])
+    if resolution != "auto" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Résolution invalide: {resolution}")
+    if not 1 <= max_points <= 10000:
+        raise HTTPException(status_code=400, detail="max_points doit être compris entre 1 et 10000")
+
+    # Dates avec ou sans fuseau: comparaison sur les timestamps epoch
+    end_ts = end.timestamp() if end else datetime.now().timestamp()
+    start_ts = start.timestamp() if start else end_ts - timedelta(days=1).total_seconds()
+    if start_ts > end_ts:
+        raise HTTPException(status_code=400, detail="start doit précéder end")
+
+    key = timeseries_store.resolve(account_number, server)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Aucune donnée pour le compte {account_number}")
+
+    return timeseries_store.query(key, start_ts, end_ts, resolution, max_points)
+
+
+def _subscribe(headers, accounts: Optional[str], token: Optional[str]) -> Subscriber:
+    """Abonnement aux comptes demandés, tous couverts par le jeton d'accès (pas d'abonnement global)"""
+    wanted = parse_accounts(accounts)
+    if not wanted:
+        raise HTTPException(status_code=400, detail="Paramètre accounts requis")
+    authorize_accounts(request_token(headers, token), wanted)
+    try:
+        return event_hub.subscribe(wanted)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/api/events/stream")
+async def events_stream(request: Request, accounts: Optional[str] = None, token: Optional[str] = None):
+    """
+    Flux Server-Sent Events des trades et données de compte
+    accounts: identifiants suivis séparés par des virgules (external_account_id
+    ou numéro de compte), obligatoire et couvert par le jeton d'accès
+    """
+    subscriber = _subscribe(request.headers, accounts, token)
+
+    async def stream():
+        try:
+            while True:
+                event = await subscriber.next_event(EVENTS_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Abonné trop lent: le client doit se reconnecter
+                    yield "event: dropped\ndata: {}\n\n"
+                    break
+                if not event:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield Subscriber.format_sse(event)
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/api/events/ws")
+async def events_websocket(websocket: WebSocket, accounts: Optional[str] = None, token: Optional[str] = None):
+    """Mêmes événements que /api/events/stream via WebSocket (un message JSON par événement)"""
+    try:
+        subscriber = _subscribe(websocket.headers, accounts, token)
+    except HTTPException as e:
+        # Refus avant l'acceptation: 1008 (accès), 1013 (trop d'abonnés)
+        await websocket.close(code=1013 if e.status_code == 503 else 1008, reason=e.detail)
+        return
+
+    await websocket.accept()
+    try:
+        while True:
+            event = await subscriber.next_event(EVENTS_KEEPALIVE_SECONDS)
+            if event is None:
+                await websocket.close(code=1008, reason="Abonné trop lent")
+                break
+            await websocket.send_text(event[2] if event else '{"type": "ping"}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_hub.unsubscribe(subscriber)
+
+
+def require_admin(request: Request):
+    """Jeton ADMIN_TOKEN (X-Admin-Token ou Authorization: Bearer); endpoints invisibles sans jeton configuré"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("X-Admin-Token", "")
+    authorization = request.headers.get("Authorization", "")
+    if not token and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Jeton administrateur invalide")
+
+
+@app.post("/api/admin/profile")
+async def run_profile(payload: ProfileRequest, _: None = Depends(require_admin)):
+    """
+    Profilage du proxy pendant payload.duration secondes (réponse à la fin de la session)
+    mode=sample: piles agrégées (collapsed) du thread de la boucle d'événements
+    mode=requests: statistiques pstats d'une requête sur every_n
+    Inclut le retard de la boucle d'événements mesuré pendant la session
+    """
+    if payload.mode not in (SAMPLE, REQUESTS):
+        raise HTTPException(status_code=422, detail=f"mode doit valoir {SAMPLE} ou {REQUESTS}")
+    if not 0 < payload.duration <= PROFILE_MAX_DURATION:
+        raise HTTPException(status_code=422, detail=f"duration doit être comprise entre 0 et {PROFILE_MAX_DURATION} s")
+    if payload.interval_ms < 1 or payload.every_n < 1 or payload.limit < 1:
+        raise HTTPException(status_code=422, detail="interval_ms, every_n et limit doivent être positifs")
+    if payload.sort not in pstats.Stats.sort_arg_dict_default:
+        raise HTTPException(status_code=422, detail=f"Tri pstats inconnu: {payload.sort}")
+
+    logger.info(f"Session de profilage: mode={payload.mode}, duree={payload.duration}s")
+    try:
+        return await profiler.run(
+            payload.mode,
+            payload.duration,
+            interval_ms=payload.interval_ms,
+            every_n=payload.every_n,
+            limit=payload.limit,
+            sort=payload.sort,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.get("/api/test")
 async def test(request: Request):
     """Endpoint de test simple"""
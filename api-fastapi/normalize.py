@@ -0,0 +1,249 @@
+"""
+Normalisation des données MetaTrader à l'entrée du proxy
+- Dates MT4 ("YYYY.MM.DD HH:MM:SS", heure du serveur du broker) -> ISO 8601 UTC
+- Symboles avec suffixe de broker (EURUSD.r, EURUSDm) -> symbole canonique interné
+- Types d'ordre ("BUY LIMIT", "BUY_LIMIT", 2) -> OrderType
+Next.js et le calcul du cashback reçoivent des données déjà typées
+"""
+import os
+import re
+import sys
+import json as json_lib
+import logging
+from enum import Enum
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Union
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+logger = logging.getLogger(__name__)
+
+
+class OrderType(str, Enum):
+    BUY = "BUY"
+    SELL = "SELL"
+    BUY_LIMIT = "BUY_LIMIT"
+    SELL_LIMIT = "SELL_LIMIT"
+    BUY_STOP = "BUY_STOP"
+    SELL_STOP = "SELL_STOP"
+
+
+# Constantes OP_* de MQL4 (OrderType())
+_ORDER_TYPE_CODES = {
+    "0": OrderType.BUY,
+    "1": OrderType.SELL,
+    "2": OrderType.BUY_LIMIT,
+    "3": OrderType.SELL_LIMIT,
+    "4": OrderType.BUY_STOP,
+    "5": OrderType.SELL_STOP,
+}
+
+
+@lru_cache(maxsize=256)
+def parse_order_type(value: Union[str, int]) -> OrderType:
+    """Type d'ordre MT4/MT5 sous toutes ses formes -> OrderType (ValueError si inconnu)"""
+    text = str(value).strip().upper().replace(" ", "_").replace("-", "_")
+    if text in _ORDER_TYPE_CODES:
+        return _ORDER_TYPE_CODES[text]
+    if text.startswith("OP_"):
+        text = text[3:]
+    text = text.replace("BUYLIMIT", "BUY_LIMIT").replace("SELLLIMIT", "SELL_LIMIT") \
+        .replace("BUYSTOP", "BUY_STOP").replace("SELLSTOP", "SELL_STOP")
+    try:
+        return OrderType(text)
+    except ValueError:
+        raise ValueError(f"Type d'ordre inconnu: {value}")
+
+
+# --- Dates ---
+
+MQL_EPOCH = datetime(1970, 1, 1)
+UTC_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=64)
+def _tzinfo(zone: str):
+    """Fuseau depuis "UTC", "+02:00", "GMT+3" ou un nom IANA ("Europe/Athens")"""
+    if zone.upper() in ("UTC", "GMT", "Z", "0", "+00:00"):
+        return timezone.utc
+    match = UTC_OFFSET_RE.match(zone.strip())
+    if match:
+        sign, hours, minutes = match.groups()
+        delta = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return timezone(-delta if sign == "-" else delta)
+    if ZoneInfo is None:
+        raise ValueError(f"Fuseau horaire non supporté: {zone}")
+    try:
+        return ZoneInfo(zone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Fuseau horaire inconnu: {zone}")
+
+
+def offset_zone(offset_seconds: int) -> str:
+    """Décalage du serveur (TimeCurrent() - TimeGMT(), en secondes) -> "+HH:MM" """
+    # TimeGMT() dépend de l'horloge du PC: arrondi au quart d'heure
+    offset = int(round(offset_seconds / 900.0)) * 900
+    sign = "-" if offset < 0 else "+"
+    offset = abs(offset)
+    return f"{sign}{offset // 3600:02d}:{offset % 3600 // 60:02d}"
+
+
+@lru_cache(maxsize=65536)
+def mt4_time_to_utc(value: str, zone: str = "UTC") -> str:
+    """
+    Date MT4 dans le fuseau du broker -> ISO 8601 UTC ("2024-03-01T08:15:00Z")
+    Les positions ouvertes sont renvoyées à chaque cycle de l'EA avec la même
+    date d'ouverture: le cache évite de refaire la conversion
+    Formats: "YYYY.MM.DD HH:MM:SS", "YYYY.MM.DD HH:MM", "YYYY.MM.DD", ISO 8601,
+    datetime MQL4 (secondes depuis 1970 en heure du serveur)
+    """
+    text = value.strip()
+    if text.isdigit():
+        local = MQL_EPOCH + timedelta(seconds=int(text))
+    elif len(text) >= 10 and text[4] == "." and text[7] == ".":
+        local = datetime(
+            int(text[0:4]), int(text[5:7]), int(text[8:10]),
+            int(text[11:13]) if len(text) >= 16 else 0,
+            int(text[14:16]) if len(text) >= 16 else 0,
+            int(text[17:19]) if len(text) >= 19 else 0,
+        )
+    else:
+        local = datetime.fromisoformat(text.replace("Z", "+00:00"))
+
+    if local.tzinfo is None:
+        local = local.replace(tzinfo=_tzinfo(zone))
+    return local.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# --- Symboles ---
+
+DEFAULT_SYMBOL_SUFFIXES = ("micro", "mini", "pro", "ecn", "raw", "std", "stp", "+")
+# Suffixes d'une lettre (EURUSDm, XAUUSDc): retirés seulement d'une paire de devises ou de
+# métaux connus, jamais d'un symbole dont la dernière lettre est réelle (BTCUSDC, ETHUSDT)
+DEFAULT_PAIR_SUFFIXES = ("m", "c", "i", "e", "b", "r", "x")
+PAIR_CODES = frozenset((
+    "USD", "EUR", "GBP", "JPY", "CHF", "CAD", "AUD", "NZD", "SEK", "NOK", "DKK", "PLN", "HUF",
+    "CZK", "TRY", "ZAR", "MXN", "SGD", "HKD", "CNH", "RUB", "ILS", "THB",
+    "XAU", "XAG", "XPT", "XPD",
+))
+DEFAULT_SYMBOL_ALIASES = {
+    "GOLD": "XAUUSD",
+    "SILVER": "XAGUSD",
+    "USOIL": "XTIUSD",
+    "WTI": "XTIUSD",
+    "UKOIL": "XBRUSD",
+    "BRENT": "XBRUSD",
+}
+SYMBOL_SEPARATORS = re.compile(r"[._#\-!$]")
+
+
+class SymbolNormalizer:
+    def __init__(self, suffixes=DEFAULT_SYMBOL_SUFFIXES, aliases: Optional[Dict[str, str]] = None,
+                 pair_suffixes=DEFAULT_PAIR_SUFFIXES):
+        self.suffixes = {s.upper() for s in suffixes}
+        self.pair_suffixes = {s.upper() for s in pair_suffixes}
+        aliases = DEFAULT_SYMBOL_ALIASES if aliases is None else aliases
+        self.aliases = {k.upper(): sys.intern(v.upper()) for k, v in aliases.items()}
+        self._cache: Dict[str, str] = {}
+
+    def canonical(self, symbol: str) -> str:
+        cached = self._cache.get(symbol)
+        if cached is not None:
+            return cached
+
+        text = symbol.strip().upper()
+        # Suffixe séparé: EURUSD.r, EURUSD_i, EURUSD#
+        base = SYMBOL_SEPARATORS.split(text, 1)[0] or text
+        # Suffixe collé à une paire de 6 lettres: EURUSDm, XAUUSDpro
+        if len(base) > 6 and base[:6].isalpha() and (
+            base[6:] in self.suffixes
+            or (base[6:] in self.pair_suffixes and base[:3] in PAIR_CODES and base[3:6] in PAIR_CODES)
+        ):
+            base = base[:6]
+        if base not in self.aliases:
+            # Alias avec suffixe: GOLDm, GOLD.pro
+            for suffix in self.suffixes | self.pair_suffixes:
+                if base.endswith(suffix) and base[:-len(suffix)] in self.aliases:
+                    base = base[:-len(suffix)]
+                    break
+        canonical = sys.intern(self.aliases.get(base, base))
+
+        if len(self._cache) >= 10000:
+            self._cache.clear()
+        self._cache[symbol] = canonical
+        return canonical
+
+
+# --- Configuration ---
+
+class BrokerTimezones:
+    """
+    Fuseau horaire des serveurs MT4/MT5 par préfixe de nom de serveur
+    (BROKER_TIMEZONES = {"VantageInternational": "Europe/Athens", "ICMarkets": "+02:00"})
+    """
+
+    def __init__(self, zones: Dict[str, str], default: str = "UTC"):
+        # Serveur de chaque compte, appris lors de l'enregistrement
+        self.account_servers: Dict[str, str] = {}
+        self.configure(zones, default)
+
+    def configure(self, zones: Dict[str, str], default: str = "UTC"):
+        """(Re)charge la correspondance serveur -> fuseau et vide le cache"""
+        for zone in list(zones.values()) + [default]:
+            _tzinfo(zone)  # Erreur de configuration détectée au démarrage
+        # Préfixes les plus longs d'abord
+        self.zones = sorted(((k.lower(), v) for k, v in zones.items()), key=lambda kv: -len(kv[0]))
+        self.default = default
+        # Fuseau déjà résolu par nom de serveur
+        self._cache: Dict[Optional[str], str] = {}
+
+    def remember_account(self, external_account_id: Optional[str], server: Optional[str]):
+        if not external_account_id or not server:
+            return
+        if len(self.account_servers) >= 100000:
+            self.account_servers.clear()
+        self.account_servers[external_account_id] = server
+
+    def zone_for_server(self, server: Optional[str]) -> str:
+        cached = self._cache.get(server)
+        if cached is not None:
+            return cached
+        zone = self.default
+        if server:
+            name = server.lower()
+            for prefix, candidate in self.zones:
+                if name.startswith(prefix):
+                    zone = candidate
+                    break
+        if len(self._cache) >= 1024:
+            self._cache.clear()
+        self._cache[server] = zone
+        return zone
+
+    def zone_for(self, external_account_id: Optional[str] = None, server: Optional[str] = None,
+                 utc_offset: Optional[int] = None) -> str:
+        """Décalage envoyé par l'EA, sinon fuseau configuré du serveur, sinon fuseau par défaut"""
+        if utc_offset is not None:
+            return offset_zone(utc_offset)
+        return self.zone_for_server(server or self.account_servers.get(external_account_id or ""))
+
+
+def load_broker_timezones() -> BrokerTimezones:
+    zones = json_lib.loads(os.getenv("BROKER_TIMEZONES", "{}"))
+    return BrokerTimezones(zones, os.getenv("BROKER_DEFAULT_TIMEZONE", "UTC"))
+
+
+def load_symbol_normalizer() -> SymbolNormalizer:
+    suffixes = os.getenv("SYMBOL_SUFFIXES")
+    pair_suffixes = os.getenv("SYMBOL_PAIR_SUFFIXES")
+    aliases = os.getenv("SYMBOL_ALIASES")
+    return SymbolNormalizer(
+        [s.strip() for s in suffixes.split(",") if s.strip()] if suffixes else DEFAULT_SYMBOL_SUFFIXES,
+        json_lib.loads(aliases) if aliases else None,
+        [s.strip() for s in pair_suffixes.split(",") if s.strip()] if pair_suffixes is not None else DEFAULT_PAIR_SUFFIXES,
+    )
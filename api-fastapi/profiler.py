@@ -0,0 +1,195 @@
+"""
+Profilage à la demande du proxy (POST /api/admin/profile)
+- sample: échantillonnage de la pile du thread de la boucle d'événements pendant une durée
+  bornée, résultat en piles agrégées (format collapsed de flamegraph.pl / speedscope)
+- requests: cProfile sur une requête sur N pendant une durée bornée, résultat pstats
+Dans les deux cas, le retard de la boucle d'événements est mesuré pendant la session.
+Profilage inactif: aucun thread ni tâche, le middleware se limite à un test d'attribut
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import cProfile
+import logging
+import pstats
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE = "sample"
+REQUESTS = "requests"
+LOOP_LAG_INTERVAL = 0.05
+
+
+class StackSampler(threading.Thread):
+    """Relève périodiquement la pile d'un thread (celui de la boucle d'événements)"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._labels: Dict[object, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+            self._labels[code] = label
+        return label
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class LoopLagMonitor:
+    """Retard de la boucle d'événements: réveil d'un sleep() par rapport à l'heure prévue"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - start - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def summary(self) -> dict:
+        if not self.lags:
+            return {"samples": 0}
+        lags = sorted(self.lags)
+        return {
+            "samples": len(lags),
+            "mean_ms": round(sum(lags) / len(lags) * 1000, 2),
+            "p99_ms": round(lags[min(int(len(lags) * 0.99), len(lags) - 1)] * 1000, 2),
+            "max_ms": round(lags[-1] * 1000, 2),
+        }
+
+
+class Profiler:
+    def __init__(self):
+        # Test du middleware: None tant qu'aucune session "requests" n'est active
+        self.every_n: Optional[int] = None
+        self.session_running = False
+        self._seen = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._busy = False
+        self._requests: List[tuple] = []
+
+    async def run(self, mode: str, duration: float, interval_ms: float = 5, every_n: int = 10,
+                  limit: int = 50, sort: str = "cumulative") -> dict:
+        """Exécute une session de profilage et retourne son rapport"""
+        if self.session_running:
+            raise RuntimeError("Une session de profilage est déjà en cours")
+        self.session_running = True
+        lag = LoopLagMonitor()
+        lag.start()
+        started = time.monotonic()
+        try:
+            if mode == SAMPLE:
+                sampler = StackSampler(threading.get_ident(), interval_ms / 1000)
+                sampler.start()
+                try:
+                    await asyncio.sleep(duration)
+                finally:
+                    sampler.stop()
+                report = {"samples": sampler.samples, "interval_ms": interval_ms, "collapsed": sampler.collapsed()}
+            else:
+                self._seen = 0
+                self._requests = []
+                self._profile = cProfile.Profile()
+                self.every_n = max(every_n, 1)
+                try:
+                    await asyncio.sleep(duration)
+                finally:
+                    self.every_n = None
+                report = {
+                    "every_n": every_n,
+                    "seen": self._seen,
+                    "profiled": len(self._requests),
+                    "slowest": [
+                        {"method": method, "path": path, "ms": round(elapsed * 1000, 2)}
+                        for elapsed, method, path in sorted(self._requests, reverse=True)[:10]
+                    ],
+                    "pstats": self._format_stats(limit, sort),
+                }
+                self._profile = None
+        finally:
+            lag.stop()
+            self.session_running = False
+        report.update({"mode": mode, "duration": round(time.monotonic() - started, 2), "loop_lag": lag.summary()})
+        logger.info(f"Session de profilage terminee: mode={mode}, duree={report['duration']}s")
+        return report
+
+    def _format_stats(self, limit: int, sort: str) -> str:
+        if not self._requests:
+            return ""
+        output = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    async def profile(self, app, scope, receive, send):
+        """Requête sélectionnée (une sur every_n): exécutée sous cProfile"""
+        self._seen += 1
+        # Un seul profileur actif à la fois: les requêtes concurrentes ne sont pas profilées
+        if self._busy or self._seen % self.every_n:
+            return await app(scope, receive, send)
+        self._busy = True
+        # La session peut se terminer avant la fin de la requête
+        profile = self._profile
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            return await app(scope, receive, send)
+        finally:
+            # Les autres tâches exécutées pendant les attentes de la requête sont incluses
+            profile.disable()
+            self._busy = False
+            self._requests.append((time.perf_counter() - started, scope.get("method", ""), scope.get("path", "")))
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI: un simple test d'attribut quand le profilage par requête est inactif"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if self.profiler.every_n is None or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        return await self.profiler.profile(self.app, scope, receive, send)
@@ -0,0 +1,399 @@
+"""
+Séries temporelles des comptes (balance, équité, P&L des positions ouvertes)
+Stockage colonnaire en mémoire (array('d')) par compte et par résolution,
+en segments append-only persistés sur disque, avec agrégation automatique
+brut -> 1 minute -> 1 heure et rétention par résolution
+Les écritures et suppressions de fichiers se font hors du verrou des séries:
+l'ingestion et les requêtes (boucle d'événements) n'attendent jamais le disque
+"""
+import os
+import math
+import time
+import bisect
+import struct
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "ts", "balance", "equity", "equity_min", "equity_max",
+    "profit", "margin", "free_margin", "open_positions",
+)
+TS, BALANCE, EQUITY, EQUITY_MIN, EQUITY_MAX = range(5)
+
+RAW = "raw"
+MINUTE = "1m"
+HOUR = "1h"
+RESOLUTIONS = (RAW, MINUTE, HOUR)
+BUCKET_SECONDS = {MINUTE: 60, HOUR: 3600}
+
+DEFAULT_RETENTION = {RAW: 2 * 86400, MINUTE: 30 * 86400, HOUR: 730 * 86400}
+
+SEGMENT_ROWS = 2048
+SEGMENT_MAGIC = b"RTS1"
+SEGMENT_HEADER = struct.Struct("<4sI")
+OPEN_BUCKETS_FILE = "open.bin"
+
+# Écriture en attente: (segment, fichier, nombre de lignes du segment, lignes à ajouter)
+PendingWrite = Tuple["Segment", Path, int, bytes]
+
+
+class Segment:
+    """
+    Bloc de lignes consécutives, une array('d') par colonne en mémoire
+    Sur disque: en-tête puis lignes float64 ajoutées en fin de fichier
+    (seules les lignes nouvelles sont écrites à chaque flush)
+    """
+
+    __slots__ = ("columns", "persisted")
+
+    def __init__(self):
+        self.columns = [array("d") for _ in COLUMNS]
+        # Nombre de lignes déjà écrites sur disque
+        self.persisted = 0
+
+    def __len__(self):
+        return len(self.columns[TS])
+
+    @property
+    def first_ts(self) -> float:
+        return self.columns[TS][0]
+
+    @property
+    def last_ts(self) -> float:
+        return self.columns[TS][-1]
+
+    def append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def bounds(self, start: float, end: float) -> Tuple[int, int]:
+        ts = self.columns[TS]
+        return bisect.bisect_left(ts, start), bisect.bisect_right(ts, end)
+
+    def pending_bytes(self) -> bytes:
+        rows = array("d")
+        for index in range(self.persisted, len(self)):
+            rows.extend(column[index] for column in self.columns)
+        return rows.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Segment":
+        magic, column_count = SEGMENT_HEADER.unpack_from(data)
+        if magic != SEGMENT_MAGIC or column_count != len(COLUMNS):
+            raise ValueError("Format de segment inconnu")
+        rows = array("d")
+        body = data[SEGMENT_HEADER.size:]
+        # Une ligne incomplète (arrêt pendant l'écriture) est ignorée
+        row_size = 8 * len(COLUMNS)
+        rows.frombytes(body[:len(body) - len(body) % row_size])
+        segment = cls()
+        segment.columns = [rows[index::len(COLUMNS)] for index in range(len(COLUMNS))]
+        segment.persisted = len(segment)
+        return segment
+
+
+class Tier:
+    """Une résolution d'une série: segments triés par temps"""
+
+    def __init__(self, retention: float, directory: Optional[Path]):
+        self.retention = retention
+        self.directory = directory
+        self.segments: List[Segment] = []
+
+    def _segment_path(self, segment: Segment) -> Optional[Path]:
+        if self.directory is None:
+            return None
+        return self.directory / f"{int(segment.first_ts * 1000)}.seg"
+
+    def pending(self) -> List[PendingWrite]:
+        """Lignes non écrites (segments pleins depuis le dernier flush et segment actif)"""
+        if self.directory is None:
+            return []
+        writes = []
+        for segment in reversed(self.segments):
+            if segment.persisted >= len(segment):
+                break
+            writes.append((segment, self._segment_path(segment), len(segment), segment.pending_bytes()))
+        writes.reverse()
+        return writes
+
+    @staticmethod
+    def write(segment: Segment, path: Path, data: bytes):
+        """Ajoute des lignes au fichier du segment (hors verrou: segment.persisted est lu, pas modifié)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as f:
+            if segment.persisted == 0:
+                f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(COLUMNS)))
+            f.write(data)
+
+    def load(self):
+        if self.directory is None or not self.directory.is_dir():
+            return
+        for path in sorted(self.directory.glob("*.seg"), key=lambda p: int(p.stem)):
+            try:
+                segment = Segment.from_bytes(path.read_bytes())
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Segment illisible ignoré {path}: {e}")
+                continue
+            if len(segment):
+                self.segments.append(segment)
+
+    @property
+    def last_ts(self) -> Optional[float]:
+        return self.segments[-1].last_ts if self.segments else None
+
+    def append(self, row):
+        # Segment plein: plus jamais modifié, écrit une dernière fois au prochain flush
+        if not self.segments or len(self.segments[-1]) >= SEGMENT_ROWS:
+            self.segments.append(Segment())
+        self.segments[-1].append(row)
+
+    def purge(self, now: float) -> List[Path]:
+        """Retire les segments entièrement sortis de la rétention; retourne leurs fichiers à supprimer"""
+        cutoff = now - self.retention
+        paths = []
+        while len(self.segments) > 1 and self.segments[0].last_ts < cutoff:
+            path = self._segment_path(self.segments.pop(0))
+            if path is not None:
+                paths.append(path)
+        return paths
+
+    def _overlapping(self, start: float, end: float):
+        first = max(bisect.bisect_right([s.first_ts for s in self.segments], start) - 1, 0)
+        for segment in self.segments[first:]:
+            if segment.first_ts > end:
+                break
+            lo, hi = segment.bounds(start, end)
+            if hi > lo:
+                yield segment, lo, hi
+
+    def count(self, start: float, end: float) -> int:
+        return sum(hi - lo for _, lo, hi in self._overlapping(start, end))
+
+    def query(self, start: float, end: float) -> List[array]:
+        result = [array("d") for _ in COLUMNS]
+        for segment, lo, hi in self._overlapping(start, end):
+            for out, column in zip(result, segment.columns):
+                out.extend(column[lo:hi])
+        return result
+
+
+class AccountSeries:
+    def __init__(self, retention: Dict[str, float], directory: Optional[Path]):
+        self.directory = directory
+        self.tiers = {
+            name: Tier(retention[name], directory / name if directory else None)
+            for name in RESOLUTIONS
+        }
+        # Ligne agrégée du bucket en cours par résolution (None si vide)
+        self.open_buckets: Dict[str, Optional[List[float]]] = {MINUTE: None, HOUR: None}
+
+    def load(self):
+        for tier in self.tiers.values():
+            tier.load()
+        path = self.directory / OPEN_BUCKETS_FILE if self.directory else None
+        if path is None or not path.exists():
+            return
+        values = array("d")
+        values.frombytes(path.read_bytes())
+        width = len(COLUMNS)
+        for index, name in enumerate((MINUTE, HOUR)):
+            row = list(values[index * width:(index + 1) * width])
+            self.open_buckets[name] = None if not row or math.isnan(row[TS]) else row
+
+    @property
+    def last_ts(self) -> Optional[float]:
+        return self.tiers[RAW].last_ts
+
+    def append(self, row: Tuple[float, ...]):
+        self.tiers[RAW].append(row)
+        self._aggregate(MINUTE, row)
+
+    def _aggregate(self, name: str, row):
+        size = BUCKET_SECONDS[name]
+        bucket_start = row[TS] - row[TS] % size
+        current = self.open_buckets[name]
+        if current is not None and current[TS] != bucket_start:
+            self.tiers[name].append(current)
+            if name == MINUTE:
+                self._aggregate(HOUR, current)
+            current = None
+
+        if current is None:
+            current = list(row)
+            current[TS] = bucket_start
+        else:
+            # Dernière valeur du bucket, extrêmes de l'équité sur le bucket
+            equity_min = min(current[EQUITY_MIN], row[EQUITY_MIN])
+            equity_max = max(current[EQUITY_MAX], row[EQUITY_MAX])
+            current[1:] = row[1:]
+            current[EQUITY_MIN] = equity_min
+            current[EQUITY_MAX] = equity_max
+        self.open_buckets[name] = current
+
+    def pending(self) -> Tuple[List[PendingWrite], Optional[bytes]]:
+        """Écritures en attente (sous le verrou du store): lignes des segments, buckets en cours"""
+        writes = []
+        for tier in self.tiers.values():
+            writes.extend(tier.pending())
+        if self.directory is None:
+            return writes, None
+        values = array("d")
+        for name in (MINUTE, HOUR):
+            values.extend(self.open_buckets[name] or [math.nan] * len(COLUMNS))
+        return writes, values.tobytes()
+
+    def write_open_buckets(self, data: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / (OPEN_BUCKETS_FILE + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.directory / OPEN_BUCKETS_FILE)
+
+    def purge(self, now: float) -> List[Path]:
+        return [path for tier in self.tiers.values() for path in tier.purge(now)]
+
+    def query(self, name: str, start: float, end: float) -> List[array]:
+        columns = self.tiers[name].query(start, end)
+        # Le bucket en cours rend la courbe agrégée à jour
+        current = self.open_buckets.get(name)
+        if current is not None and start <= current[TS] <= end:
+            for column, value in zip(columns, current):
+                column.append(value)
+        return columns
+
+
+def _decimate(columns: List[array], max_points: int) -> List[array]:
+    """Regroupe les lignes en max_points groupes (dernière valeur, extrêmes de l'équité)"""
+    rows = len(columns[TS])
+    if rows <= max_points:
+        return columns
+    result = [array("d") for _ in COLUMNS]
+    step = rows / max_points
+    for group in range(max_points):
+        lo = int(group * step)
+        hi = int((group + 1) * step) if group < max_points - 1 else rows
+        for index, (out, column) in enumerate(zip(result, columns)):
+            if index == EQUITY_MIN:
+                out.append(min(column[lo:hi]))
+            elif index == EQUITY_MAX:
+                out.append(max(column[lo:hi]))
+            else:
+                out.append(column[hi - 1])
+    return result
+
+
+class TimeSeriesStore:
+    def __init__(self, directory: Optional[str] = None, retention: Optional[Dict[str, float]] = None):
+        self.directory = Path(directory) if directory else None
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.series: Dict[str, AccountSeries] = {}
+        # Séries en mémoire (ingestion, requêtes): jamais tenu pendant une écriture disque
+        self._lock = threading.Lock()
+        # Sérialise flush et purge (un segment supprimé n'est jamais réécrit)
+        self._io_lock = threading.Lock()
+
+    @staticmethod
+    def account_key(account_number, server: Optional[str] = None) -> str:
+        """Identifiant d'une série: numéro de compte et serveur (utilisable comme nom de dossier)"""
+        key = str(account_number)
+        if server:
+            key += "@" + "".join(c if c.isalnum() or c in "-._" else "_" for c in server)
+        return key
+
+    def _get(self, key: str, create: bool = False) -> Optional[AccountSeries]:
+        series = self.series.get(key)
+        if series is None and create:
+            series = self.series[key] = AccountSeries(
+                self.retention, self.directory / key if self.directory else None
+            )
+        return series
+
+    def load(self):
+        """Recharge les séries persistées (au démarrage)"""
+        if self.directory is None or not self.directory.is_dir():
+            return
+        with self._lock:
+            for entry in sorted(self.directory.iterdir()):
+                if entry.is_dir():
+                    self._get(entry.name, create=True).load()
+        logger.info(f"{len(self.series)} série(s) de compte chargée(s) depuis {self.directory}")
+
+    def append(self, key: str, balance: float, equity: float, profit: float = 0.0, margin: float = 0.0,
+               free_margin: float = 0.0, open_positions: float = 0.0, ts: Optional[float] = None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            series = self._get(key, create=True)
+            last_ts = series.last_ts
+            if last_ts is not None and ts < last_ts:
+                # Append-only: un point en retard est ramené au dernier instant connu
+                ts = last_ts
+            series.append((ts, balance, equity, equity, equity, profit, margin, free_margin, open_positions))
+
+    def resolve(self, account_number, server: Optional[str] = None) -> Optional[str]:
+        """Clé de série d'un compte; sans serveur, l'unique série de ce numéro de compte"""
+        if server:
+            key = self.account_key(account_number, server)
+            return key if key in self.series else None
+        prefix = f"{account_number}@"
+        with self._lock:
+            keys = [k for k in self.series if k == str(account_number) or k.startswith(prefix)]
+        return keys[0] if len(keys) == 1 else None
+
+    def query(self, key: str, start: float, end: float, resolution: str = "auto",
+              max_points: int = 1000) -> Optional[Dict]:
+        with self._lock:
+            series = self._get(key)
+            if series is None:
+                return None
+            if resolution == "auto":
+                # Résolution la plus fine qui couvre la période sans dépasser max_points
+                now = time.time()
+                resolution = HOUR
+                for name in (RAW, MINUTE):
+                    if start >= now - self.retention[name] and series.tiers[name].count(start, end) <= max_points:
+                        resolution = name
+                        break
+            columns = series.query(resolution, start, end)
+
+        columns = _decimate(columns, max_points)
+        result = {"account": key, "resolution": resolution, "points": len(columns[TS])}
+        for name, column in zip(COLUMNS, columns):
+            result[name] = column.tolist()
+        return result
+
+    def flush(self):
+        """
+        Écrit les lignes nouvelles et les buckets en cours sur disque
+        Les octets à écrire sont copiés sous le verrou, l'écriture se fait sans
+        """
+        with self._io_lock:
+            with self._lock:
+                snapshot = [(series, *series.pending()) for series in self.series.values()]
+            written = []
+            try:
+                for series, writes, open_buckets in snapshot:
+                    for segment, path, rows, data in writes:
+                        Tier.write(segment, path, data)
+                        written.append((segment, rows))
+                    if open_buckets is not None:
+                        series.write_open_buckets(open_buckets)
+            finally:
+                with self._lock:
+                    for segment, rows in written:
+                        segment.persisted = rows
+
+    def purge(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._io_lock:
+            with self._lock:
+                paths = [path for series in self.series.values() for path in series.purge(now)]
+            for path in paths:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
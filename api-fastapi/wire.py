@@ -0,0 +1,133 @@
+"""
+Format compact ligne par ligne pour les envois EA -> proxy (POST /api/trades/batch)
+
+    RTW/1<TAB>account=<external_account_id><TAB>server=<serveur><TAB>utc_offset=<secondes><TAB>fields=ticket,symbol,...
+    <valeurs séparées par des tabulations, dans l'ordre de fields>
+    ...
+
+- Première ligne: version du format et schéma (noms des champs de TradeRequest)
+- Une ligne par trade, une valeur vide vaut null
+- Échappements dans les valeurs: \\t, \\n, \\r, \\\\
+- Dates: "YYYY.MM.DD HH:MM:SS" ou datetime MQL4 (secondes, heure du serveur)
+- Lignes vides et lignes commençant par # ignorées
+Le décodage se fait au fil de la réception: un lot n'est jamais chargé en entier
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+WIRE_MAGIC = "RTW"
+WIRE_VERSION = 1
+MAX_LINE_BYTES = 64 * 1024
+
+# Paramètres d'en-tête -> champs ajoutés à chaque trade
+HEADER_FIELDS = {
+    "account": "external_account_id",
+    "server": "server",
+    "utc_offset": "broker_utc_offset",
+}
+
+_ESCAPE_RE = re.compile(r"\\(.)")
+_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+
+# (numéro de ligne, champs du trade ou None, erreur ou None)
+# En cas d'erreur, les champs se limitent au ticket brut s'il a pu être lu
+WireRecord = Tuple[int, Optional[Dict[str, str]], Optional[str]]
+
+
+class WireFormatError(ValueError):
+    """En-tête absent ou invalide: le lot entier est refusé"""
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def parse_header(line: str) -> Tuple[List[str], Dict[str, str]]:
+    """Ligne d'en-tête -> (champs des lignes, champs communs à tous les trades)"""
+    parts = line.split("\t")
+    magic, _, version = parts[0].partition("/")
+    if magic != WIRE_MAGIC or not version.isdigit():
+        raise WireFormatError("En-tête RTW absent")
+    if int(version) != WIRE_VERSION:
+        raise WireFormatError(f"Version du format non supportée: {version}")
+
+    fields: List[str] = []
+    common: Dict[str, str] = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise WireFormatError(f"Paramètre d'en-tête invalide: {part}")
+        if key == "fields":
+            fields = [f.strip() for f in value.split(",") if f.strip()]
+        elif key in HEADER_FIELDS and value:
+            common[HEADER_FIELDS[key]] = _unescape(value)
+        # Paramètres inconnus ignorés (ajouts compatibles d'une même version)
+    if not fields:
+        raise WireFormatError("Schéma absent de l'en-tête (fields=...)")
+    if len(set(fields)) != len(fields):
+        raise WireFormatError("Champ en double dans le schéma")
+    return fields, common
+
+
+class TradeLineParser:
+    """
+    Décodeur incrémental: feed() reçoit les morceaux du corps de la requête
+    et retourne les trades des lignes complètes, close() traite la dernière ligne
+    """
+
+    def __init__(self, max_line_bytes: int = MAX_LINE_BYTES):
+        self.max_line_bytes = max_line_bytes
+        self.fields: Optional[List[str]] = None
+        self.common: Dict[str, str] = {}
+        self.line_no = 0
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[WireRecord]:
+        if not chunk:
+            return []
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        if len(self._pending) > self.max_line_bytes:
+            raise WireFormatError(f"Ligne {self.line_no + 1} trop longue")
+        return self._parse_lines(lines)
+
+    def close(self) -> List[WireRecord]:
+        records = self._parse_lines([self._pending]) if self._pending else []
+        self._pending = b""
+        if self.fields is None:
+            raise WireFormatError("Lot vide")
+        return records
+
+    def _parse_lines(self, lines: List[bytes]) -> List[WireRecord]:
+        records: List[WireRecord] = []
+        for raw in lines:
+            self.line_no += 1
+            try:
+                line = raw.decode("utf-8").rstrip("\r")
+            except UnicodeDecodeError:
+                records.append((self.line_no, None, "Ligne non UTF-8"))
+                continue
+            if not line or line[0] == "#":
+                continue
+            if self.fields is None:
+                self.fields, self.common = parse_header(line)
+                continue
+            records.append(self._parse_row(line))
+        return records
+
+    def _parse_row(self, line: str) -> WireRecord:
+        values = line.split("\t")
+        if len(values) != len(self.fields):
+            raw = dict(zip(self.fields, values))
+            return (
+                self.line_no,
+                {"ticket": _unescape(raw["ticket"])} if raw.get("ticket") else None,
+                f"{len(values)} valeurs pour {len(self.fields)} champs",
+            )
+        trade = dict(self.common)
+        for field, value in zip(self.fields, values):
+            if value:
+                trade[field] = _unescape(value)
+        return self.line_no, trade, None
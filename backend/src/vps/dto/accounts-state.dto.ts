@@ -0,0 +1,15 @@
+import { IsArray, ArrayMaxSize, IsString } from 'class-validator';
+
+export class AccountsStateDto {
+  @IsArray()
+  @ArrayMaxSize(500)
+  @IsString({ each: true })
+  external_account_ids: string[];
+}
+
+export class AccountStateDto {
+  external_account_id: string;
+  status: string;
+  vps_host_id: string | null;
+  vps_lease_expires_at: string | null;
+}
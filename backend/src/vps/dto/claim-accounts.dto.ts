@@ -0,0 +1,20 @@
+import { IsString, IsNotEmpty, IsInt, Min, Max } from 'class-validator';
+
+export class ClaimAccountsDto {
+  @IsString()
+  @IsNotEmpty()
+  host_id: string;
+
+  @IsInt()
+  @Min(0)
+  capacity: number; // Nombre total de terminaux supportés par le VPS
+
+  @IsInt()
+  @Min(0)
+  free_slots: number; // Emplacements de terminaux libres
+
+  @IsInt()
+  @Min(30)
+  @Max(3600)
+  lease_ttl_seconds: number;
+}
@@ -0,0 +1,12 @@
+import { IsString, IsNotEmpty, IsArray, ArrayMaxSize } from 'class-validator';
+
+export class LeasedAccountsDto {
+  @IsString()
+  @IsNotEmpty()
+  host_id: string;
+
+  @IsArray()
+  @ArrayMaxSize(500)
+  @IsString({ each: true })
+  external_account_ids: string[];
+}
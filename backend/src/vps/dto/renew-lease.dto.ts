@@ -0,0 +1,25 @@
+import {
+  IsString,
+  IsNotEmpty,
+  IsInt,
+  IsArray,
+  ArrayMaxSize,
+  Min,
+  Max
+} from 'class-validator';
+
+export class RenewLeaseDto {
+  @IsString()
+  @IsNotEmpty()
+  host_id: string;
+
+  @IsArray()
+  @ArrayMaxSize(500)
+  @IsString({ each: true })
+  external_account_ids: string[];
+
+  @IsInt()
+  @Min(30)
+  @Max(3600)
+  lease_ttl_seconds: number;
+}
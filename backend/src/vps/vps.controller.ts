@@ -1,8 +1,19 @@
-import { Controller, Get, Post, Body, UseGuards } from '@nestjs/common';
+import {
+  Controller,
+  Get,
+  Post,
+  Body,
+  HttpCode,
+  UseGuards
+} from '@nestjs/common';
 import { VpsService } from './vps.service';
 import { VpsApiKeyGuard } from '../auth/guards/vps-api-key.guard';
 import { AccountStatusDto } from './dto/account-status.dto';
 import { PendingAccountDto } from './dto/pending-account.dto';
+import { ClaimAccountsDto } from './dto/claim-accounts.dto';
+import { RenewLeaseDto } from './dto/renew-lease.dto';
+import { AccountsStateDto, AccountStateDto } from './dto/accounts-state.dto';
+import { LeasedAccountsDto } from './dto/leased-accounts.dto';
 
 @Controller('vps')
 @UseGuards(VpsApiKeyGuard)
@@ -14,6 +25,40 @@ export class VpsController {
     return this.vpsService.getPendingAccounts();
   }
 
+  @Post('claim-accounts')
+  @HttpCode(200)
+  async claimAccounts(
+    @Body() dto: ClaimAccountsDto
+  ): Promise<PendingAccountDto[]> {
+    return this.vpsService.claimAccounts(dto);
+  }
+
+  @Post('renew-lease')
+  @HttpCode(200)
+  async renewLease(
+    @Body() dto: RenewLeaseDto
+  ): Promise<{ renewed: string[] }> {
+    const renewed = await this.vpsService.renewLease(dto);
+    return { renewed };
+  }
+
+  @Post('leased-accounts')
+  @HttpCode(200)
+  async getLeasedAccounts(
+    @Body() dto: LeasedAccountsDto
+  ): Promise<PendingAccountDto[]> {
+    return this.vpsService.getLeasedAccounts(dto);
+  }
+
+  @Post('accounts-state')
+  @HttpCode(200)
+  async getAccountsState(
+    @Body() dto: AccountsStateDto
+  ): Promise<{ accounts: AccountStateDto[] }> {
+    const accounts = await this.vpsService.getAccountsState(dto);
+    return { accounts };
+  }
+
   @Post('account-status')
   async updateAccountStatus(
     @Body() dto: AccountStatusDto
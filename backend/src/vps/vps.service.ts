@@ -3,6 +3,13 @@ import { SupabaseService } from '../config/supabase.service';
 import { EncryptionUtil } from '../common/utils/encryption.util';
 import { AccountStatusDto } from './dto/account-status.dto';
 import { PendingAccountDto } from './dto/pending-account.dto';
+import { ClaimAccountsDto } from './dto/claim-accounts.dto';
+import { RenewLeaseDto } from './dto/renew-lease.dto';
+import { AccountsStateDto, AccountStateDto } from './dto/accounts-state.dto';
+import { LeasedAccountsDto } from './dto/leased-accounts.dto';
+
+const PENDING_ACCOUNT_COLUMNS =
+  'external_account_id, broker, platform, server, login, investor_password';
 
 @Injectable()
 export class VpsService {
@@ -13,9 +20,7 @@ export class VpsService {
 
     const { data, error } = await supabase
       .from('trading_accounts')
-      .select(
-        'external_account_id, broker, platform, server, login, investor_password'
-      )
+      .select(PENDING_ACCOUNT_COLUMNS)
       .eq('status', 'pending_vps_setup');
 
     if (error) {
@@ -24,10 +29,217 @@ export class VpsService {
       );
     }
 
+    return this.decryptAccounts(data || []);
+  }
+
+  /**
+   * Réclame un lot de comptes en attente pour un VPS avec un bail (lease).
+   * Les comptes dont le bail a expiré peuvent être repris par un autre VPS.
+   * La taille du lot est proportionnelle aux emplacements libres du VPS
+   * par rapport à l'ensemble des VPS actifs, pour répartir la charge.
+   */
+  async claimAccounts(dto: ClaimAccountsDto): Promise<PendingAccountDto[]> {
+    const supabase = this.supabaseService.getServiceRoleClient();
+    const now = new Date();
+    const nowIso = now.toISOString();
+
+    // Annoncer la capacité du VPS
+    const { error: hostError } = await supabase.from('vps_hosts').upsert({
+      host_id: dto.host_id,
+      capacity: dto.capacity,
+      free_slots: dto.free_slots,
+      last_seen_at: nowIso
+    });
+
+    if (hostError) {
+      throw new BadRequestException(
+        `Erreur lors de l'enregistrement du VPS: ${hostError.message}`
+      );
+    }
+
+    if (dto.free_slots <= 0) {
+      return [];
+    }
+
+    const leaseAvailable =
+      'vps_lease_expires_at.is.null,' + `vps_lease_expires_at.lt.${nowIso}`;
+
+    const { count: claimableCount, error: countError } = await supabase
+      .from('trading_accounts')
+      .select('external_account_id', { count: 'exact', head: true })
+      .eq('status', 'pending_vps_setup')
+      .or(leaseAvailable);
+
+    if (countError) {
+      throw new BadRequestException(
+        `Erreur lors de la récupération: ${countError.message}`
+      );
+    }
+
+    if (!claimableCount) {
+      return [];
+    }
+
+    // Part équitable: free_slots / somme des free_slots des VPS vus récemment
+    const activeSince = new Date(
+      now.getTime() - dto.lease_ttl_seconds * 2 * 1000
+    ).toISOString();
+    const { data: hosts } = await supabase
+      .from('vps_hosts')
+      .select('free_slots')
+      .gte('last_seen_at', activeSince);
+
+    const totalFreeSlots = (hosts || []).reduce(
+      (sum, host) => sum + Math.max(host.free_slots, 0),
+      0
+    );
+    const fairShare = Math.ceil(
+      (claimableCount * dto.free_slots) /
+        Math.max(totalFreeSlots, dto.free_slots)
+    );
+    const limit = Math.min(dto.free_slots, Math.max(fairShare, 1));
+
+    const { data: candidates, error: candidatesError } = await supabase
+      .from('trading_accounts')
+      .select('external_account_id')
+      .eq('status', 'pending_vps_setup')
+      .or(leaseAvailable)
+      .order('created_at', { ascending: true })
+      .limit(limit);
+
+    if (candidatesError) {
+      throw new BadRequestException(
+        `Erreur lors de la récupération: ${candidatesError.message}`
+      );
+    }
+
+    const leaseExpiresAt = new Date(
+      now.getTime() + dto.lease_ttl_seconds * 1000
+    ).toISOString();
+    const claimed: any[] = [];
+
+    for (const candidate of candidates || []) {
+      // Mise à jour conditionnelle: le premier VPS à écrire obtient le bail
+      const { data: rows, error: claimError } = await supabase
+        .from('trading_accounts')
+        .update({
+          vps_host_id: dto.host_id,
+          vps_lease_expires_at: leaseExpiresAt
+        })
+        .eq('external_account_id', candidate.external_account_id)
+        .eq('status', 'pending_vps_setup')
+        .or(leaseAvailable)
+        .select(PENDING_ACCOUNT_COLUMNS);
+
+      if (claimError) {
+        console.error(
+          `Erreur lors de la réclamation du compte ${candidate.external_account_id}:`,
+          claimError
+        );
+        continue;
+      }
+
+      claimed.push(...(rows || []));
+    }
+
+    return this.decryptAccounts(claimed);
+  }
+
+  /**
+   * Prolonge le bail des comptes encore en cours de configuration par un VPS.
+   * Retourne les comptes dont le bail a effectivement été renouvelé.
+   */
+  async renewLease(dto: RenewLeaseDto): Promise<string[]> {
+    if (dto.external_account_ids.length === 0) {
+      return [];
+    }
+
+    const supabase = this.supabaseService.getServiceRoleClient();
+    const now = new Date();
+    const leaseExpiresAt = new Date(
+      now.getTime() + dto.lease_ttl_seconds * 1000
+    ).toISOString();
+
+    await supabase
+      .from('vps_hosts')
+      .update({ last_seen_at: now.toISOString() })
+      .eq('host_id', dto.host_id);
+
+    const { data, error } = await supabase
+      .from('trading_accounts')
+      .update({ vps_lease_expires_at: leaseExpiresAt })
+      .eq('vps_host_id', dto.host_id)
+      .eq('status', 'pending_vps_setup')
+      .in('external_account_id', dto.external_account_ids)
+      .select('external_account_id');
+
+    if (error) {
+      throw new BadRequestException(
+        `Erreur lors du renouvellement du bail: ${error.message}`
+      );
+    }
+
+    return (data || []).map((row) => row.external_account_id);
+  }
+
+  /**
+   * Identifiants des comptes encore en configuration et réservés à ce VPS.
+   * Le VPS Manager ne conserve pas les mots de passe entre deux tentatives :
+   * ils sont redemandés ici avant chaque nouvelle tentative.
+   */
+  async getLeasedAccounts(dto: LeasedAccountsDto): Promise<PendingAccountDto[]> {
+    if (dto.external_account_ids.length === 0) {
+      return [];
+    }
+
+    const supabase = this.supabaseService.getServiceRoleClient();
+
+    const { data, error } = await supabase
+      .from('trading_accounts')
+      .select(PENDING_ACCOUNT_COLUMNS)
+      .eq('vps_host_id', dto.host_id)
+      .eq('status', 'pending_vps_setup')
+      .in('external_account_id', dto.external_account_ids);
+
+    if (error) {
+      throw new BadRequestException(
+        `Erreur lors de la récupération: ${error.message}`
+      );
+    }
+
+    return this.decryptAccounts(data || []);
+  }
+
+  /**
+   * Retourne le statut et le VPS propriétaire des comptes demandés.
+   * Les comptes supprimés sont absents de la réponse.
+   */
+  async getAccountsState(dto: AccountsStateDto): Promise<AccountStateDto[]> {
+    if (dto.external_account_ids.length === 0) {
+      return [];
+    }
+
+    const supabase = this.supabaseService.getServiceRoleClient();
+
+    const { data, error } = await supabase
+      .from('trading_accounts')
+      .select('external_account_id, status, vps_host_id, vps_lease_expires_at')
+      .in('external_account_id', dto.external_account_ids);
+
+    if (error) {
+      throw new BadRequestException(
+        `Erreur lors de la récupération: ${error.message}`
+      );
+    }
+
+    return data || [];
+  }
+
+  private async decryptAccounts(rows: any[]): Promise<PendingAccountDto[]> {
     // Déchiffrer les mots de passe avec gestion d'erreur
     const accounts: PendingAccountDto[] = [];
 
-    for (const account of data || []) {
+    for (const account of rows) {
       try {
         // Vérifier si le format est valide (doit contenir ":")
         if (
@@ -92,6 +304,8 @@ export class VpsService {
 
     const updateData: any = {
       status: dto.status,
+      // Le compte n'est plus en configuration: libérer le bail du VPS
+      vps_lease_expires_at: null,
       updated_at: new Date().toISOString()
     };
 
@@ -0,0 +1,21 @@
+-- Répartition des comptes entre plusieurs VPS (claim/lease)
+-- Un VPS réclame un lot de comptes en attente avec un bail (lease) renouvelé pendant
+-- la configuration. Un bail expiré peut être repris par un autre VPS.
+
+ALTER TABLE public.trading_accounts
+ADD COLUMN IF NOT EXISTS vps_host_id TEXT,
+ADD COLUMN IF NOT EXISTS vps_lease_expires_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_trading_accounts_vps_lease
+    ON public.trading_accounts(status, vps_lease_expires_at);
+
+-- Table vps_hosts : capacité annoncée par chaque VPS à chaque réclamation
+CREATE TABLE IF NOT EXISTS public.vps_hosts (
+    host_id TEXT PRIMARY KEY,
+    capacity INTEGER NOT NULL DEFAULT 0,
+    free_slots INTEGER NOT NULL DEFAULT 0,
+    last_seen_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- RLS : accès uniquement via service role (pas de policy)
+ALTER TABLE public.vps_hosts ENABLE ROW LEVEL SECURITY;
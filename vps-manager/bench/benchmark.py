@@ -0,0 +1,219 @@
+"""
+Benchmark du provisionnement du VPS Manager sans MetaTrader (Linux)
+
+Construit un template de terminal factice (taille et nombre de fichiers réalistes),
+installe un terminal simulé (fake_terminal.py) à la place de terminal.exe,
+démarre l'API backend simulée (stub_api.py) et exécute process_pending_accounts
+jusqu'à ce que tous les comptes soient traités.
+
+Usage (depuis vps-manager/):
+    python bench/benchmark.py --accounts 10 100 1000
+    python bench/benchmark.py --accounts 100 --template-files 400 --template-mb 80 --failure-rate 0.05
+
+Rapporte pour chaque taille: comptes/minute, octets écrits sur disque,
+latence moyenne par étape de provisionnement et statuts finaux.
+"""
+
+import os
+import sys
+import time
+import stat
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import psutil
+
+VPS_MANAGER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(VPS_MANAGER_DIR))
+
+from stub_api import StubBackend, StubApiServer  # noqa: E402
+
+logger = logging.getLogger('benchmark')
+
+STEPS = ('clone', 'ea_copy', 'config_write', 'launch', 'readiness')
+
+# Arborescence inspirée d'un MT4 portable: beaucoup de petits fichiers
+# (MQL4, profils, config) et quelques gros (historique, bases, exécutable)
+TEMPLATE_LAYOUT = (
+    ('MQL4/Include', 0.30, 0.02),
+    ('MQL4/Indicators', 0.20, 0.02),
+    ('MQL4/Experts', 0.05, 0.01),
+    ('MQL4/Libraries', 0.05, 0.02),
+    ('MQL4/Files', 0.02, 0.00),
+    ('profiles/default', 0.10, 0.01),
+    ('templates', 0.08, 0.01),
+    ('config', 0.05, 0.02),
+    ('sounds', 0.05, 0.04),
+    ('history/default', 0.10, 0.85),
+)
+
+
+def build_template(template_dir: Path, file_count: int, total_mb: float, platform: str = 'MT4') -> int:
+    """Crée un template factice; retourne sa taille en octets"""
+    rng = random.Random(42)
+    total_bytes = int(total_mb * 1024 * 1024)
+    written = 0
+
+    for folder, count_share, size_share in TEMPLATE_LAYOUT:
+        folder_path = template_dir / folder.replace('MQL4', 'MQL5' if platform == 'MT5' else 'MQL4')
+        folder_path.mkdir(parents=True, exist_ok=True)
+        count = max(int(file_count * count_share), 1)
+        folder_bytes = int(total_bytes * size_share)
+        for index in range(count):
+            size = folder_bytes // count
+            with open(folder_path / f"file{index:04d}.dat", 'wb') as f:
+                f.write(rng.randbytes(size) if size else b'')
+            written += size
+
+    (template_dir / 'logs').mkdir(exist_ok=True)
+
+    exe_name = 'terminal.exe' if platform == 'MT4' else 'terminal64.exe'
+    exe_path = template_dir / exe_name
+    shutil.copy2(Path(__file__).resolve().parent / 'fake_terminal.py', exe_path)
+    exe_path.chmod(exe_path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    written += exe_path.stat().st_size
+    return written
+
+
+def step_latencies(before: Dict, after: Dict) -> Dict[str, float]:
+    """Latence moyenne par étape entre deux instantanés de l'histogramme"""
+    latencies = {}
+    for step in STEPS:
+        count_before, sum_before = before.get((step,), (0, 0.0))
+        count_after, sum_after = after.get((step,), (0, 0.0))
+        count = count_after - count_before
+        latencies[step] = (sum_after - sum_before) / count if count else 0.0
+    return latencies
+
+
+def run_benchmark(accounts: int, work_dir: Path, template_dir: Path, ea_path: Path, platform: str, max_cycles: int) -> Dict:
+    from metrics import REGISTRY, PROVISIONING_STEP_SECONDS
+    import main
+
+    backend = StubBackend(api_key='bench')
+    for _ in range(accounts):
+        backend.add_account(platform=platform)
+    server = StubApiServer(backend).start()
+
+    run_dir = work_dir / f"run-{accounts}"
+    os.environ.update({
+        'API_URL': server.url,
+        'VPS_API_KEY': 'bench',
+        'VPS_HOST_ID': 'bench-host',
+        'MAX_TERMINALS': str(accounts),
+        f'{platform}_PATH': str(template_dir),
+        f'{platform}_EA_PATH': str(ea_path),
+        'TERMINALS_BASE_PATH': str(run_dir / 'terminals'),
+        'STATE_DB_PATH': str(run_dir / 'state.db'),
+        'METRICS_PORT': '0',
+        # Un seul essai par compte: les échecs simulés ne sont pas retentés pendant la mesure
+        'RETRY_MAX_ATTEMPTS': '1',
+    })
+
+    manager = main.VPSManager()
+    process = psutil.Process()
+    io_before = process.io_counters().write_bytes if hasattr(process, 'io_counters') else 0
+    steps_before = PROVISIONING_STEP_SECONDS.snapshot()
+
+    start = time.perf_counter()
+    cycles = 0
+    while backend.pending_accounts() and cycles < max_cycles:
+        manager.process_pending_accounts()
+        cycles += 1
+    elapsed = time.perf_counter() - start
+
+    io_after = process.io_counters().write_bytes if hasattr(process, 'io_counters') else 0
+    statuses: Dict[str, int] = {}
+    for account in backend.accounts.values():
+        statuses[account['status']] = statuses.get(account['status'], 0) + 1
+
+    for record in manager.state_store.all():
+        manager.mt_manager.stop_terminal(record['external_account_id'], timeout=5)
+    manager.lease_keeper.stop()
+    # Un VPSManager par taille mesurée: ne pas cumuler les collecteurs dans le registre global
+    REGISTRY.remove_collector(manager.resource_collector)
+    manager.state_store.close()
+    manager.retry_queue.close()
+    server.stop()
+
+    return {
+        'accounts': accounts,
+        'cycles': cycles,
+        'elapsed': elapsed,
+        'accounts_per_minute': accounts / elapsed * 60 if elapsed else 0.0,
+        'bytes_written': io_after - io_before,
+        'steps': step_latencies(steps_before, PROVISIONING_STEP_SECONDS.snapshot()),
+        'statuses': statuses,
+    }
+
+
+def print_report(results: List[Dict]):
+    header = f"{'comptes':>8} {'duree (s)':>10} {'comptes/min':>12} {'ecrit (Mo)':>11}  " + \
+        ' '.join(f"{step + ' (ms)':>17}" for step in STEPS) + '  statuts'
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        steps = ' '.join(f"{result['steps'][step] * 1000:>17.1f}" for step in STEPS)
+        statuses = ', '.join(f"{status}={count}" for status, count in sorted(result['statuses'].items()))
+        print(
+            f"{result['accounts']:>8} {result['elapsed']:>10.1f} {result['accounts_per_minute']:>12.1f} "
+            f"{result['bytes_written'] / 1024 / 1024:>11.1f}  {steps}  {statuses}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark du provisionnement du VPS Manager")
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--platform', default='MT4', choices=['MT4', 'MT5'])
+    parser.add_argument('--template-files', type=int, default=300, help="Nombre de fichiers du template")
+    parser.add_argument('--template-mb', type=float, default=20, help="Taille du template en Mo")
+    parser.add_argument('--startup-delay', type=float, default=0.2, help="Temps de demarrage simule (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Proportion de connexions refusees")
+    parser.add_argument('--crash-rate', type=float, default=0.0, help="Proportion de terminaux qui plantent")
+    parser.add_argument('--linger', type=float, default=2.0, help="Duree de vie du terminal simule (s)")
+    parser.add_argument('--max-cycles', type=int, default=20, help="Cycles de polling maximum par run")
+    parser.add_argument('--work-dir', help="Dossier de travail (temporaire par defaut)")
+    parser.add_argument('--keep', action='store_true', help="Conserver les dossiers generes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    os.environ.update({
+        'SIM_STARTUP_DELAY': str(args.startup_delay),
+        'SIM_FAILURE_RATE': str(args.failure_rate),
+        'SIM_CRASH_RATE': str(args.crash_rate),
+        'SIM_LINGER': str(args.linger),
+        'READINESS_TIMEOUT': str(max(args.startup_delay * 10, 10)),
+        'READINESS_POLL_INTERVAL': '0.05',
+    })
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix='vps-bench-'))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # Le VPS Manager crée logs/ dans le dossier courant
+    os.chdir(work_dir)
+
+    template_dir = work_dir / f"template-{args.platform}"
+    template_bytes = build_template(template_dir, args.template_files, args.template_mb, args.platform)
+    ea_path = work_dir / ('RendR.ex4' if args.platform == 'MT4' else 'RendR.ex5')
+    ea_path.write_bytes(random.Random(7).randbytes(64 * 1024))
+    logger.info(f"Template factice: {template_dir} ({template_bytes / 1024 / 1024:.1f} Mo, {args.template_files} fichiers)")
+
+    # Les logs détaillés du VPS Manager fausseraient les mesures
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for count in args.accounts:
+        results.append(run_benchmark(count, work_dir, template_dir, ea_path, args.platform, args.max_cycles))
+        if not args.keep:
+            shutil.rmtree(work_dir / f"run-{count}", ignore_errors=True)
+
+    print_report(results)
+
+    if not args.keep:
+        os.chdir(VPS_MANAGER_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Terminal MT4/MT5 simulé pour le benchmark (copié en terminal.exe / terminal64.exe)
+Lit config/start.ini comme le vrai terminal, attend un temps de démarrage,
+puis écrit un marqueur de connexion réussie ou échouée dans logs/AAAAMMJJ.log
+(même format que le journal MetaTrader), ou s'arrête sans marqueur (crash)
+
+Paramètres (variables d'environnement héritées du VPS Manager):
+    SIM_STARTUP_DELAY   Temps de démarrage moyen en secondes (défaut: 0.2)
+    SIM_STARTUP_JITTER  Variation aléatoire du temps de démarrage (défaut: 0.1)
+    SIM_FAILURE_RATE    Proportion de connexions refusées (défaut: 0)
+    SIM_CRASH_RATE      Proportion d'arrêts prématurés (défaut: 0)
+    SIM_LINGER          Durée de vie après la connexion en secondes (défaut: 5)
+"""
+
+import os
+import sys
+import time
+import random
+import datetime
+
+
+def main():
+    startup_delay = float(os.getenv('SIM_STARTUP_DELAY', '0.2'))
+    startup_jitter = float(os.getenv('SIM_STARTUP_JITTER', '0.1'))
+    failure_rate = float(os.getenv('SIM_FAILURE_RATE', '0'))
+    crash_rate = float(os.getenv('SIM_CRASH_RATE', '0'))
+    linger = float(os.getenv('SIM_LINGER', '5'))
+
+    # Le VPS Manager passe "config\start.ini" (chemin Windows relatif au dossier du terminal)
+    config_path = sys.argv[1].replace('\\', os.sep) if len(sys.argv) > 1 else os.path.join('config', 'start.ini')
+    settings = {}
+    with open(config_path, encoding='utf-8') as f:
+        for line in f:
+            key, _, value = line.strip().partition('=')
+            settings[key] = value
+    login = settings.get('Login', '')
+    server = settings.get('Server', '')
+
+    time.sleep(max(startup_delay + random.uniform(-startup_jitter, startup_jitter), 0))
+
+    draw = random.random()
+    if draw < crash_rate:
+        sys.exit(3)
+
+    os.makedirs('logs', exist_ok=True)
+    log_file = os.path.join('logs', datetime.date.today().strftime('%Y%m%d') + '.log')
+    now = datetime.datetime.now().strftime('%H:%M:%S.%f')[:-3]
+    with open(log_file, 'a', encoding='cp1252') as f:
+        if draw < crash_rate + failure_rate:
+            f.write(f"0\t{now}\tNetwork\t'{login}': authorization on {server} failed (Invalid account)\n")
+        else:
+            f.write(f"0\t{now}\tNetwork\t'{login}': authorized on {server} through Access Point #1 (ping: 12.3 ms)\n")
+
+    time.sleep(linger)
+
+
+if __name__ == '__main__':
+    main()
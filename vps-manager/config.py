@@ -3,6 +3,7 @@ Configuration du VPS Manager
 """
 
 import os
+import socket
 import configparser
 from pathlib import Path
 
@@ -25,6 +26,52 @@ class Config:
         # Dossier de base pour les terminaux
         self.TERMINALS_BASE_PATH = os.getenv('TERMINALS_BASE_PATH', 'C:\\MT_Terminals')
 
+        # Couches par broker appliquées sur le template (TEMPLATES_PATH/MT4/<broker>/config/servers.dat...)
+        self.TEMPLATES_PATH = os.getenv('TEMPLATES_PATH', 'C:\\RendR\\templates')
+        # Fichiers de la base partagés par liens physiques au lieu d'être copiés, séparés par des
+        # virgules (jamais modifiés par un terminal; vide: tout copier)
+        self.TEMPLATE_LINK_PATTERNS = os.getenv('TEMPLATE_LINK_PATTERNS', '*.exe,*.dll,sounds/*,MQL4/Include/*,MQL5/Include/*')
+
+        # Base SQLite de l'état local (comptes, terminaux, PID, version de l'EA)
+        self.STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'state/vps-manager.db')
+
+        # Identité et capacité du VPS (répartition des comptes entre plusieurs VPS)
+        self.VPS_HOST_ID = os.getenv('VPS_HOST_ID', socket.gethostname())
+        self.MAX_TERMINALS = int(os.getenv('MAX_TERMINALS', '50'))
+        self.LEASE_TTL = int(os.getenv('LEASE_TTL', '300'))
+
+        # Port local de l'endpoint /metrics (0 pour désactiver)
+        self.METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+        # Détection de la connexion des terminaux (secondes)
+        self.READINESS_TIMEOUT = float(os.getenv('READINESS_TIMEOUT', '120'))
+        self.READINESS_POLL_INTERVAL = float(os.getenv('READINESS_POLL_INTERVAL', '0.25'))
+
+        # Nouvelles tentatives de provisionnement (délai exponentiel en secondes)
+        self.RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+        self.RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '30'))
+        self.RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '3600'))
+
+        # Nettoyage des dossiers terminaux (intervalle en secondes, 0 pour désactiver)
+        self.JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL', '3600'))
+        self.JANITOR_ORPHAN_ACTION = os.getenv('JANITOR_ORPHAN_ACTION', 'archive')
+        self.JANITOR_ORPHAN_GRACE_HOURS = float(os.getenv('JANITOR_ORPHAN_GRACE_HOURS', '24'))
+        self.JANITOR_ARCHIVE_RETENTION_DAYS = float(os.getenv('JANITOR_ARCHIVE_RETENTION_DAYS', '14'))
+        self.JANITOR_LOG_MAX_AGE_DAYS = float(os.getenv('JANITOR_LOG_MAX_AGE_DAYS', '2'))
+        self.JANITOR_LOG_RETENTION_DAYS = float(os.getenv('JANITOR_LOG_RETENTION_DAYS', '30'))
+        self.JANITOR_LOG_MAX_MB = float(os.getenv('JANITOR_LOG_MAX_MB', '20'))
+        self.JANITOR_IO_RATE_MB = float(os.getenv('JANITOR_IO_RATE_MB', '10'))
+
+        # Lancement des terminaux (0 démarrage simultané: la moitié des cœurs)
+        self.LAUNCH_MAX_CONCURRENT = int(os.getenv('LAUNCH_MAX_CONCURRENT', '0'))
+        self.LAUNCH_MAX_LOAD = float(os.getenv('LAUNCH_MAX_LOAD', '0.8'))
+        self.LAUNCH_MIN_INTERVAL = float(os.getenv('LAUNCH_MIN_INTERVAL', '2'))
+        self.LAUNCH_SPREAD_WINDOW = float(os.getenv('LAUNCH_SPREAD_WINDOW', '300'))
+        self.LAUNCH_RESUME_ON_START = os.getenv('LAUNCH_RESUME_ON_START', 'true').lower() in ('1', 'true', 'yes')
+        # Terminaux connectés: priorité abaissée, nombre de cœurs dédiés (0 pour désactiver)
+        self.LAUNCH_LOW_PRIORITY = os.getenv('LAUNCH_LOW_PRIORITY', 'false').lower() in ('1', 'true', 'yes')
+        self.LAUNCH_CPU_AFFINITY = int(os.getenv('LAUNCH_CPU_AFFINITY', '0'))
+
         # Charger depuis config.ini si présent
         if os.path.exists(config_file):
             self._load_from_file(config_file)
@@ -32,6 +79,8 @@ class Config:
         # Vérifications
         if not self.VPS_API_KEY:
             raise ValueError("VPS_API_KEY doit être défini (env ou config.ini)")
+        if self.JANITOR_ORPHAN_ACTION not in ('archive', 'delete'):
+            raise ValueError("JANITOR_ORPHAN_ACTION doit valoir 'archive' ou 'delete'")
 
     def _load_from_file(self, config_file: str):
         """Charge la configuration depuis un fichier INI"""
@@ -53,6 +102,45 @@ class Config:
 
         if 'paths' in config:
             self.TERMINALS_BASE_PATH = config['paths'].get('terminals_base', self.TERMINALS_BASE_PATH)
+            self.STATE_DB_PATH = config['paths'].get('state_db', self.STATE_DB_PATH)
+            self.TEMPLATES_PATH = config['paths'].get('templates', self.TEMPLATES_PATH)
+            self.TEMPLATE_LINK_PATTERNS = config['paths'].get('template_link_patterns', self.TEMPLATE_LINK_PATTERNS)
+
+        if 'vps' in config:
+            self.VPS_HOST_ID = config['vps'].get('host_id', self.VPS_HOST_ID)
+            self.MAX_TERMINALS = config['vps'].getint('max_terminals', self.MAX_TERMINALS)
+            self.LEASE_TTL = config['vps'].getint('lease_ttl', self.LEASE_TTL)
+            self.METRICS_PORT = config['vps'].getint('metrics_port', self.METRICS_PORT)
+
+        if 'readiness' in config:
+            self.READINESS_TIMEOUT = config['readiness'].getfloat('timeout', self.READINESS_TIMEOUT)
+            self.READINESS_POLL_INTERVAL = config['readiness'].getfloat('poll_interval', self.READINESS_POLL_INTERVAL)
+
+        if 'retry' in config:
+            self.RETRY_MAX_ATTEMPTS = config['retry'].getint('max_attempts', self.RETRY_MAX_ATTEMPTS)
+            self.RETRY_BASE_DELAY = config['retry'].getfloat('base_delay', self.RETRY_BASE_DELAY)
+            self.RETRY_MAX_DELAY = config['retry'].getfloat('max_delay', self.RETRY_MAX_DELAY)
+
+        if 'janitor' in config:
+            janitor = config['janitor']
+            self.JANITOR_INTERVAL = janitor.getint('interval', self.JANITOR_INTERVAL)
+            self.JANITOR_ORPHAN_ACTION = janitor.get('orphan_action', self.JANITOR_ORPHAN_ACTION)
+            self.JANITOR_ORPHAN_GRACE_HOURS = janitor.getfloat('orphan_grace_hours', self.JANITOR_ORPHAN_GRACE_HOURS)
+            self.JANITOR_ARCHIVE_RETENTION_DAYS = janitor.getfloat('archive_retention_days', self.JANITOR_ARCHIVE_RETENTION_DAYS)
+            self.JANITOR_LOG_MAX_AGE_DAYS = janitor.getfloat('log_max_age_days', self.JANITOR_LOG_MAX_AGE_DAYS)
+            self.JANITOR_LOG_RETENTION_DAYS = janitor.getfloat('log_retention_days', self.JANITOR_LOG_RETENTION_DAYS)
+            self.JANITOR_LOG_MAX_MB = janitor.getfloat('log_max_mb', self.JANITOR_LOG_MAX_MB)
+            self.JANITOR_IO_RATE_MB = janitor.getfloat('io_rate_mb', self.JANITOR_IO_RATE_MB)
+
+        if 'launch' in config:
+            launch = config['launch']
+            self.LAUNCH_MAX_CONCURRENT = launch.getint('max_concurrent', self.LAUNCH_MAX_CONCURRENT)
+            self.LAUNCH_MAX_LOAD = launch.getfloat('max_load', self.LAUNCH_MAX_LOAD)
+            self.LAUNCH_MIN_INTERVAL = launch.getfloat('min_interval', self.LAUNCH_MIN_INTERVAL)
+            self.LAUNCH_SPREAD_WINDOW = launch.getfloat('spread_window', self.LAUNCH_SPREAD_WINDOW)
+            self.LAUNCH_RESUME_ON_START = launch.getboolean('resume_on_start', self.LAUNCH_RESUME_ON_START)
+            self.LAUNCH_LOW_PRIORITY = launch.getboolean('low_priority', self.LAUNCH_LOW_PRIORITY)
+            self.LAUNCH_CPU_AFFINITY = launch.getint('cpu_affinity', self.LAUNCH_CPU_AFFINITY)
 
 
 
@@ -0,0 +1,169 @@
+"""
+Déploiement de l'EA sur tous les terminaux provisionnés
+Compare le hash de l'EA de référence (MT4_EA_PATH / MT5_EA_PATH) à celui installé
+dans chaque terminal, copie en parallèle uniquement là où il diffère, puis
+redémarre éventuellement les terminaux concernés par vagues
+"""
+
+import time
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from mt_manager import file_sha256
+from launch_scheduler import PRIORITY_DEFAULT, order_by_activity
+
+logger = logging.getLogger(__name__)
+
+
+class EARollout:
+    def __init__(self, mt_manager, state_store, api_client=None, concurrency: int = 4):
+        self.mt_manager = mt_manager
+        self.state_store = state_store
+        # Optionnel: signaler à l'API les terminaux qui ne se reconnectent pas
+        self.api_client = api_client
+        # Nombre de copies simultanées (limite la charge disque)
+        self.concurrency = max(concurrency, 1)
+        self._progress_lock = threading.Lock()
+
+    def _source_hashes(self) -> Dict[str, tuple]:
+        """Hash de l'EA de référence par plateforme (calculé une seule fois)"""
+        sources = {}
+        for platform in ('MT4', 'MT5'):
+            ea_source = self.mt_manager.ea_source_for(platform)
+            if ea_source is not None and ea_source.exists():
+                sources[platform] = (ea_source, file_sha256(ea_source))
+                logger.info(f"EA de reference {platform}: {ea_source} ({sources[platform][1][:12]})")
+            else:
+                logger.warning(f"EA de reference {platform} introuvable: {ea_source}")
+        return sources
+
+    def _sync_terminal(self, record: Dict, ea_source: Path, ea_hash: str) -> str:
+        """Retourne 'updated', 'unchanged' ou 'failed' pour un terminal"""
+        external_account_id = record['external_account_id']
+        experts_dir = self.mt_manager.experts_dir_for(Path(record['terminal_dir']), record['platform'])
+        ea_dest = experts_dir / ea_source.name
+
+        installed_hash = record.get('ea_hash')
+        if installed_hash is None and ea_dest.exists():
+            # Terminal adopté sans hash connu: le calculer une fois et l'enregistrer
+            installed_hash = file_sha256(ea_dest)
+            self.state_store.update(external_account_id, ea_hash=installed_hash)
+
+        if installed_hash == ea_hash and ea_dest.exists():
+            return 'unchanged'
+
+        try:
+            self.mt_manager.install_ea(external_account_id, ea_source, ea_dest, ea_hash)
+            return 'updated'
+        except OSError as e:
+            logger.error(f"Echec de la copie de l'EA pour {external_account_id}: {e}")
+            return 'failed'
+
+    def run(self, restart: bool = False, wave_size: int = 10, wave_delay: float = 0) -> Dict[str, int]:
+        """
+        Déploie l'EA de référence sur tous les terminaux connus de l'état local
+        Args:
+            restart: Redémarrer les terminaux en cours dont l'EA a changé
+            wave_size: Nombre de terminaux redémarrés par vague
+            wave_delay: Pause en secondes entre deux vagues
+        Returns: compteurs (total, updated, unchanged, failed, restarted, restart_failed)
+        """
+        sources = self._source_hashes()
+        records = [
+            record for record in self.state_store.all()
+            if record['status'] != 'missing' and record['platform'] in sources
+        ]
+        summary = {'total': len(records), 'updated': 0, 'unchanged': 0, 'failed': 0,
+                   'restarted': 0, 'restart_failed': 0}
+        updated_ids: List[str] = []
+        done = 0
+        start = time.monotonic()
+
+        logger.info(f"Deploiement de l'EA sur {len(records)} terminal(aux) (copies simultanees: {self.concurrency})")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ea-rollout") as executor:
+            futures = {
+                executor.submit(self._sync_terminal, record, *sources[record['platform']]): record
+                for record in records
+            }
+            for future in as_completed(futures):
+                record = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Erreur inattendue pour {record['external_account_id']}: {e}")
+                    result = 'failed'
+
+                with self._progress_lock:
+                    summary[result] += 1
+                    done += 1
+                    if result == 'updated':
+                        updated_ids.append(record['external_account_id'])
+                    if result != 'unchanged' or done == len(records) or done % 50 == 0:
+                        logger.info(f"[{done}/{len(records)}] {record['external_account_id']}: {result}")
+
+        logger.info(
+            f"EA deploye en {time.monotonic() - start:.1f}s: {summary['updated']} mis a jour, "
+            f"{summary['unchanged']} inchange(s), {summary['failed']} echec(s)"
+        )
+
+        if restart and updated_ids:
+            self._restart_in_waves(updated_ids, wave_size, wave_delay, summary)
+
+        return summary
+
+    def restart_and_wait(self, external_account_id: str, priority: int = PRIORITY_DEFAULT) -> bool:
+        """
+        Redémarre un terminal et attend sa reconnexion (créneau de lancement compris)
+        L'échec n'est signalé à l'API que pour les comptes provisionnés par ce VPS:
+        un terminal seulement adopté (login absent de l'état local) peut être rattaché ailleurs
+        """
+        record = self.state_store.get(external_account_id) or {}
+        adopted = not record.get('login')
+        if not self.mt_manager.restart_terminal(external_account_id, priority):
+            return False
+        readiness = self.mt_manager.wait_until_ready(external_account_id)
+        self.state_store.update(external_account_id, status=readiness.status, error_message=readiness.message)
+        if not readiness.connected:
+            logger.error(f"Reconnexion echouee pour {external_account_id}: {readiness.message}")
+            if self.api_client is not None and not adopted:
+                self.api_client.update_account_status(external_account_id, 'error', readiness.message)
+        return readiness.connected
+
+    def _restart_in_waves(self, external_account_ids: List[str], wave_size: int, wave_delay: float, summary: Dict[str, int]):
+        """
+        Redémarre les terminaux en cours par vagues; chaque vague attend la reconnexion
+        Comptes avec des positions ouvertes d'abord; dans une vague, les lancements
+        suivent les créneaux du LaunchScheduler
+        """
+        wanted = set(external_account_ids)
+        records = [
+            record for record in self.state_store.all()
+            if record['external_account_id'] in wanted and self.mt_manager.is_running(record['external_account_id'])
+        ]
+        running = [(record['external_account_id'], priority) for record, priority in order_by_activity(records)]
+        wave_size = max(wave_size, 1)
+        waves = [running[i:i + wave_size] for i in range(0, len(running), wave_size)]
+
+        for index, wave in enumerate(waves, start=1):
+            logger.info(f"Redemarrage vague {index}/{len(waves)} ({len(wave)} terminal(aux))")
+            with ThreadPoolExecutor(max_workers=len(wave), thread_name_prefix="ea-restart") as executor:
+                futures = {
+                    executor.submit(self.restart_and_wait, external_account_id, priority): external_account_id
+                    for external_account_id, priority in wave
+                }
+                for future in as_completed(futures):
+                    try:
+                        connected = future.result()
+                    except Exception as e:
+                        logger.error(f"Erreur inattendue au redemarrage de {futures[future]}: {e}")
+                        connected = False
+                    summary['restarted' if connected else 'restart_failed'] += 1
+
+            if wave_delay and index < len(waves):
+                time.sleep(wave_delay)
+
+        logger.info(f"Redemarrage termine: {summary['restarted']} reconnecte(s), {summary['restart_failed']} echec(s)")
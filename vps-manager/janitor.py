@@ -0,0 +1,349 @@
+"""
+Nettoyage périodique des dossiers terminaux (thread de fond)
+- Dossiers dont le compte n'existe plus ou a été repris par un autre VPS (bail expiré),
+  confirmés pendant JANITOR_ORPHAN_GRACE_HOURS: archivés (déplacés dans _archive) ou supprimés
+- Journaux du terminal et de l'EA: compressés au-delà d'un âge ou d'une taille,
+  supprimés après la durée de rétention; caches du testeur vidés
+Les entrées/sorties sont limitées en débit et suspendues pendant le provisionnement
+"""
+
+import os
+import gzip
+import time
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+JANITOR_RECLAIMED_BYTES = REGISTRY.register(Counter(
+    'vps_janitor_reclaimed_bytes_total', "Octets liberes par le nettoyage des terminaux", ['job']))
+
+ARCHIVE_DIR_NAME = '_archive'
+EA_LOG_NAME = 'RendR_debug.log'
+# Coût forfaitaire d'une suppression de fichier pour le limiteur (métadonnées)
+FILE_DELETE_COST = 64 * 1024
+CHUNK_SIZE = 256 * 1024
+
+
+class JanitorStopped(Exception):
+    """Arrêt du VPS Manager pendant un nettoyage"""
+
+
+class IORateLimiter:
+    """Limite le débit d'entrées/sorties (octets par seconde) par mise en attente"""
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._allowance = bytes_per_second
+        self._last = time.monotonic()
+
+    def consume(self, amount: int):
+        if self.bytes_per_second <= 0:
+            return
+        now = time.monotonic()
+        self._allowance = min(self._allowance + (now - self._last) * self.bytes_per_second, self.bytes_per_second)
+        self._last = now
+        self._allowance -= amount
+        if self._allowance < 0:
+            time.sleep(-self._allowance / self.bytes_per_second)
+
+
+class Janitor:
+    def __init__(self, config, state_store, mt_manager, api_client):
+        self.config = config
+        self.state_store = state_store
+        self.mt_manager = mt_manager
+        self.api_client = api_client
+        self.terminals_base = Path(config.TERMINALS_BASE_PATH)
+        self.archive_dir = self.terminals_base / ARCHIVE_DIR_NAME
+        self.limiter = IORateLimiter(config.JANITOR_IO_RATE_MB * 1024 * 1024)
+        # Première détection de chaque orphelin (délai de grâce avant d'agir)
+        self._orphan_since: Dict[str, float] = {}
+        self._stop = threading.Event()
+        # Effacé pendant le provisionnement: le nettoyage attend qu'il se termine
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = None
+
+    # --- Cycle de vie ---
+
+    def start(self):
+        if self._thread is not None or self.config.JANITOR_INTERVAL <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._idle.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def pause(self):
+        """Suspend le nettoyage (provisionnement en cours)"""
+        self._idle.clear()
+
+    def resume(self):
+        self._idle.set()
+
+    def _run(self):
+        while not self._stop.wait(self.config.JANITOR_INTERVAL):
+            try:
+                self.run_once()
+            except JanitorStopped:
+                return
+            except Exception as e:
+                logger.error(f"Erreur lors du nettoyage des terminaux: {str(e)}")
+
+    def _throttle(self, amount: int):
+        """Attend la fin du provisionnement puis applique la limite de débit"""
+        self._idle.wait()
+        if self._stop.is_set():
+            raise JanitorStopped()
+        self.limiter.consume(amount)
+
+    # --- Passes de nettoyage ---
+
+    def run_once(self) -> Dict[str, int]:
+        """Exécute toutes les tâches; retourne les octets libérés par tâche"""
+        start = time.monotonic()
+        reclaimed = {
+            'orphans': self.clean_orphans(),
+            'logs': self.compact_logs(),
+            'archives': self.purge_archives(),
+        }
+        for job, amount in reclaimed.items():
+            if amount:
+                JANITOR_RECLAIMED_BYTES.inc(amount, job=job)
+        logger.info(
+            f"Nettoyage termine en {time.monotonic() - start:.1f}s: "
+            + ', '.join(f"{job}={amount / 1024 / 1024:.1f} Mo" for job, amount in reclaimed.items())
+        )
+        return reclaimed
+
+    @staticmethod
+    def _lease_active(expires_at: Optional[str], now: float) -> bool:
+        if not expires_at:
+            return False
+        try:
+            return datetime.fromisoformat(expires_at.replace('Z', '+00:00')).timestamp() > now
+        except ValueError:
+            # Date illisible: considérer le bail actif (aucune action)
+            return True
+
+    def _is_orphan(self, record: Dict, state: Optional[Dict], now: float) -> bool:
+        """
+        Compte supprimé, ou attribué à un autre VPS dont le bail a expiré
+        Un statut déconnecté n'en fait pas un orphelin (déconnexion souvent temporaire)
+        """
+        if state is None:
+            return True
+        owner = state.get('vps_host_id')
+        if not owner or self._lease_active(state.get('vps_lease_expires_at'), now):
+            return False
+        # Identifiant courant et identifiant à la réclamation: un VPS renommé garde ses terminaux
+        return owner not in (self.config.VPS_HOST_ID, record.get('host_id'))
+
+    def _orphan_records(self) -> List[Dict]:
+        """
+        Comptes locaux à nettoyer selon l'API (aucune action si l'API ne répond pas)
+        Un compte n'est retenu qu'après être resté orphelin pendant JANITOR_ORPHAN_GRACE_HOURS
+        """
+        records = [
+            record for record in self.state_store.all()
+            if record['status'] not in ('missing', 'provisioning')
+        ]
+        now = time.time()
+        grace = self.config.JANITOR_ORPHAN_GRACE_HOURS * 3600
+        candidates = {}
+        for index in range(0, len(records), 200):
+            batch = records[index:index + 200]
+            states = self.api_client.get_accounts_state([r['external_account_id'] for r in batch])
+            if states is None:
+                logger.warning("API injoignable, recherche des dossiers orphelins annulee")
+                return []
+            for record in batch:
+                if self._is_orphan(record, states.get(record['external_account_id']), now):
+                    candidates[record['external_account_id']] = record
+
+        orphans = []
+        # Les comptes redevenus normaux repartent de zéro
+        self._orphan_since = {
+            account_id: self._orphan_since.get(account_id, now) for account_id in candidates
+        }
+        for account_id, record in candidates.items():
+            if now - self._orphan_since[account_id] >= grace:
+                orphans.append(record)
+            elif self._orphan_since[account_id] == now:
+                logger.info(
+                    f"Terminal {account_id} orphelin selon l'API, nettoyage dans "
+                    f"{self.config.JANITOR_ORPHAN_GRACE_HOURS:g}h s'il l'est toujours"
+                )
+        return orphans
+
+    def clean_orphans(self) -> int:
+        reclaimed = 0
+        for record in self._orphan_records():
+            external_account_id = record['external_account_id']
+            terminal_dir = Path(record['terminal_dir'])
+            self._throttle(FILE_DELETE_COST)
+            if not self.mt_manager.stop_terminal(external_account_id):
+                continue
+            if not terminal_dir.exists():
+                self.state_store.delete(external_account_id)
+                continue
+
+            try:
+                if self.config.JANITOR_ORPHAN_ACTION == 'delete':
+                    reclaimed += self._remove_tree(terminal_dir)
+                    logger.info(f"Dossier orphelin supprime: {terminal_dir}")
+                else:
+                    self.archive_dir.mkdir(parents=True, exist_ok=True)
+                    target = self.archive_dir / f"{terminal_dir.name}-{time.strftime('%Y%m%d%H%M%S')}"
+                    # Simple renommage sur le même volume: aucun octet copié
+                    os.replace(terminal_dir, target)
+                    # Point de départ de la rétention des archives
+                    os.utime(target)
+                    logger.info(f"Dossier orphelin archive: {terminal_dir} -> {target}")
+            except OSError as e:
+                logger.error(f"Impossible de nettoyer {terminal_dir}: {e}")
+                continue
+            self.state_store.delete(external_account_id)
+        return reclaimed
+
+    def _terminal_dirs(self) -> Iterable[Path]:
+        for record in self.state_store.all():
+            terminal_dir = Path(record['terminal_dir'])
+            if record['status'] != 'missing' and terminal_dir.is_dir():
+                yield terminal_dir
+
+    def compact_logs(self) -> int:
+        reclaimed = 0
+        now = time.time()
+        max_age = self.config.JANITOR_LOG_MAX_AGE_DAYS * 86400
+        retention = self.config.JANITOR_LOG_RETENTION_DAYS * 86400
+        max_bytes = self.config.JANITOR_LOG_MAX_MB * 1024 * 1024
+
+        for terminal_dir in self._terminal_dirs():
+            log_dirs = [terminal_dir / 'logs', terminal_dir / 'MQL4' / 'Logs', terminal_dir / 'MQL5' / 'Logs',
+                        terminal_dir / 'tester' / 'logs']
+            for log_dir in log_dirs:
+                if not log_dir.is_dir():
+                    continue
+                for entry in os.scandir(log_dir):
+                    if not entry.is_file():
+                        continue
+                    age = now - entry.stat().st_mtime
+                    if entry.name.endswith('.gz'):
+                        if age > retention:
+                            reclaimed += self._remove_file(Path(entry.path))
+                    elif entry.name.endswith('.gz.tmp') and age > max_age:
+                        # Compression interrompue (arrêt brutal du VPS Manager)
+                        reclaimed += self._remove_file(Path(entry.path))
+                    elif entry.name.endswith('.log') and age > max_age:
+                        # Journaux quotidiens: le fichier du jour n'est plus modifié après minuit
+                        reclaimed += self._compress(Path(entry.path))
+
+            for mql_dir in ('MQL4', 'MQL5'):
+                ea_log = terminal_dir / mql_dir / 'Files' / EA_LOG_NAME
+                if ea_log.is_file() and ea_log.stat().st_size > max_bytes:
+                    reclaimed += self._rotate(ea_log)
+
+            cache_dir = terminal_dir / 'tester' / 'caches'
+            if cache_dir.is_dir():
+                for entry in os.scandir(cache_dir):
+                    if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                        reclaimed += self._remove_file(Path(entry.path))
+        return reclaimed
+
+    def purge_archives(self) -> int:
+        """Supprime les dossiers archivés au-delà de la durée de rétention"""
+        if not self.archive_dir.is_dir():
+            return 0
+        reclaimed = 0
+        cutoff = time.time() - self.config.JANITOR_ARCHIVE_RETENTION_DAYS * 86400
+        for entry in os.scandir(self.archive_dir):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                reclaimed += self._remove_tree(Path(entry.path))
+                logger.info(f"Archive expiree supprimee: {entry.path}")
+        return reclaimed
+
+    # --- Opérations sur les fichiers (limitées en débit) ---
+
+    def _remove_file(self, path: Path) -> int:
+        try:
+            size = path.stat().st_size
+            self._throttle(FILE_DELETE_COST)
+            path.unlink()
+            return size
+        except OSError as e:
+            logger.warning(f"Suppression impossible de {path}: {e}")
+            return 0
+
+    def _remove_tree(self, root: Path) -> int:
+        reclaimed = 0
+        for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+            for name in filenames:
+                reclaimed += self._remove_file(Path(dirpath) / name)
+            for name in dirnames:
+                try:
+                    os.rmdir(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        try:
+            os.rmdir(root)
+        except OSError as e:
+            logger.warning(f"Suppression impossible de {root}: {e}")
+        return reclaimed
+
+    def _compress(self, path: Path) -> int:
+        """Compresse un fichier en .gz puis supprime l'original; retourne les octets libérés"""
+        target = path.with_name(path.name + '.gz')
+        tmp_target = path.with_name(path.name + '.gz.tmp')
+        try:
+            original_size = path.stat().st_size
+            with open(path, 'rb') as src, gzip.open(tmp_target, 'wb', compresslevel=6) as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self._throttle(len(chunk))
+                    dst.write(chunk)
+            os.replace(tmp_target, target)
+            path.unlink()
+            return max(original_size - target.stat().st_size, 0)
+        except JanitorStopped:
+            # Arrêt pendant la compression: l'original reste intact
+            try:
+                tmp_target.unlink()
+            except OSError:
+                pass
+            raise
+        except OSError as e:
+            # Fichier verrouillé par le terminal: nouvelle tentative au prochain passage
+            logger.warning(f"Compression impossible de {path}: {e}")
+            try:
+                tmp_target.unlink()
+            except OSError:
+                pass
+            return 0
+
+    def _rotate(self, path: Path) -> int:
+        """Renomme un log de l'EA trop volumineux puis le compresse (l'EA recrée le fichier)"""
+        rotated = path.with_name(f"{path.stem}-{time.strftime('%Y%m%d%H%M%S')}{path.suffix}")
+        try:
+            os.replace(path, rotated)
+        except OSError as e:
+            logger.warning(f"Rotation impossible de {path}: {e}")
+            return 0
+        logs_dir = path.parent.parent / 'Logs'
+        logs_dir.mkdir(exist_ok=True)
+        archived = logs_dir / rotated.name
+        os.replace(rotated, archived)
+        return self._compress(archived)
@@ -0,0 +1,249 @@
+"""
+Ordonnancement des lancements de terminaux MT4/MT5
+Au démarrage, un terminal charge son historique et se connecte: des dizaines de
+lancements simultanés (redémarrage du VPS, redéploiement) saturent le disque et
+le processeur et les connexions expirent.
+- Démarrages simultanés limités (cœurs du VPS, charge moyenne mesurée)
+- Intervalle minimal entre deux lancements, lancements d'un lot étalés sur une fenêtre
+- Comptes avec des positions ouvertes lancés en premier
+- Une fois connecté: priorité abaissée et affinité CPU facultatives
+"""
+
+import os
+import re
+import time
+import zlib
+import heapq
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import psutil
+
+from metrics import REGISTRY, Gauge, Histogram
+from readiness import decode_log
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'vps_launch_wait_seconds', "Attente d'un creneau de lancement par terminal"))
+LAUNCHES_IN_PROGRESS = REGISTRY.register(Gauge(
+    'vps_launches_in_progress', "Terminaux lances en attente de connexion"))
+
+# Priorités d'attente (la plus petite passe en premier)
+PRIORITY_TRADING = 0
+PRIORITY_DEFAULT = 1
+
+EA_LOG_NAME = 'RendR_debug.log'
+EA_LOG_TAIL_BYTES = 64 * 1024
+# Envoi d'une position par l'EA (pas l'enregistrement /api/trades/register)
+TRADE_SEND_RE = re.compile(r'api/trades(?:/batch)?(?![/\w])')
+
+
+def last_trade_activity(terminal_dir: Path, platform: str) -> Optional[float]:
+    """
+    Date de la dernière activité de trading connue d'un terminal, ou None
+    L'EA envoie ses positions ouvertes à chaque cycle: la fin de son log contient
+    des envois de trades tant que le compte a des positions
+    Le log est écrit par FileOpen(FILE_TXT) sans FILE_ANSI, donc en UTF-16LE: la fin
+    est lue depuis une position paire puis décodée comme les journaux du terminal
+    """
+    ea_log = Path(terminal_dir) / ('MQL4' if platform == 'MT4' else 'MQL5') / 'Files' / EA_LOG_NAME
+    try:
+        with open(ea_log, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(size - EA_LOG_TAIL_BYTES, 0)
+            f.seek(start - start % 2)
+            tail = decode_log(f.read())
+            modified = os.fstat(f.fileno()).st_mtime
+    except OSError:
+        return None
+    return modified if TRADE_SEND_RE.search(tail) else None
+
+
+def order_by_activity(records: List[Dict]) -> List[Tuple[Dict, int]]:
+    """
+    Trie des entrées de l'état local pour un relancement: comptes en cours de trading
+    d'abord (activité la plus récente en tête), puis les autres par dernière présence
+    Returns: [(entrée, priorité d'attente)]
+    """
+    ranked = []
+    for record in records:
+        activity = last_trade_activity(Path(record['terminal_dir']), record['platform'])
+        if activity is not None:
+            ranked.append(((PRIORITY_TRADING, -activity), record))
+        else:
+            ranked.append(((PRIORITY_DEFAULT, -(record.get('last_seen_at') or 0)), record))
+    ranked.sort(key=lambda item: item[0])
+    return [(record, key[0]) for key, record in ranked]
+
+
+class SpreadBatch:
+    """Lot de lancements étalés: l'intervalle ne s'applique qu'aux terminaux du lot"""
+
+    def __init__(self, keys: Iterable[str], interval: float):
+        self.keys = set(keys)
+        self.interval = interval
+        self.last_launch = 0.0
+
+
+class LaunchScheduler:
+    """
+    Créneaux de lancement partagés par le provisionnement, les redéploiements et
+    la reprise après redémarrage (threads différents)
+    Un créneau est pris juste avant le lancement et libéré à la connexion du terminal
+    (ou à son échec, ou après slot_timeout secondes)
+    """
+
+    def __init__(self, config):
+        self.cpu_count = psutil.cpu_count() or 1
+        # 0: automatique, la moitié des cœurs
+        self.max_concurrent = config.LAUNCH_MAX_CONCURRENT or max(self.cpu_count // 2, 1)
+        # Charge moyenne par cœur au-delà de laquelle un seul démarrage à la fois est permis
+        self.max_load = config.LAUNCH_MAX_LOAD
+        self.min_interval = config.LAUNCH_MIN_INTERVAL
+        self.spread_window = config.LAUNCH_SPREAD_WINDOW
+        self.slot_timeout = config.READINESS_TIMEOUT
+        self.low_priority = config.LAUNCH_LOW_PRIORITY
+        self.affinity_cores = config.LAUNCH_CPU_AFFINITY
+        self._cond = threading.Condition()
+        # Terminaux en cours de démarrage: {clé: échéance du créneau}
+        self._starting: Dict[str, float] = {}
+        # Lancements en attente: (priorité, ordre d'arrivée, clé)
+        self._waiting: List[Tuple[int, int, str]] = []
+        self._sequence = 0
+        self._last_launch = 0.0
+        # Lots en cours (spread), éventuellement simultanés
+        self._batches: List[SpreadBatch] = []
+        logger.info(
+            f"Lancements: {self.max_concurrent} demarrage(s) simultane(s) au plus, "
+            f"charge max {self.max_load}/coeur ({self.cpu_count} coeurs), intervalle min {self.min_interval}s"
+        )
+
+    def load_per_core(self) -> float:
+        """Charge moyenne sur 1 minute rapportée au nombre de cœurs"""
+        try:
+            return psutil.getloadavg()[0] / self.cpu_count
+        except (AttributeError, OSError):
+            return 0.0
+
+    def _expire(self, now: float):
+        for key, deadline in list(self._starting.items()):
+            if deadline <= now:
+                logger.warning(f"Creneau de lancement de {key} libere sans confirmation de connexion")
+                del self._starting[key]
+
+    def _delay(self, key: str, now: float) -> Optional[float]:
+        """
+        0 si le lancement peut avoir lieu, sinon délai d'attente (None: attendre une libération)
+        Lance le premier terminal prêt dans l'ordre de priorité: un terminal retenu par
+        l'étalement de son lot ne bloque pas ceux qui n'en font pas partie
+        """
+        if self._starting:
+            if len(self._starting) >= self.max_concurrent:
+                return None
+            if self.load_per_core() > self.max_load:
+                # Machine chargée: un seul démarrage à la fois, réévalué régulièrement
+                return 1.0
+        # L'intervalle minimal ne s'applique que si un terminal démarre encore
+        earliest = self._last_launch + (self.min_interval if self._starting else 0.0)
+        for _, _, waiting_key in sorted(self._waiting):
+            delay = self._batch_earliest(waiting_key, earliest) - now
+            if waiting_key == key:
+                return max(delay, 0.0)
+            if delay <= 0:
+                # Un lancement plus prioritaire est possible: il passe d'abord
+                return None
+        return None
+
+    def _batch_earliest(self, key: str, earliest: float) -> float:
+        for batch in self._batches:
+            if key in batch.keys:
+                earliest = max(earliest, batch.last_launch + batch.interval)
+        return earliest
+
+    def acquire(self, key: str, priority: int = PRIORITY_DEFAULT) -> float:
+        """Attend un créneau de lancement pour key; retourne l'attente en secondes"""
+        start = time.monotonic()
+        with self._cond:
+            self._sequence += 1
+            entry = (priority, self._sequence, key)
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._expire(now)
+                    delay = self._delay(key, now)
+                    if delay == 0:
+                        break
+                    # Les créneaux expirés sont libérés même sans notification
+                    self._cond.wait(delay if delay is not None else 1.0)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            now = time.monotonic()
+            self._starting[key] = now + self.slot_timeout
+            self._last_launch = now
+            for batch in self._batches:
+                if key in batch.keys:
+                    batch.last_launch = now
+            LAUNCHES_IN_PROGRESS.set(len(self._starting))
+        waited = time.monotonic() - start
+        LAUNCH_WAIT_SECONDS.observe(waited)
+        if waited >= 1:
+            logger.info(f"Lancement de {key} apres {waited:.1f}s d'attente ({len(self._starting)} demarrage(s) en cours)")
+        return waited
+
+    def release(self, key: str):
+        """Fin du démarrage de key (connecté, échec ou lancement impossible)"""
+        with self._cond:
+            if self._starting.pop(key, None) is not None:
+                LAUNCHES_IN_PROGRESS.set(len(self._starting))
+                self._cond.notify_all()
+
+    @contextmanager
+    def spread(self, keys: Iterable[str]):
+        """
+        Étale les lancements d'un lot de terminaux (clés) sur la fenêtre configurée
+        Les lancements hors du lot (provisionnement) ne sont pas ralentis
+        """
+        batch = SpreadBatch(keys, 0.0)
+        count = len(batch.keys)
+        batch.interval = self.spread_window / count if count > 0 and self.spread_window > 0 else 0.0
+        with self._cond:
+            self._batches.append(batch)
+        if batch.interval:
+            logger.info(f"{count} lancement(s) etale(s) sur {self.spread_window:.0f}s (un toutes les {batch.interval:.1f}s au plus)")
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._batches.remove(batch)
+                self._cond.notify_all()
+
+    def tune(self, external_account_id: str, pid: Optional[int]):
+        """Terminal connecté: priorité abaissée et cœurs dédiés (si configurés)"""
+        if not pid or not (self.low_priority or self.affinity_cores):
+            return
+        try:
+            proc = psutil.Process(pid)
+            if self.low_priority:
+                # Windows: classe de priorité, POSIX: valeur nice
+                proc.nice(getattr(psutil, 'BELOW_NORMAL_PRIORITY_CLASS', 10))
+            if self.affinity_cores and hasattr(proc, 'cpu_affinity'):
+                proc.cpu_affinity(self.cores_for(external_account_id))
+        except (psutil.NoSuchProcess, psutil.AccessDenied, OSError, ValueError) as e:
+            logger.warning(f"Impossible d'ajuster la priorite du terminal {external_account_id} (PID {pid}): {e}")
+
+    def cores_for(self, external_account_id: str) -> List[int]:
+        """
+        Cœurs attribués à un terminal: toujours les mêmes pour un compte, le cœur 0
+        est laissé au système et au VPS Manager (s'il y en a d'autres)
+        """
+        cores = list(range(1, self.cpu_count)) or [0]
+        count = min(self.affinity_cores, len(cores))
+        first = zlib.crc32(external_account_id.encode('utf-8')) % len(cores)
+        return sorted(cores[(first + i) % len(cores)] for i in range(count))
@@ -0,0 +1,74 @@
+"""
+Renouvellement des baux (leases) sur les comptes réclamés par ce VPS
+Un thread de fond prolonge le bail des comptes en cours de configuration
+pour qu'un autre VPS ne les reprenne pas tant que ce VPS est actif
+"""
+
+import threading
+import logging
+from typing import Set
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseKeeper:
+    def __init__(self, api_client, host_id: str, lease_ttl: int):
+        self.api_client = api_client
+        self.host_id = host_id
+        self.lease_ttl = lease_ttl
+        # Renouveler au tiers du bail: deux échecs consécutifs restent tolérés
+        self.renew_interval = max(lease_ttl / 3.0, 1.0)
+        self._accounts: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def track(self, external_account_id: str):
+        """Commence à renouveler le bail d'un compte réclamé"""
+        with self._lock:
+            self._accounts.add(external_account_id)
+
+    def release(self, external_account_id: str):
+        """Arrête de renouveler le bail (compte configuré ou en erreur)"""
+        with self._lock:
+            self._accounts.discard(external_account_id)
+
+    def is_held(self, external_account_id: str) -> bool:
+        with self._lock:
+            return external_account_id in self._accounts
+
+    def renew_now(self):
+        with self._lock:
+            accounts = sorted(self._accounts)
+        if not accounts:
+            return
+
+        renewed = self.api_client.renew_leases(self.host_id, accounts, self.lease_ttl)
+        if renewed is None:
+            # API injoignable: on retentera au prochain intervalle
+            return
+
+        lost = set(accounts) - set(renewed)
+        if lost:
+            logger.warning(f"Bail perdu pour {len(lost)} compte(s): {', '.join(sorted(lost))}")
+            with self._lock:
+                self._accounts -= lost
+
+    def _run(self):
+        while not self._stop.wait(self.renew_interval):
+            try:
+                self.renew_now()
+            except Exception as e:
+                logger.error(f"Erreur lors du renouvellement des baux: {str(e)}")
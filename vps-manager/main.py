@@ -7,10 +7,29 @@ import time
 import logging
 import sys
 import os
-from typing import List, Dict
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
 from config import Config
 from supabase_client import SupabaseClient
 from mt_manager import MTManager
+from lease_keeper import LeaseKeeper
+from state_store import StateStore
+from ea_rollout import EARollout
+from janitor import Janitor
+from launch_scheduler import PRIORITY_TRADING, order_by_activity
+from retry_queue import RetryQueue, is_retryable_exception
+from metrics import (
+    REGISTRY,
+    MetricsServer,
+    TerminalResourceCollector,
+    POLL_CYCLE_SECONDS,
+    PENDING_ACCOUNTS,
+    RETRY_QUEUE_DEPTH,
+    PROVISIONING_TOTAL
+)
 
 # Créer le dossier logs s'il n'existe pas (AVANT la configuration du logging)
 os.makedirs('logs', exist_ok=True)
@@ -32,78 +51,143 @@ class VPSManager:
     def __init__(self):
         self.config = Config()
         self.api_client = SupabaseClient(self.config)
-        self.mt_manager = MTManager(self.config)
-        logger.info("VPS Manager initialisé")
+        self.state_store = StateStore(self.config.STATE_DB_PATH)
+        self.retry_queue = RetryQueue(
+            self.config.STATE_DB_PATH,
+            max_attempts=self.config.RETRY_MAX_ATTEMPTS,
+            base_delay=self.config.RETRY_BASE_DELAY,
+            max_delay=self.config.RETRY_MAX_DELAY
+        )
+        self.mt_manager = MTManager(self.config, self.state_store)
+        self.lease_keeper = LeaseKeeper(self.api_client, self.config.VPS_HOST_ID, self.config.LEASE_TTL)
+        self.janitor = Janitor(self.config, self.state_store, self.mt_manager, self.api_client)
+        logger.info(f"VPS Manager initialisé (host: {self.config.VPS_HOST_ID})")
 
-    def process_pending_accounts(self):
-        """Récupère et traite les comptes en attente de configuration"""
-        try:
-            logger.info("=" * 60)
-            logger.info("Vérification des comptes en attente...")
-            pending_accounts = self.api_client.get_pending_accounts()
+        # Reprendre l'état après un redémarrage (dossiers terminaux, processus en cours)
+        self.state_store.reconcile(self.mt_manager.terminals_base)
+        self._resume_retry_queue()
 
-            if not pending_accounts:
-                logger.debug("Aucun compte en attente")
-                return
+        self.resource_collector = TerminalResourceCollector(self.mt_manager.running_pids)
+        REGISTRY.add_collector(self.resource_collector)
+        self.metrics_server = None
+        self._resume_thread = None
 
-            logger.info(f"{len(pending_accounts)} compte(s) en attente de configuration")
-            logger.info("=" * 60)
+    def _resume_retry_queue(self):
+        """Reprend les baux des comptes encore en file (tentatives en attente avant l'arrêt)"""
+        queued = self.retry_queue.queued()
+        if not queued:
+            return
+        for job in queued:
+            self.lease_keeper.track(job['external_account_id'])
+        # Les comptes repris entre-temps par un autre VPS perdent leur bail ici
+        self.lease_keeper.renew_now()
+        self.lease_keeper.start()
+        logger.info(f"{len(queued)} compte(s) en attente de nouvelle tentative repris depuis l'etat local")
 
-            for account in pending_accounts:
-                external_account_id = account.get('external_account_id')
-                broker = account.get('broker', 'Unknown')
-                login = account.get('login', 'Unknown')
-                logger.info(f"Traitement du compte: {external_account_id} (Broker: {broker}, Login: {login})")
+    def resume_terminals(self) -> Dict[str, int]:
+        """
+        Relance les terminaux connectés avant l'arrêt du VPS (redémarrage de la machine)
+        Comptes avec des positions ouvertes d'abord, lancements étalés sur LAUNCH_SPREAD_WINDOW
+        Returns: compteurs (total, restarted, restart_failed)
+        """
+        records = [
+            record for record in self.state_store.all()
+            if record['status'] == 'connected'
+            and Path(record['terminal_dir']).is_dir()
+            and not self.mt_manager.is_running(record['external_account_id'])
+        ]
+        summary = {'total': len(records), 'restarted': 0, 'restart_failed': 0}
+        if not records:
+            return summary
 
+        ordered = order_by_activity(records)
+        trading = sum(1 for _, priority in ordered if priority == PRIORITY_TRADING)
+        logger.info(f"Reprise de {len(records)} terminal(aux) arrete(s), dont {trading} avec des positions ouvertes")
+        rollout = EARollout(self.mt_manager, self.state_store, self.api_client)
+        scheduler = self.mt_manager.launch_scheduler
+        start = time.monotonic()
+        # Les créneaux du scheduler limitent les démarrages; la file de l'exécuteur garde l'ordre de priorité
+        with scheduler.spread(record['external_account_id'] for record in records), \
+                ThreadPoolExecutor(max_workers=scheduler.max_concurrent, thread_name_prefix="resume") as executor:
+            futures = [
+                executor.submit(rollout.restart_and_wait, record['external_account_id'], priority)
+                for record, priority in ordered
+            ]
+            for future in futures:
                 try:
-                    # Configurer le terminal MT4/MT5
-                    success = self.mt_manager.setup_account(account)
-
-                    if success:
-                        # Attendre un peu pour que le terminal se connecte
-                        import time
-                        logger.info(f"Attente de la connexion du terminal pour {external_account_id}...")
-                        time.sleep(5)  # Donner le temps au terminal de se connecter
-                        
-                        # Mettre à jour le statut à 'connected'
-                        # Note: Le statut sera mis à jour à 'error' par l'EA si la connexion échoue
-                        self.api_client.update_account_status(
-                            external_account_id,
-                            'connected',
-                            None
-                        )
-                        logger.info(f"Compte {external_account_id} configuré et terminal lancé avec succès")
-                        logger.info(f"   L'EA va maintenant tenter de se connecter et enregistrer le compte")
-                    else:
-                        # Mettre à jour le statut à 'error'
-                        error_msg = "Échec de la configuration du terminal MT4/MT5"
-                        self.api_client.update_account_status(
-                            external_account_id,
-                            'error',
-                            error_msg
-                        )
-                        logger.error(f"❌ Échec de la configuration pour {external_account_id}: {error_msg}")
-
+                    connected = future.result()
                 except Exception as e:
-                    import traceback
-                    error_msg = f"Erreur lors du traitement: {str(e)}"
-                    logger.error("=" * 60)
-                    logger.error(f"Erreur lors du traitement de {external_account_id}")
-                    logger.error(f"   Message: {error_msg}")
-                    logger.error(f"   Type: {type(e).__name__}")
-                    logger.error(f"   Traceback:\n{traceback.format_exc()}")
-                    logger.error("=" * 60)
-                    
-                    # Limiter la longueur du message d'erreur pour Supabase
-                    max_error_length = 500
-                    if len(error_msg) > max_error_length:
-                        error_msg = error_msg[:max_error_length] + "..."
-                    
-                    self.api_client.update_account_status(
-                        external_account_id,
-                        'error',
-                        error_msg
-                    )
+                    logger.error(f"Erreur inattendue lors de la reprise d'un terminal: {e}")
+                    connected = False
+                summary['restarted' if connected else 'restart_failed'] += 1
+
+        logger.info(
+            f"Reprise terminee en {time.monotonic() - start:.0f}s: {summary['restarted']} reconnecte(s), "
+            f"{summary['restart_failed']} echec(s)"
+        )
+        return summary
+
+    def start_resume(self):
+        """Reprise des terminaux en arrière-plan: le polling des comptes continue pendant ce temps"""
+        if not self.config.LAUNCH_RESUME_ON_START or self._resume_thread is not None:
+            return
+        self._resume_thread = threading.Thread(target=self.resume_terminals, name="resume", daemon=True)
+        self._resume_thread.start()
+
+    def start_metrics_server(self):
+        """Expose /metrics en local (METRICS_PORT = 0 pour désactiver)"""
+        if self.config.METRICS_PORT and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer('127.0.0.1', self.config.METRICS_PORT).start()
+            except OSError as e:
+                logger.error(f"Impossible de demarrer le serveur de metriques sur le port {self.config.METRICS_PORT}: {e}")
+
+    def free_slots(self) -> int:
+        """Emplacements de terminaux libres sur ce VPS"""
+        return max(self.config.MAX_TERMINALS - self.mt_manager.running_count(), 0)
+
+    def process_pending_accounts(self):
+        """Réclame les comptes en attente et traite les tâches de provisionnement prêtes"""
+        try:
+            logger.debug("Vérification des comptes en attente...")
+            free_slots = self.free_slots()
+            # Les comptes en attente de nouvelle tentative occupent déjà un emplacement
+            claim_slots = max(free_slots - self.retry_queue.queued_count(), 0)
+            if free_slots == 0:
+                logger.info(f"Capacité maximale atteinte ({self.config.MAX_TERMINALS} terminaux), aucun compte réclamé")
+
+            # Réclamer un lot avec bail: les autres VPS ne traiteront pas ces comptes
+            pending_accounts = self.api_client.claim_pending_accounts(
+                self.config.VPS_HOST_ID,
+                self.config.MAX_TERMINALS,
+                claim_slots,
+                self.config.LEASE_TTL
+            )
+            PENDING_ACCOUNTS.set(len(pending_accounts))
+
+            if pending_accounts:
+                logger.info(f"{len(pending_accounts)} compte(s) en attente de configuration")
+                for account in pending_accounts:
+                    self.retry_queue.enqueue(account)
+                    self.lease_keeper.track(account.get('external_account_id'))
+                self.lease_keeper.start()
+
+            # Nouveaux comptes d'abord, puis les nouvelles tentatives arrivées à échéance
+            jobs = self.retry_queue.due(free_slots)
+            if jobs:
+                jobs = self._with_credentials(jobs, {a.get('external_account_id'): a for a in pending_accounts})
+            RETRY_QUEUE_DEPTH.set(self.retry_queue.queued_count())
+            if not jobs:
+                logger.debug("Aucun compte à configurer")
+                return
+
+            # Le nettoyage ne doit pas concurrencer les copies de template sur le disque
+            self.janitor.pause()
+            try:
+                self._provision_accounts(jobs)
+            finally:
+                self.janitor.resume()
+                RETRY_QUEUE_DEPTH.set(self.retry_queue.queued_count())
 
         except Exception as e:
             logger.error("=" * 60)
@@ -113,19 +197,144 @@ class VPSManager:
             logger.error(f"   Traceback:\n{traceback.format_exc()}")
             logger.error("=" * 60)
 
+    def _with_credentials(self, jobs: List[Dict], claimed: Dict[str, Dict]) -> List[Dict]:
+        """
+        Complète les tâches avec le compte et ses identifiants (jamais enregistrés dans la file)
+        Comptes réclamés à ce cycle: réponse de la réclamation; nouvelles tentatives: redemandés à l'API
+        """
+        retry_ids = [job['external_account_id'] for job in jobs if job['external_account_id'] not in claimed]
+        leased: Dict[str, Dict] = {}
+        if retry_ids:
+            leased = self.api_client.get_leased_accounts(self.config.VPS_HOST_ID, retry_ids)
+            if leased is None:
+                # Les nouvelles tentatives restent en file jusqu'au prochain cycle
+                logger.warning(f"Identifiants indisponibles, {len(retry_ids)} nouvelle(s) tentative(s) reportee(s)")
+                leased = {}
+                jobs = [job for job in jobs if job['external_account_id'] in claimed]
+
+        ready = []
+        for job in jobs:
+            external_account_id = job['external_account_id']
+            account = claimed.get(external_account_id) or leased.get(external_account_id)
+            if account is None:
+                # Plus en attente pour ce VPS: bail repris, compte supprimé ou déjà configuré
+                logger.warning(f"Compte {external_account_id} plus reserve a ce VPS, tache retiree")
+                self.retry_queue.complete(external_account_id)
+                self.lease_keeper.release(external_account_id)
+                continue
+            job['account'] = account
+            ready.append(job)
+        return ready
+
+    def _provision_accounts(self, jobs: List[Dict]):
+        """Configure les terminaux des comptes à traiter et transmet leur statut"""
+        for job in jobs:
+            account = job['account']
+            external_account_id = job['external_account_id']
+            broker = account.get('broker', 'Unknown')
+            login = account.get('login', 'Unknown')
+
+            if not self.lease_keeper.is_held(external_account_id):
+                logger.warning(f"Bail expiré pour {external_account_id}, compte laissé à un autre VPS")
+                self.retry_queue.complete(external_account_id)
+                continue
+
+            attempt = f" (tentative {job['attempts'] + 1}/{self.retry_queue.max_attempts})" if job['attempts'] else ""
+            logger.info(f"Traitement du compte: {external_account_id} (Broker: {broker}, Login: {login}){attempt}")
+
+            try:
+                # Compte déjà connecté avant un redémarrage (statut non transmis): pas de reconfiguration
+                state = self.state_store.get(external_account_id)
+                if state and state['status'] == 'connected' and self.mt_manager.is_running(external_account_id):
+                    logger.info(f"Terminal deja connecte pour {external_account_id}, envoi du statut uniquement")
+                    self._finish(external_account_id, 'connected', None)
+                    PROVISIONING_TOTAL.inc(status='already_connected')
+                    continue
+
+                # Configurer le terminal MT4/MT5
+                if self.mt_manager.setup_account(account):
+                    # Attendre la confirmation de connexion du terminal (journal MT / log EA)
+                    logger.info(f"Attente de la connexion du terminal pour {external_account_id}...")
+                    readiness = self.mt_manager.wait_until_ready(external_account_id)
+                    if readiness.connected:
+                        self._finish(external_account_id, 'connected', None)
+                        PROVISIONING_TOTAL.inc(status='connected')
+                        logger.info(f"Compte {external_account_id} configuré et connecté en {readiness.elapsed:.1f}s")
+                    else:
+                        if readiness.retryable:
+                            # Ne pas laisser tourner un terminal qui sera relancé
+                            self.mt_manager.stop_terminal(external_account_id)
+                        self._handle_failure(external_account_id, readiness.message, readiness.retryable)
+                else:
+                    error_msg, retryable = self.mt_manager.setup_failures.pop(
+                        external_account_id,
+                        ("Échec de la configuration du terminal MT4/MT5", True)
+                    )
+                    self._handle_failure(external_account_id, error_msg, retryable)
+
+            except Exception as e:
+                import traceback
+                error_msg = f"Erreur lors du traitement: {str(e)}"
+                logger.error("=" * 60)
+                logger.error(f"Erreur lors du traitement de {external_account_id}")
+                logger.error(f"   Message: {error_msg}")
+                logger.error(f"   Type: {type(e).__name__}")
+                logger.error(f"   Traceback:\n{traceback.format_exc()}")
+                logger.error("=" * 60)
+
+                self._handle_failure(external_account_id, error_msg, is_retryable_exception(e))
+
+    def _finish(self, external_account_id: str, status: str, error_msg: Optional[str]):
+        """Statut final: transmis à l'API, tâche retirée de la file et bail libéré"""
+        self.state_store.update(external_account_id, status=status, error_message=error_msg)
+        self.api_client.update_account_status(external_account_id, status, error_msg)
+        self.retry_queue.complete(external_account_id)
+        # Statut final envoyé: le backend a libéré le bail
+        self.lease_keeper.release(external_account_id)
+
+    def _handle_failure(self, external_account_id: str, error_msg: str, retryable: bool):
+        """Planifie une nouvelle tentative (bail conservé) ou abandonne le compte"""
+        # Limiter la longueur du message d'erreur pour Supabase
+        max_error_length = 500
+        if len(error_msg) > max_error_length:
+            error_msg = error_msg[:max_error_length] + "..."
+
+        delay = self.retry_queue.fail(external_account_id, error_msg, retryable)
+        if delay is not None:
+            # Le compte reste en pending_vps_setup côté backend, réservé à ce VPS
+            self.state_store.update(external_account_id, status='retry_wait', error_message=error_msg)
+            PROVISIONING_TOTAL.inc(status='retry_scheduled')
+            logger.warning(f"Échec temporaire pour {external_account_id}, nouvelle tentative dans {delay:.0f}s: {error_msg}")
+            return
+
+        PROVISIONING_TOTAL.inc(status='dead_letter' if retryable else 'fatal')
+        logger.error(f"❌ Compte {external_account_id} abandonné: {error_msg}")
+        self._finish(external_account_id, 'error', error_msg)
+
+    def rollout_ea(self, restart: bool = False, wave_size: int = 10, wave_delay: float = 0, concurrency: int = 4):
+        """Déploie la version courante de l'EA sur tous les terminaux provisionnés"""
+        rollout = EARollout(self.mt_manager, self.state_store, self.api_client, concurrency=concurrency)
+        return rollout.run(restart=restart, wave_size=wave_size, wave_delay=wave_delay)
+
     def run(self):
         """Boucle principale du VPS Manager"""
         logger.info("Démarrage du VPS Manager")
         logger.info(f"Intervalle de polling: {self.config.POLLING_INTERVAL} secondes")
+        self.start_metrics_server()
+        self.janitor.start()
+        self.start_resume()
 
         while True:
             try:
-                self.process_pending_accounts()
+                with POLL_CYCLE_SECONDS.time():
+                    self.process_pending_accounts()
                 time.sleep(self.config.POLLING_INTERVAL)
             except KeyboardInterrupt:
                 logger.info("=" * 60)
                 logger.info("Arret du VPS Manager demande par l'utilisateur")
                 logger.info("=" * 60)
+                self.lease_keeper.stop()
+                self.janitor.stop()
                 break
             except Exception as e:
                 import traceback
@@ -139,6 +348,33 @@ class VPSManager:
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="VPS Manager RendR")
+    subparsers = parser.add_subparsers(dest='command')
+    rollout_parser = subparsers.add_parser('rollout-ea', help="Deployer l'EA sur tous les terminaux")
+    rollout_parser.add_argument('--restart', action='store_true', help="Redemarrer les terminaux mis a jour")
+    rollout_parser.add_argument('--wave-size', type=int, default=10, help="Terminaux redemarres par vague")
+    rollout_parser.add_argument('--wave-delay', type=float, default=0, help="Pause entre deux vagues (secondes)")
+    rollout_parser.add_argument('--concurrency', type=int, default=4, help="Copies simultanees")
+    subparsers.add_parser('janitor', help="Nettoyer les dossiers terminaux orphelins et les journaux")
+    subparsers.add_parser('dead-letters', help="Lister les comptes abandonnes apres echec du provisionnement")
+    subparsers.add_parser('templates', help="Lister les templates et couches broker charges")
+    subparsers.add_parser('resume', help="Relancer les terminaux connectes avant l'arret du VPS")
+    args = parser.parse_args()
+
     manager = VPSManager()
-    manager.run()
+    if args.command == 'rollout-ea':
+        manager.rollout_ea(args.restart, args.wave_size, args.wave_delay, args.concurrency)
+    elif args.command == 'janitor':
+        manager.janitor.run_once()
+    elif args.command == 'dead-letters':
+        for job in manager.retry_queue.dead_letters():
+            updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job['updated_at']))
+            print(f"{job['external_account_id']}  {updated}  tentatives={job['attempts']}  {job['last_error']}")
+    elif args.command == 'templates':
+        for row in manager.mt_manager.templates.describe():
+            print(f"{row['template']}  {row['files']} fichiers  {row['bytes'] / 1024 / 1024:.1f} Mo  {row['path']}  {row['match']}")
+    elif args.command == 'resume':
+        manager.resume_terminals()
+    else:
+        manager.run()
 
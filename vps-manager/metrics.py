@@ -0,0 +1,262 @@
+"""
+Métriques du VPS Manager exposées au format texte Prometheus sur /metrics
+Implémentation minimale (sans prometheus_client): compteurs, jauges et histogrammes
+avec labels, plus des collecteurs évalués à chaque lecture
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par combinaison de labels: [compte par bucket..., somme, nombre]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc, y compris s'il lève une exception"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(nombre, somme) par combinaison de labels"""
+        with self._lock:
+            return {key: (state[-1], state[-2]) for key, state in self._values.items()}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            names = self.labelnames + ('le',)
+            for index, bound in enumerate(self.buckets):
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (repr(float(bound)),))} {state[index]}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {state[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {state[-2]}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Fonction appelée avant chaque rendu (met à jour des jauges à la demande)"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Erreur du collecteur de metriques: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+POLL_CYCLE_SECONDS = REGISTRY.register(Histogram(
+    'vps_poll_cycle_seconds', "Duree d'un cycle de polling des comptes en attente"))
+PENDING_ACCOUNTS = REGISTRY.register(Gauge(
+    'vps_pending_accounts', "Comptes en attente reclames au dernier cycle"))
+PROVISIONING_STEP_SECONDS = REGISTRY.register(Histogram(
+    'vps_provisioning_step_seconds', "Duree des etapes de provisionnement d'un terminal", ['step']))
+PROVISIONING_TOTAL = REGISTRY.register(Counter(
+    'vps_provisioning_total', "Provisionnements termines par statut final", ['status']))
+RETRY_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'vps_retry_queue_depth', "Comptes en file de provisionnement (nouveaux et nouvelles tentatives)"))
+API_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'vps_api_request_seconds', "Latence des appels a l'API backend", ['endpoint'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+RUNNING_TERMINALS = REGISTRY.register(Gauge(
+    'vps_running_terminals', "Terminaux MT4/MT5 en cours d'execution"))
+TERMINALS_CPU_PERCENT = REGISTRY.register(Gauge(
+    'vps_terminals_cpu_percent', "CPU cumule des terminaux (en % d'un coeur)"))
+TERMINALS_RSS_BYTES = REGISTRY.register(Gauge(
+    'vps_terminals_rss_bytes', "Memoire residente cumulee des terminaux"))
+
+
+class TerminalResourceCollector:
+    """
+    Met à jour le nombre de terminaux en cours et leur CPU/RSS cumulés
+    Les objets psutil.Process sont conservés entre deux lectures: cpu_percent
+    mesure l'utilisation depuis la lecture précédente
+    """
+
+    def __init__(self, pids_provider: Callable[[], List[int]]):
+        self.pids_provider = pids_provider
+        self._processes: Dict[int, psutil.Process] = {}
+
+    def __call__(self):
+        pids = set(self.pids_provider())
+        for pid in list(self._processes):
+            if pid not in pids:
+                del self._processes[pid]
+
+        cpu_total = 0.0
+        rss_total = 0
+        for pid in pids:
+            try:
+                proc = self._processes.get(pid)
+                if proc is None:
+                    proc = self._processes[pid] = psutil.Process(pid)
+                with proc.oneshot():
+                    cpu_total += proc.cpu_percent(interval=None)
+                    rss_total += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._processes.pop(pid, None)
+
+        RUNNING_TERMINALS.set(len(pids))
+        TERMINALS_CPU_PERCENT.set(cpu_total)
+        TERMINALS_RSS_BYTES.set(rss_total)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """Serveur HTTP local exposant /metrics dans un thread de fond"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9108, registry: Registry = REGISTRY):
+        handler = type('BoundMetricsHandler', (_MetricsHandler,), {'registry': registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        host, port = self.httpd.server_address[:2]
+        logger.info(f"Metriques exposees sur http://{host}:{port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
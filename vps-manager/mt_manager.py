@@ -5,30 +5,61 @@ Gère la création des dossiers, copie de l'EA, lancement des terminaux
 
 import os
 import shutil
+import hashlib
 import subprocess
 import logging
+import threading
 import configparser
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+import psutil
+from readiness import TerminalReadinessWatcher, ReadinessResult
+from state_store import is_terminal_process
+from metrics import PROVISIONING_STEP_SECONDS
+from retry_queue import is_retryable_exception
+from template_registry import TemplateRegistry
+from launch_scheduler import LaunchScheduler, PRIORITY_DEFAULT
 
 logger = logging.getLogger(__name__)
 
 
+def file_sha256(path: Path) -> str:
+    """Hash SHA-256 d'un fichier (identifie la version de l'EA installée)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 class MTManager:
-    def __init__(self, config):
+    def __init__(self, config, state_store):
         self.config = config
+        self.state_store = state_store
         self.terminals_base = Path(config.TERMINALS_BASE_PATH)
         self.terminals_base.mkdir(parents=True, exist_ok=True)
         # Chemin vers le terminal de base pré-configuré
         self.mt4_base_terminal = self.terminals_base / "MT4-Base"
         self.mt5_base_terminal = self.terminals_base / "MT5-Base"
+        # Processus et surveillance de connexion des terminaux lancés (par external_account_id)
+        # Partagés par la boucle principale et les threads de reprise et de redéploiement
+        self._lock = threading.Lock()
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.readiness_watchers: Dict[str, TerminalReadinessWatcher] = {}
+        # Cause du dernier échec de setup_account: (message, erreur temporaire)
+        self.setup_failures: Dict[str, Tuple[str, bool]] = {}
+        # Templates par broker (base + couche broker), manifestes calculés au démarrage
+        self.templates = TemplateRegistry(config)
+        self.templates.load()
+        # Créneaux de lancement partagés (provisionnement, redéploiement, reprise)
+        self.launch_scheduler = LaunchScheduler(config)
 
     def setup_account(self, account_data: Dict) -> bool:
         """
         Configure un terminal MT4/MT5 pour un compte donné
         Args:
             account_data: Dictionnaire avec les infos du compte
-        Returns: True si succès
+        Returns: True si succès (sinon la cause est dans setup_failures)
         """
         external_account_id = account_data.get('external_account_id')
         platform = account_data.get('platform')  # 'MT4' ou 'MT5'
@@ -38,94 +69,315 @@ class MTManager:
         investor_password = account_data.get('investor_password')
         
         # Log de débogage pour voir toutes les données reçues
-        logger.info(f"[DEBUG] Donnees du compte recues:")
-        logger.info(f"   - external_account_id: {external_account_id}")
-        logger.info(f"   - platform: {platform}")
-        logger.info(f"   - broker: {broker}")
-        logger.info(f"   - server: {server}")
-        logger.info(f"   - login: {login}")
-        logger.info(f"   - investor_password (longueur): {len(investor_password) if investor_password else 0} caracteres")
-        logger.info(f"   - Toutes les cles dans account_data: {list(account_data.keys())}")
+        logger.debug(f"[DEBUG] Donnees du compte recues:")
+        logger.debug(f"   - external_account_id: {external_account_id}")
+        logger.debug(f"   - platform: {platform}")
+        logger.debug(f"   - broker: {broker}")
+        logger.debug(f"   - server: {server}")
+        logger.debug(f"   - login: {login}")
+        logger.debug(f"   - investor_password (longueur): {len(investor_password) if investor_password else 0} caracteres")
+        logger.debug(f"   - Toutes les cles dans account_data: {list(account_data.keys())}")
 
         if not all([external_account_id, platform, server, login, investor_password]):
-            logger.error("Donnees de compte incompletes")
-            return False
+            return self._setup_failed(external_account_id, "Donnees de compte incompletes", retryable=False)
 
         try:
             # Déterminer les chemins selon la plateforme
-            # mt_path doit pointer vers le template préconfiguré (WebRequest, profil RendR, etc.)
             if platform == 'MT4':
-                mt_path = Path(self.config.MT4_PATH)  # Template préconfiguré
                 ea_source = Path(self.config.MT4_EA_PATH)
                 terminal_dir = self.terminals_base / f"MT4-{external_account_id}"
                 experts_dir = terminal_dir / "MQL4" / "Experts"
             elif platform == 'MT5':
-                mt_path = Path(self.config.MT5_PATH)  # Template préconfiguré
                 ea_source = Path(self.config.MT5_EA_PATH)
                 terminal_dir = self.terminals_base / f"MT5-{external_account_id}"
                 experts_dir = terminal_dir / "MQL5" / "Experts"
             else:
-                logger.error(f"Plateforme non supportee: {platform}")
-                return False
+                return self._setup_failed(external_account_id, f"Plateforme non supportee: {platform}", retryable=False)
 
-            # Vérifier que le template existe
-            if not mt_path.exists():
-                logger.error(f"Template {platform} non trouve: {mt_path}")
-                return False
+            # Template préconfiguré (WebRequest, profil RendR) + couche du broker (servers.dat)
+            template = self.templates.resolve(platform, broker, server)
+            if not template.available:
+                return self._setup_failed(
+                    external_account_id,
+                    f"Template {platform} non trouve: {self.templates.base_paths[platform]}",
+                    retryable=True
+                )
 
             # Vérifier que l'EA existe
             if not ea_source.exists():
-                logger.error(f"EA non trouve: {ea_source}")
-                return False
+                return self._setup_failed(external_account_id, f"EA non trouve: {ea_source}", retryable=True)
 
             logger.info(f"Configuration du terminal {platform} pour {external_account_id}")
+            self.state_store.record_terminal(
+                external_account_id,
+                terminal_dir,
+                platform,
+                broker=broker,
+                server=server,
+                login=login,
+                # Identifiant du VPS à la réclamation (le nom de la machine peut changer ensuite)
+                host_id=self.config.VPS_HOST_ID,
+                status='provisioning',
+                error_message=None
+            )
+
+            # Un terminal déjà lancé pour ce compte est redémarré avec la nouvelle configuration
+            if self.is_running(external_account_id):
+                logger.info(f"Terminal deja en cours pour {external_account_id}, redemarrage")
+                self.stop_terminal(external_account_id)
 
             # 1. Créer/copier le dossier terminal depuis le template
-            if terminal_dir.exists():
+            cloned = not terminal_dir.exists()
+            if not cloned:
                 logger.warning(f"Dossier terminal existe deja: {terminal_dir}")
+                # Couche broker mise à jour depuis le dernier provisionnement (servers.dat)
+                updated = template.apply_overlay(terminal_dir)
+                if updated:
+                    logger.info(f"Couche {template.name} mise a jour: {updated} fichier(s)")
             else:
-                # Copier depuis le template (déjà configuré avec WebRequest, profil RendR, etc.)
-                logger.info(f"Copie du terminal depuis le template: {mt_path}")
-                shutil.copytree(mt_path, terminal_dir, ignore=shutil.ignore_patterns('*.log', '*.tmp'))
+                logger.info(f"Copie du terminal depuis le template {template.name}")
+                with PROVISIONING_STEP_SECONDS.time(step='clone'):
+                    self._clone_terminal(template, terminal_dir, broker, server)
 
             # 2. Créer le dossier Experts s'il n'existe pas
             experts_dir.mkdir(parents=True, exist_ok=True)
 
-            # 3. Copier l'EA (mise à jour à chaque fois pour être sûr d'avoir la bonne version)
+            # 3. Copier l'EA si la version installée diffère (hash enregistré dans l'état local)
             ea_dest = experts_dir / ea_source.name
-            logger.info(f"Copie de l'EA vers {ea_dest}")
-            shutil.copy2(ea_source, ea_dest)
-
-            # 4. Créer le fichier de configuration pour l'EA
-            self._create_ea_config(terminal_dir, external_account_id, account_data)
-
-            # 5. Créer le fichier de configuration MT4/MT5 pour la connexion automatique
-            # Log des valeurs pour débogage
-            logger.info(f"[DEBUG] Valeurs avant creation du fichier de config:")
-            logger.info(f"   - Login: {login}")
-            logger.info(f"   - Password (longueur): {len(investor_password) if investor_password else 0} caracteres")
-            logger.info(f"   - Server: {server}")
-            self._create_terminal_config(terminal_dir, platform, login, investor_password, server)
-
-            # 6. Lancer le terminal avec les paramètres de connexion
-            success = self._launch_terminal(
+            with PROVISIONING_STEP_SECONDS.time(step='ea_copy'):
+                ea_hash = file_sha256(ea_source)
+                state = self.state_store.get(external_account_id)
+                if not cloned and ea_dest.exists() and state and state.get('ea_hash') == ea_hash:
+                    logger.info(f"EA deja a jour dans {ea_dest}")
+                else:
+                    logger.info(f"Copie de l'EA vers {ea_dest}")
+                    self.install_ea(external_account_id, ea_source, ea_dest, ea_hash)
+
+            with PROVISIONING_STEP_SECONDS.time(step='config_write'):
+                # 4. Créer le fichier de configuration pour l'EA
+                self._create_ea_config(terminal_dir, external_account_id, account_data)
+
+                # 5. Créer le fichier de configuration MT4/MT5 pour la connexion automatique
+                # Log des valeurs pour débogage
+                logger.debug(f"[DEBUG] Valeurs avant creation du fichier de config:")
+                logger.debug(f"   - Login: {login}")
+                logger.debug(f"   - Password (longueur): {len(investor_password) if investor_password else 0} caracteres")
+                logger.debug(f"   - Server: {server}")
+                self._create_terminal_config(terminal_dir, platform, login, investor_password, server)
+
+            # 6. Mémoriser l'état des logs avant le lancement (ignorer les anciens marqueurs)
+            watcher = TerminalReadinessWatcher(
                 terminal_dir,
                 platform,
                 login,
-                investor_password,
-                server
+                poll_interval=self.config.READINESS_POLL_INTERVAL
             )
-
-            if success:
+            watcher.snapshot()
+
+            # 7. Lancer le terminal avec les paramètres de connexion
+            with PROVISIONING_STEP_SECONDS.time(step='launch'):
+                process = self._launch_terminal(
+                    external_account_id,
+                    terminal_dir,
+                    platform,
+                    login,
+                    investor_password,
+                    server
+                )
+
+            if process is not None:
+                self._track(external_account_id, process, watcher)
+                self.state_store.update(external_account_id, pid=process.pid)
+                self.setup_failures.pop(external_account_id, None)
                 logger.info(f"Terminal {platform} lance avec succes pour {external_account_id}")
                 return True
             else:
-                return False
+                return self._setup_failed(external_account_id, f"Echec du lancement du terminal {platform}", retryable=True)
 
         except Exception as e:
-            logger.error(f"Erreur lors de la configuration: {str(e)}")
+            return self._setup_failed(
+                external_account_id,
+                f"Erreur lors de la configuration: {str(e)}",
+                retryable=is_retryable_exception(e)
+            )
+
+    def _clone_terminal(self, template, terminal_dir: Path, broker: Optional[str], server: Optional[str]):
+        try:
+            template.clone(terminal_dir)
+        except FileNotFoundError:
+            # Template modifié depuis le calcul des manifestes: recalcul puis nouvelle copie
+            logger.warning(f"Manifeste du template {template.name} perime, recalcul")
+            self.templates.refresh()
+            self.templates.resolve(template.platform, broker, server).clone(terminal_dir)
+
+    def _setup_failed(self, external_account_id: str, message: str, retryable: bool) -> bool:
+        logger.error(message)
+        self.setup_failures[external_account_id] = (message, retryable)
+        return False
+
+    def ea_source_for(self, platform: str) -> Optional[Path]:
+        """Chemin de l'EA à installer pour une plateforme"""
+        if platform == 'MT4':
+            return Path(self.config.MT4_EA_PATH)
+        if platform == 'MT5':
+            return Path(self.config.MT5_EA_PATH)
+        return None
+
+    @staticmethod
+    def experts_dir_for(terminal_dir: Path, platform: str) -> Path:
+        return Path(terminal_dir) / ("MQL4" if platform == 'MT4' else "MQL5") / "Experts"
+
+    def install_ea(self, external_account_id: str, ea_source: Path, ea_dest: Path, ea_hash: str):
+        """
+        Copie l'EA dans le terminal et enregistre son hash
+        La copie passe par un fichier temporaire remplacé atomiquement, pour qu'un
+        terminal en cours d'exécution ne lise jamais un EA partiellement écrit
+        """
+        ea_dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dest = ea_dest.with_name(ea_dest.name + '.tmp')
+        shutil.copy2(ea_source, tmp_dest)
+        os.replace(tmp_dest, ea_dest)
+        self.state_store.update(external_account_id, ea_hash=ea_hash)
+
+    def restart_terminal(self, external_account_id: str, priority: int = PRIORITY_DEFAULT) -> bool:
+        """
+        Redémarre le terminal d'un compte avec sa configuration existante (config/start.ini)
+        La confirmation de connexion s'obtient ensuite via wait_until_ready
+        Args:
+            priority: Rang d'attente du créneau de lancement (PRIORITY_TRADING en premier)
+        """
+        state = self.state_store.get(external_account_id)
+        if state is None:
+            logger.error(f"Compte inconnu dans l'etat local: {external_account_id}")
+            return False
+
+        terminal_dir = Path(state['terminal_dir'])
+        # Terminal adopté (login absent de l'état local): login lu dans start.ini
+        login = state.get('login') or self.start_ini_login(terminal_dir)
+        if not login:
+            # Sans login, les marqueurs du journal du terminal ne peuvent pas être reconnus
+            logger.error(f"Login inconnu pour {external_account_id}, terminal non redemarre")
             return False
 
+        if not self.stop_terminal(external_account_id):
+            return False
+
+        watcher = TerminalReadinessWatcher(
+            terminal_dir,
+            state['platform'],
+            login,
+            poll_interval=self.config.READINESS_POLL_INTERVAL
+        )
+        watcher.snapshot()
+
+        process = self._launch_terminal(
+            external_account_id, terminal_dir, state['platform'], login, None, state.get('server'),
+            priority=priority
+        )
+        if process is None:
+            return False
+
+        self._track(external_account_id, process, watcher)
+        self.state_store.update(external_account_id, pid=process.pid)
+        return True
+
+    def _track(self, external_account_id: str, process: subprocess.Popen, watcher: TerminalReadinessWatcher):
+        with self._lock:
+            self.processes[external_account_id] = process
+            self.readiness_watchers[external_account_id] = watcher
+
+    @staticmethod
+    def start_ini_login(terminal_dir: Path) -> Optional[str]:
+        """Login de config/start.ini (None si absent ou illisible)"""
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(Path(terminal_dir) / "config" / "start.ini", encoding='utf-8')
+        except (configparser.Error, UnicodeDecodeError):
+            return None
+        login = parser.get('Common', 'Login', fallback='').strip()
+        return login or None
+
+    def is_running(self, external_account_id: str) -> bool:
+        """Vérifie si le terminal d'un compte tourne (lancé ici ou avant un redémarrage)"""
+        with self._lock:
+            process = self.processes.get(external_account_id)
+            if process is not None:
+                if process.poll() is None:
+                    return True
+                del self.processes[external_account_id]
+
+        state = self.state_store.get(external_account_id)
+        if state is None:
+            return False
+        return is_terminal_process(state.get('pid'), Path(state['terminal_dir']))
+
+    def running_pids(self) -> List[int]:
+        """PID des terminaux en cours d'exécution sur ce VPS"""
+        return [
+            state['pid'] for state in self.state_store.all()
+            if is_terminal_process(state.get('pid'), Path(state['terminal_dir']))
+        ]
+
+    def running_count(self) -> int:
+        """Nombre de terminaux en cours d'exécution sur ce VPS"""
+        return len(self.running_pids())
+
+    def stop_terminal(self, external_account_id: str, timeout: float = 15) -> bool:
+        """Arrête le terminal d'un compte; retourne True si aucun terminal ne tourne plus"""
+        with self._lock:
+            process = self.processes.pop(external_account_id, None)
+        self.launch_scheduler.release(external_account_id)
+        state = self.state_store.get(external_account_id)
+        pid = process.pid if process is not None else (state or {}).get('pid')
+        if not pid or (process is None and not is_terminal_process(pid, Path(state['terminal_dir']))):
+            return True
+
+        try:
+            proc = psutil.Process(pid)
+            proc.terminate()
+            try:
+                proc.wait(timeout=timeout)
+            except psutil.TimeoutExpired:
+                logger.warning(f"Le terminal {external_account_id} (PID {pid}) ne s'arrete pas, arret force")
+                proc.kill()
+                proc.wait(timeout=timeout)
+        except psutil.NoSuchProcess:
+            pass
+        except (psutil.AccessDenied, psutil.TimeoutExpired) as e:
+            logger.error(f"Impossible d'arreter le terminal {external_account_id} (PID {pid}): {e}")
+            return False
+
+        self.state_store.update(external_account_id, pid=None)
+        return True
+
+    def wait_until_ready(self, external_account_id: str, timeout: Optional[float] = None) -> ReadinessResult:
+        """
+        Attend que le terminal d'un compte confirme sa connexion (ou son échec)
+        Se résout dès qu'un marqueur apparaît dans le journal du terminal ou le log de l'EA
+        Args:
+            external_account_id: UUID du compte
+            timeout: Délai maximal en secondes (READINESS_TIMEOUT par défaut)
+        Returns: ReadinessResult avec status 'connected' ou 'error'
+        """
+        with self._lock:
+            watcher = self.readiness_watchers.pop(external_account_id, None)
+            process = self.processes.get(external_account_id)
+        if watcher is None:
+            return ReadinessResult('error', "Aucun terminal lance pour ce compte")
+
+        if timeout is None:
+            timeout = self.config.READINESS_TIMEOUT
+
+        try:
+            with PROVISIONING_STEP_SECONDS.time(step='readiness'):
+                result = watcher.wait(timeout, process)
+        finally:
+            self.launch_scheduler.release(external_account_id)
+        if result.connected and process is not None:
+            self.launch_scheduler.tune(external_account_id, process.pid)
+        logger.info(f"Disponibilite du terminal {external_account_id}: {result.status} en {result.elapsed:.1f}s")
+        return result
+
     def _create_ea_config(self, terminal_dir: Path, external_account_id: str, account_data: Dict):
         """Crée un fichier de configuration pour l'EA avec les paramètres nécessaires"""
         config_file = terminal_dir / "rendr_ea_config.ini"
@@ -147,8 +399,8 @@ class MTManager:
             config.write(f)
 
         logger.info(f"Fichier de config EA cree: {config_file}")
-        logger.info(f"  - Register URL: {register_url}")
-        logger.info(f"  - Trades URL: {trades_url}")
+        logger.debug(f"  - Register URL: {register_url}")
+        logger.debug(f"  - Trades URL: {trades_url}")
 
     def _create_mt4_profile(self, terminal_dir: Path, platform: str, ea_name: str):
         """Crée un profil MT4 de base pour utiliser avec Profile= dans start.ini"""
@@ -235,10 +487,10 @@ class MTManager:
             return
 
         # Log des valeurs reçues dans la fonction
-        logger.info(f"[DEBUG] Dans _create_terminal_config:")
-        logger.info(f"   - Login reçu: '{login}'")
-        logger.info(f"   - Password reçu (longueur): {len(password) if password else 0} caracteres")
-        logger.info(f"   - Server reçu: '{server}'")
+        logger.debug(f"[DEBUG] Dans _create_terminal_config:")
+        logger.debug(f"   - Login reçu: '{login}'")
+        logger.debug(f"   - Password reçu (longueur): {len(password) if password else 0} caracteres")
+        logger.debug(f"   - Server reçu: '{server}'")
 
         # Créer le dossier config s'il n'existe pas
         config_dir = terminal_dir / "config"
@@ -268,29 +520,24 @@ Profile=RendR
             f.write(config_content)
 
         logger.info(f"[OK] Fichier start.ini cree: {config_file}")
-        logger.info(f"   - Login: {login_clean}")
-        logger.info(f"   - Server: {server_clean}")
-        logger.info(f"   - Profile: RendR")
-        
-        # Lire le fichier créé pour vérification
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                content_read = f.read()
-                logger.info(f"[DEBUG] Contenu du fichier cree:")
-                logger.info(f"{content_read}")
-        except Exception as e:
-            logger.warning(f"Impossible de lire le fichier pour verification: {e}")
+        logger.debug(f"   - Login: {login_clean}")
+        logger.debug(f"   - Server: {server_clean}")
+        logger.debug(f"   - Profile: RendR")
 
     def _launch_terminal(
         self,
+        external_account_id: str,
         terminal_dir: Path,
         platform: str,
         login: str,
         password: str,
-        server: str
-    ) -> bool:
+        server: str,
+        priority: int = PRIORITY_DEFAULT
+    ) -> Optional[subprocess.Popen]:
         """
         Lance le terminal MT4/MT5 avec les paramètres de connexion
+        Attend d'abord un créneau de lancement, libéré par wait_until_ready
+        Returns: le processus lancé, ou None en cas d'échec
         Utilise start.ini selon la documentation officielle MT4
         Documentation: https://www.metatrader4.com/fr/trading-platform/help/service/start_conf_file
         """
@@ -300,13 +547,13 @@ Profile=RendR
             elif platform == 'MT5':
                 exe_name = "terminal64.exe"
             else:
-                return False
+                return None
 
             exe_path = terminal_dir / exe_name
 
             if not exe_path.exists():
                 logger.error(f"Executable non trouve: {exe_path}")
-                return False
+                return None
 
             # Utiliser start.ini selon la documentation officielle MT4
             # Le fichier doit être dans config/start.ini
@@ -316,7 +563,7 @@ Profile=RendR
             # Vérifier que le fichier de config existe
             if not config_file.exists():
                 logger.error(f"Fichier start.ini manquant: {config_file}")
-                return False
+                return None
             
             # Utiliser la syntaxe officielle: terminal.exe config\start.ini
             # Le chemin relatif depuis le répertoire du terminal
@@ -335,13 +582,16 @@ Profile=RendR
                     config_relative_path
                 ]
             else:
-                return False
+                return None
 
             logger.info(f"[LANCEMENT] Terminal {platform}")
-            logger.info(f"   - Executable: {exe_path}")
-            logger.info(f"   - Config: {config_file}")
-            logger.info(f"   - Chemin relatif: {config_relative_path}")
-            logger.info(f"   - Commande complete: {' '.join(args)}")
+            logger.debug(f"   - Executable: {exe_path}")
+            logger.debug(f"   - Config: {config_file}")
+            logger.debug(f"   - Chemin relatif: {config_relative_path}")
+            logger.debug(f"   - Commande complete: {' '.join(args)}")
+
+            # Pas de démarrages en rafale: attendre un créneau (charge, intervalle, priorité)
+            self.launch_scheduler.acquire(external_account_id, priority)
 
             # Lancer en arrière-plan
             # Note: Ne pas utiliser CREATE_NO_WINDOW pour voir si MT4 se connecte
@@ -350,20 +600,14 @@ Profile=RendR
                 cwd=str(terminal_dir)
             )
 
-            # Attendre un peu pour vérifier que le processus a démarré
-            import time
-            time.sleep(3)  # Augmenter le délai pour laisser MT4 se connecter
-            
-            # Vérifier que le processus est toujours en cours d'exécution
-            if process.poll() is not None:
-                logger.error(f"Le terminal s'est arrete immediatement apres le lancement (code: {process.returncode})")
-                return False
-
-            logger.info(f"Terminal lance avec succes (PID: {process.pid})")
-            return True
+            # La confirmation de connexion (ou un arrêt prématuré) est détectée
+            # ensuite par wait_until_ready, sans délai fixe
+            logger.info(f"Terminal lance (PID: {process.pid})")
+            return process
 
         except Exception as e:
             import traceback
+            self.launch_scheduler.release(external_account_id)
             logger.error("=" * 60)
             logger.error(f"[ERREUR] Erreur lors du lancement du terminal {platform}")
             logger.error(f"   Message: {str(e)}")
@@ -371,4 +615,4 @@ Profile=RendR
             logger.error(f"   Chemin: {exe_path}")
             logger.error(f"   Traceback:\n{traceback.format_exc()}")
             logger.error("=" * 60)
-            return False
+            return None
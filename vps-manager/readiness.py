@@ -0,0 +1,175 @@
+"""
+Détection de la disponibilité des terminaux MT4/MT5
+Surveille le journal du terminal et le log de l'EA pour détecter la connexion
+(ou son échec) au lieu d'attendre un délai fixe
+"""
+
+import re
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def decode_log(data: bytes) -> str:
+    """Contenu d'un journal: UTF-16LE (MT5, log de l'EA sans FILE_ANSI) ou ANSI (MT4)"""
+    sample = data[1:128:2]
+    if data.startswith(b'\xff\xfe') or (sample and sample.count(0) > len(sample) // 2):
+        return data.decode('utf-16-le', errors='ignore')
+    return data.decode('cp1252', errors='ignore')
+
+
+class ReadinessResult:
+    def __init__(self, status: str, message: Optional[str] = None, elapsed: float = 0.0, retryable: bool = True):
+        # status: 'connected' ou 'error' (mêmes valeurs que l'API /api/vps/account-status)
+        self.status = status
+        self.message = message
+        self.elapsed = elapsed
+        # Échec temporaire (arrêt prématuré, délai dépassé) ou refus du serveur de trading
+        self.retryable = retryable
+
+    @property
+    def connected(self) -> bool:
+        return self.status == 'connected'
+
+    def __repr__(self):
+        return f"ReadinessResult(status={self.status!r}, message={self.message!r}, elapsed={self.elapsed:.2f})"
+
+
+class TerminalReadinessWatcher:
+    """
+    Suit les fichiers de log d'un terminal en lecture incrémentale
+
+    Fichiers surveillés:
+      - <terminal>/logs/*.log : journal du terminal ("'<login>': authorized on ...",
+        "'<login>': authorization on ... failed (...)")
+      - <terminal>/MQL4|MQL5/Files/RendR_debug.log : log JSON de l'EA
+        (OnInit:after_register success=true/false)
+
+    Les positions de lecture sont mémorisées avant le lancement (snapshot) afin
+    d'ignorer les marqueurs écrits par une session précédente du terminal.
+    """
+
+    EA_LOG_NAME = "RendR_debug.log"
+
+    def __init__(self, terminal_dir: Path, platform: str, login: str, poll_interval: float = 0.25):
+        self.terminal_dir = Path(terminal_dir)
+        self.platform = platform
+        self.login = str(login).strip()
+        self.poll_interval = poll_interval
+        self._offsets: Dict[Path, int] = {}
+
+        login_re = re.escape(self.login)
+        # Marqueurs du journal MT4/MT5 (ligne préfixée par '<login>':)
+        self._success_patterns = [
+            re.compile(rf"'{login_re}':\s*authorized on", re.IGNORECASE),
+            re.compile(rf"'{login_re}':\s*login on", re.IGNORECASE),
+            re.compile(r"OnInit:after_register.*success=true", re.IGNORECASE),
+        ]
+        self._failure_patterns = [
+            re.compile(rf"'{login_re}':\s*authorization on .* failed", re.IGNORECASE),
+            re.compile(rf"'{login_re}':\s*(invalid account|invalid password|account disabled)", re.IGNORECASE),
+            re.compile(r"OnInit:after_register.*success=false", re.IGNORECASE),
+        ]
+        # Refus définitifs (identifiants): inutile de relancer le terminal
+        self._fatal_pattern = re.compile(r"invalid account|invalid password|account disabled", re.IGNORECASE)
+
+    def _watched_files(self) -> List[Path]:
+        files = []
+        logs_dir = self.terminal_dir / "logs"
+        if logs_dir.is_dir():
+            files.extend(sorted(logs_dir.glob("*.log")))
+        mql_dir = "MQL4" if self.platform == 'MT4' else "MQL5"
+        ea_log = self.terminal_dir / mql_dir / "Files" / self.EA_LOG_NAME
+        if ea_log.exists():
+            files.append(ea_log)
+        return files
+
+    def snapshot(self):
+        """Mémorise la taille actuelle des fichiers (à appeler avant le lancement)"""
+        self._offsets = {}
+        for path in self._watched_files():
+            try:
+                self._offsets[path] = path.stat().st_size
+            except OSError:
+                continue
+
+    def _read_new_lines(self) -> List[str]:
+        lines = []
+        for path in self._watched_files():
+            offset = self._offsets.get(path, 0)
+            try:
+                size = path.stat().st_size
+                if size < offset:
+                    # Fichier tronqué ou recréé: on repart du début
+                    offset = 0
+                if size == offset:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(size - offset)
+            except OSError:
+                continue
+            # Ne consommer que les lignes complètes (une ligne en cours d'écriture sera relue)
+            end = data.rfind(b'\n')
+            if end < 0:
+                continue
+            end += 2 if data[end + 1:end + 2] == b'\x00' else 1
+            self._offsets[path] = offset + end
+            lines.extend(decode_log(data[:end]).splitlines())
+        return lines
+
+    def check(self) -> Optional[ReadinessResult]:
+        """Analyse les nouvelles lignes; retourne un résultat si un marqueur est trouvé"""
+        for line in self._read_new_lines():
+            for pattern in self._failure_patterns:
+                if pattern.search(line):
+                    return ReadinessResult(
+                        'error',
+                        f"Echec de connexion du terminal: {line.strip()[:300]}",
+                        retryable=not self._fatal_pattern.search(line)
+                    )
+            for pattern in self._success_patterns:
+                if pattern.search(line):
+                    return ReadinessResult('connected')
+        return None
+
+    def wait(self, timeout: float, process=None) -> ReadinessResult:
+        """
+        Attend un marqueur de connexion ou d'échec
+        Args:
+            timeout: Durée maximale d'attente en secondes
+            process: subprocess.Popen optionnel, pour détecter un arrêt prématuré
+        Returns: ReadinessResult ('connected' ou 'error')
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            result = self.check()
+            if result is not None:
+                result.elapsed = time.monotonic() - start
+                return result
+
+            if process is not None and process.poll() is not None:
+                # Relire une dernière fois: le terminal a pu écrire avant de s'arrêter
+                result = self.check()
+                if result is not None:
+                    result.elapsed = time.monotonic() - start
+                    return result
+                return ReadinessResult(
+                    'error',
+                    f"Le terminal s'est arrete apres le lancement (code: {process.returncode})",
+                    time.monotonic() - start
+                )
+
+            if time.monotonic() >= deadline:
+                return ReadinessResult(
+                    'error',
+                    f"Aucune confirmation de connexion apres {timeout:.0f}s",
+                    time.monotonic() - start
+                )
+
+            time.sleep(self.poll_interval)
@@ -0,0 +1,201 @@
+"""
+File d'attente persistante des provisionnements (SQLite, même base que l'état local)
+Chaque compte réclamé devient une tâche: les échecs temporaires (fichier verrouillé,
+disque lent, terminal arrêté au premier lancement) sont retentés avec un délai
+exponentiel, les échecs définitifs et les tâches ayant épuisé leurs tentatives
+sont placés en dead-letter. Les tâches sont servies par nombre de tentatives
+croissant: un nouveau compte passe avant un compte déjà en échec
+Le mot de passe investisseur n'est jamais enregistré: il est redemandé à l'API
+(comptes réservés à ce VPS) avant chaque nouvelle tentative
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provisioning_jobs (
+    external_account_id TEXT PRIMARY KEY,
+    payload TEXT,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS provisioning_jobs_due
+    ON provisioning_jobs (state, attempts, next_attempt_at);
+"""
+
+QUEUED = 'queued'
+DEAD = 'dead'
+# Champs du compte réclamé jamais écrits sur le disque
+SECRET_FIELDS = ('investor_password', 'password')
+
+
+def public_payload(account: Dict) -> Dict:
+    """Compte réclamé sans ses identifiants"""
+    return {key: value for key, value in account.items() if key not in SECRET_FIELDS}
+
+
+def is_retryable_exception(error: BaseException) -> bool:
+    """
+    Classe une exception levée pendant le provisionnement
+    Erreurs système (fichier verrouillé, disque, réseau) et délais dépassés:
+    temporaires; erreurs de données ou de programmation: définitives
+    """
+    return isinstance(error, (OSError, TimeoutError, subprocess.SubprocessError))
+
+
+class RetryQueue:
+    def __init__(
+        self,
+        db_path: str,
+        max_attempts: int = 5,
+        base_delay: float = 30,
+        max_delay: float = 3600
+    ):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._scrub_payloads()
+
+    def _scrub_payloads(self):
+        """Retire les mots de passe enregistrés par les versions précédentes"""
+        rows = self._conn.execute(
+            "SELECT external_account_id, payload FROM provisioning_jobs WHERE payload IS NOT NULL"
+        ).fetchall()
+        for row in rows:
+            account = json.loads(row['payload'])
+            if any(key in account for key in SECRET_FIELDS):
+                self._conn.execute(
+                    "UPDATE provisioning_jobs SET payload = ? WHERE external_account_id = ?",
+                    (json.dumps(public_payload(account)), row['external_account_id'])
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def backoff(self, attempts: int) -> float:
+        """Délai avant la tentative suivante: exponentiel, plafonné, avec ±20% d'aléa"""
+        delay = min(self.base_delay * (2 ** max(attempts - 1, 0)), self.max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        job = dict(row)
+        job['account'] = json.loads(job.pop('payload')) if job['payload'] else None
+        return job
+
+    def enqueue(self, account: Dict):
+        """
+        Ajoute un compte réclamé (à traiter immédiatement)
+        Un compte déjà en file garde ses tentatives; un compte en dead-letter
+        réattribué par le backend repart de zéro
+        Seuls les champs non secrets sont enregistrés (voir public_payload)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO provisioning_jobs "
+                "(external_account_id, payload, state, attempts, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?) "
+                "ON CONFLICT(external_account_id) DO UPDATE SET payload = excluded.payload, "
+                "attempts = CASE WHEN state = ? THEN 0 ELSE attempts END, "
+                "next_attempt_at = CASE WHEN state = ? THEN excluded.next_attempt_at ELSE next_attempt_at END, "
+                "state = excluded.state, updated_at = excluded.updated_at",
+                (account['external_account_id'], json.dumps(public_payload(account)), QUEUED, now, now, now, DEAD, DEAD)
+            )
+
+    def due(self, limit: int) -> List[Dict]:
+        """Tâches prêtes, les moins tentées d'abord puis les plus anciennes"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM provisioning_jobs WHERE state = ? AND next_attempt_at <= ? "
+                "ORDER BY attempts, next_attempt_at LIMIT ?",
+                (QUEUED, time.time(), limit)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def queued(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM provisioning_jobs WHERE state = ? ORDER BY attempts, next_attempt_at",
+                (QUEUED,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def queued_count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM provisioning_jobs WHERE state = ?", (QUEUED,)
+            ).fetchone()[0]
+
+    def dead_letters(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM provisioning_jobs WHERE state = ? ORDER BY updated_at DESC", (DEAD,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def complete(self, external_account_id: str):
+        """Provisionnement terminé (ou compte repris par un autre VPS): retire la tâche"""
+        with self._lock:
+            # Les dead-letters restent consultables
+            self._conn.execute(
+                "DELETE FROM provisioning_jobs WHERE external_account_id = ? AND state = ?",
+                (external_account_id, QUEUED)
+            )
+
+    def fail(self, external_account_id: str, error: str, retryable: bool) -> Optional[float]:
+        """
+        Enregistre un échec
+        Returns: délai avant la prochaine tentative, ou None si la tâche passe en dead-letter
+        (échec définitif ou nombre maximal de tentatives atteint)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM provisioning_jobs WHERE external_account_id = ?",
+                (external_account_id,)
+            ).fetchone()
+            attempts = (row['attempts'] if row else 0) + 1
+
+            if retryable and attempts < self.max_attempts:
+                delay = self.backoff(attempts)
+                self._conn.execute(
+                    "UPDATE provisioning_jobs SET attempts = ?, next_attempt_at = ?, last_error = ?, "
+                    "updated_at = ? WHERE external_account_id = ?",
+                    (attempts, now + delay, error, now, external_account_id)
+                )
+                return delay
+
+            # Les données du compte ne sont plus utiles une fois la tâche abandonnée
+            self._conn.execute(
+                "UPDATE provisioning_jobs SET state = ?, payload = NULL, attempts = ?, last_error = ?, "
+                "updated_at = ? WHERE external_account_id = ?",
+                (DEAD, attempts, error, now, external_account_id)
+            )
+            return None
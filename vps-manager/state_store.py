@@ -0,0 +1,209 @@
+"""
+État local persistant du VPS Manager (SQLite)
+Associe chaque compte à son dossier terminal, sa plateforme, le hash de l'EA
+installé, le PID du terminal et le dernier statut, pour des redémarrages incrémentaux
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EXECUTABLES = {'terminal.exe': 'MT4', 'terminal64.exe': 'MT5'}
+# Dossier d'une copie de template en cours (voir template_registry)
+PARTIAL_SUFFIX = '.partial'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terminals (
+    external_account_id TEXT PRIMARY KEY,
+    terminal_dir TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    broker TEXT,
+    server TEXT,
+    login TEXT,
+    ea_hash TEXT,
+    pid INTEGER,
+    status TEXT NOT NULL DEFAULT 'unknown',
+    error_message TEXT,
+    host_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_seen_at REAL
+);
+"""
+
+COLUMNS = (
+    'terminal_dir', 'platform', 'broker', 'server', 'login', 'ea_hash',
+    'pid', 'status', 'error_message', 'last_seen_at', 'host_id'
+)
+# Colonnes ajoutées après la création de la table: (nom, type)
+ADDED_COLUMNS = (('host_id', 'TEXT'),)
+
+
+def _terminal_dir_of(exe: Optional[str], cmdline: Optional[List[str]]) -> Optional[str]:
+    """
+    Dossier du terminal MT4/MT5 d'un processus, ou None
+    L'exécutable est cherché dans exe puis dans les deux premiers arguments
+    (terminal lancé via un interpréteur ou Wine)
+    """
+    for candidate in [exe] + list(cmdline or [])[:2]:
+        if candidate and os.path.basename(candidate).lower() in TERMINAL_EXECUTABLES:
+            return os.path.normcase(os.path.dirname(os.path.abspath(candidate)))
+    return None
+
+
+def scan_terminal_processes(terminals_base: Path) -> Dict[str, int]:
+    """
+    Parcourt une seule fois les processus en cours et retourne les terminaux
+    MT4/MT5 lancés depuis terminals_base: {dossier terminal (normcase): pid}
+    """
+    base = os.path.normcase(str(Path(terminals_base).resolve()))
+    running = {}
+    for proc in psutil.process_iter(['pid', 'exe', 'cmdline']):
+        terminal_dir = _terminal_dir_of(proc.info.get('exe'), proc.info.get('cmdline'))
+        if terminal_dir and os.path.dirname(terminal_dir) == base:
+            running[terminal_dir] = proc.info['pid']
+    return running
+
+
+def is_terminal_process(pid: Optional[int], terminal_dir: Path) -> bool:
+    """Vérifie que le PID est toujours un terminal lancé depuis terminal_dir"""
+    if not pid:
+        return False
+    try:
+        proc = psutil.Process(pid)
+        with proc.oneshot():
+            found = _terminal_dir_of(proc.exe(), proc.cmdline())
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return False
+    return found == os.path.normcase(str(Path(terminal_dir).resolve()))
+
+
+class StateStore:
+    def __init__(self, db_path: str):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        # Partagé entre la boucle principale et les threads de fond (baux, métriques)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(terminals)")}
+            for name, column_type in ADDED_COLUMNS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE terminals ADD COLUMN {name} {column_type}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, external_account_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM terminals WHERE external_account_id = ?",
+                (external_account_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def all(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM terminals ORDER BY created_at").fetchall()
+        return [dict(row) for row in rows]
+
+    def record_terminal(self, external_account_id: str, terminal_dir: Path, platform: str, **fields):
+        """Crée ou met à jour l'entrée d'un compte"""
+        now = time.time()
+        fields = {key: value for key, value in fields.items() if key in COLUMNS}
+        fields['terminal_dir'] = str(terminal_dir)
+        fields['platform'] = platform
+        names = list(fields)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO terminals (external_account_id, {', '.join(names)}, created_at, updated_at) "
+                f"VALUES (?, {', '.join('?' for _ in names)}, ?, ?) "
+                f"ON CONFLICT(external_account_id) DO UPDATE SET "
+                f"{', '.join(f'{name} = excluded.{name}' for name in names)}, updated_at = excluded.updated_at",
+                (external_account_id, *fields.values(), now, now)
+            )
+
+    def update(self, external_account_id: str, **fields):
+        """Met à jour certains champs d'un compte existant"""
+        fields = {key: value for key, value in fields.items() if key in COLUMNS}
+        if not fields:
+            return
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE terminals SET {assignments}, updated_at = ? WHERE external_account_id = ?",
+                (*fields.values(), time.time(), external_account_id)
+            )
+
+    def delete(self, external_account_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM terminals WHERE external_account_id = ?", (external_account_id,))
+
+    def reconcile(self, terminals_base: Path) -> Dict[str, int]:
+        """
+        Synchronise l'état avec le disque et les processus en une seule passe:
+        un scandir de terminals_base et un parcours des processus
+        Returns: compteurs (running, stopped, adopted, missing)
+        """
+        terminals_base = Path(terminals_base)
+        running = scan_terminal_processes(terminals_base)
+        records = {record['external_account_id']: record for record in self.all()}
+        summary = {'running': 0, 'stopped': 0, 'adopted': 0, 'missing': 0}
+        now = time.time()
+        seen = set()
+
+        try:
+            entries = list(os.scandir(terminals_base))
+        except OSError as e:
+            logger.error(f"Impossible de parcourir {terminals_base}: {e}")
+            entries = []
+
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            platform, _, external_account_id = entry.name.partition('-')
+            if platform not in ('MT4', 'MT5') or not external_account_id or external_account_id == 'Base':
+                continue
+            # Copie de template interrompue (recréée au prochain provisionnement)
+            if external_account_id.endswith(PARTIAL_SUFFIX):
+                continue
+
+            seen.add(external_account_id)
+            pid = running.get(os.path.normcase(str(Path(entry.path).resolve())))
+            if pid:
+                summary['running'] += 1
+            else:
+                summary['stopped'] += 1
+
+            if external_account_id not in records:
+                # Dossier créé avant l'introduction de l'état local
+                summary['adopted'] += 1
+                self.record_terminal(external_account_id, Path(entry.path), platform, pid=pid, last_seen_at=now)
+            else:
+                self.update(external_account_id, pid=pid, last_seen_at=now if pid else records[external_account_id]['last_seen_at'])
+
+        for external_account_id, record in records.items():
+            if external_account_id not in seen and record['status'] != 'missing':
+                summary['missing'] += 1
+                self.update(external_account_id, pid=None, status='missing')
+
+        logger.info(
+            f"Etat local synchronise: {summary['running']} terminal(aux) en cours, "
+            f"{summary['stopped']} arrete(s), {summary['adopted']} adopte(s), {summary['missing']} manquant(s)"
+        )
+        return summary
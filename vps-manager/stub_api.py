@@ -0,0 +1,286 @@
+"""
+API backend locale simulée pour tester le VPS Manager sans Supabase
+Reproduit les routes /api/vps/* du backend (comptes en attente, claim/lease, statut)
+
+Usage:
+    python stub_api.py --port 8010 --accounts 20 --api-key test
+Puis lancer le VPS Manager avec API_URL=http://127.0.0.1:8010 et VPS_API_KEY=test
+"""
+
+import json
+import math
+import time
+import uuid
+import argparse
+import logging
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StubBackend:
+    """État en mémoire des comptes de trading et des VPS (équivalent de vps.service.ts)"""
+
+    def __init__(self, api_key: str = 'test'):
+        self.api_key = api_key
+        self.accounts: Dict[str, Dict] = {}
+        self.hosts: Dict[str, Dict] = {}
+        self.status_updates: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_account(
+        self,
+        platform: str = 'MT4',
+        broker: str = 'Vantage',
+        server: str = 'VantageInternational-Demo',
+        login: Optional[str] = None,
+        investor_password: str = 'investor',
+        external_account_id: Optional[str] = None
+    ) -> str:
+        external_account_id = external_account_id or str(uuid.uuid4())
+        with self._lock:
+            self.accounts[external_account_id] = {
+                'external_account_id': external_account_id,
+                'broker': broker,
+                'platform': platform,
+                'server': server,
+                'login': login or str(10000000 + len(self.accounts)),
+                'investor_password': investor_password,
+                'status': 'pending_vps_setup',
+                'error_message': None,
+                'vps_host_id': None,
+                'vps_lease_expires_at': None,
+                'created_at': time.time(),
+            }
+        return external_account_id
+
+    @staticmethod
+    def _public(account: Dict) -> Dict:
+        keys = ('external_account_id', 'broker', 'platform', 'server', 'login', 'investor_password')
+        return {key: account[key] for key in keys}
+
+    @staticmethod
+    def _lease_available(account: Dict, now: float) -> bool:
+        expires = account['vps_lease_expires_at']
+        return expires is None or expires < now
+
+    def pending_accounts(self) -> List[Dict]:
+        with self._lock:
+            return [
+                self._public(a) for a in self.accounts.values()
+                if a['status'] == 'pending_vps_setup'
+            ]
+
+    def claim_accounts(self, host_id: str, capacity: int, free_slots: int, lease_ttl: int) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            self.hosts[host_id] = {'capacity': capacity, 'free_slots': free_slots, 'last_seen_at': now}
+            if free_slots <= 0:
+                return []
+
+            claimable = sorted(
+                (a for a in self.accounts.values()
+                 if a['status'] == 'pending_vps_setup' and self._lease_available(a, now)),
+                key=lambda a: a['created_at']
+            )
+            if not claimable:
+                return []
+
+            active_since = now - lease_ttl * 2
+            total_free = sum(
+                max(h['free_slots'], 0) for h in self.hosts.values()
+                if h['last_seen_at'] >= active_since
+            )
+            fair_share = math.ceil(len(claimable) * free_slots / max(total_free, free_slots))
+            limit = min(free_slots, max(fair_share, 1))
+
+            claimed = []
+            for account in claimable[:limit]:
+                account['vps_host_id'] = host_id
+                account['vps_lease_expires_at'] = now + lease_ttl
+                claimed.append(self._public(account))
+            return claimed
+
+    def leased_accounts(self, host_id: str, external_account_ids: List[str]) -> List[Dict]:
+        with self._lock:
+            return [
+                self._public(account)
+                for account in (self.accounts.get(i) for i in external_account_ids)
+                if account is not None and account['vps_host_id'] == host_id
+                and account['status'] == 'pending_vps_setup'
+            ]
+
+    def renew_lease(self, host_id: str, external_account_ids: List[str], lease_ttl: int) -> List[str]:
+        now = time.time()
+        renewed = []
+        with self._lock:
+            if host_id in self.hosts:
+                self.hosts[host_id]['last_seen_at'] = now
+            for external_account_id in external_account_ids:
+                account = self.accounts.get(external_account_id)
+                if (account and account['vps_host_id'] == host_id
+                        and account['status'] == 'pending_vps_setup'):
+                    account['vps_lease_expires_at'] = now + lease_ttl
+                    renewed.append(external_account_id)
+        return renewed
+
+    def accounts_state(self, external_account_ids: List[str]) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    'external_account_id': account['external_account_id'],
+                    'status': account['status'],
+                    'vps_host_id': account['vps_host_id'],
+                    'vps_lease_expires_at': (
+                        datetime.fromtimestamp(account['vps_lease_expires_at'], timezone.utc).isoformat()
+                        if account['vps_lease_expires_at'] is not None else None
+                    ),
+                }
+                for account in (self.accounts.get(i) for i in external_account_ids)
+                if account is not None
+            ]
+
+    def delete_account(self, external_account_id: str):
+        with self._lock:
+            self.accounts.pop(external_account_id, None)
+
+    def update_status(self, external_account_id: str, status: str, error_message: Optional[str] = None) -> bool:
+        with self._lock:
+            account = self.accounts.get(external_account_id)
+            if account is None:
+                return False
+            account['status'] = status
+            account['vps_lease_expires_at'] = None
+            if error_message:
+                account['error_message'] = error_message
+            self.status_updates.append({
+                'external_account_id': external_account_id,
+                'status': status,
+                'error_message': error_message,
+                'timestamp': time.time(),
+            })
+            return True
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    backend: StubBackend = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status_code: int, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self) -> bool:
+        if self.headers.get('X-VPS-API-Key') != self.backend.api_key:
+            self._send_json(401, {'message': 'Clé API VPS invalide'})
+            return False
+        return True
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == '/api/vps/pending-accounts':
+            self._send_json(200, self.backend.pending_accounts())
+        else:
+            self._send_json(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {'message': 'JSON invalide'})
+            return
+
+        if self.path == '/api/vps/claim-accounts':
+            self._send_json(200, self.backend.claim_accounts(
+                body['host_id'],
+                int(body.get('capacity', 0)),
+                int(body.get('free_slots', 0)),
+                int(body.get('lease_ttl_seconds', 300))
+            ))
+        elif self.path == '/api/vps/renew-lease':
+            renewed = self.backend.renew_lease(
+                body['host_id'],
+                body.get('external_account_ids', []),
+                int(body.get('lease_ttl_seconds', 300))
+            )
+            self._send_json(200, {'renewed': renewed})
+        elif self.path == '/api/vps/leased-accounts':
+            self._send_json(200, self.backend.leased_accounts(body['host_id'], body.get('external_account_ids', [])))
+        elif self.path == '/api/vps/accounts-state':
+            self._send_json(200, {'accounts': self.backend.accounts_state(body.get('external_account_ids', []))})
+        elif self.path == '/api/vps/account-status':
+            if self.backend.update_status(
+                body.get('external_account_id'),
+                body.get('status'),
+                body.get('error_message')
+            ):
+                self._send_json(200, {'success': True})
+            else:
+                self._send_json(400, {'message': 'Compte inconnu'})
+        else:
+            self._send_json(404, {'message': 'Not Found'})
+
+
+class StubApiServer:
+    """Serveur HTTP de l'API simulée, lancé dans un thread (tests et benchmarks)"""
+
+    def __init__(self, backend: StubBackend, host: str = '127.0.0.1', port: int = 0):
+        handler = type('BoundStubRequestHandler', (StubRequestHandler,), {'backend': backend})
+        self.backend = backend
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="API backend simulée pour le VPS Manager")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument('--accounts', type=int, default=10, help="Nombre de comptes en attente à créer")
+    parser.add_argument('--platform', default='MT4', choices=['MT4', 'MT5'])
+    parser.add_argument('--api-key', default='test')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    stub_backend = StubBackend(api_key=args.api_key)
+    for _ in range(args.accounts):
+        stub_backend.add_account(platform=args.platform)
+
+    server = StubApiServer(stub_backend, args.host, args.port)
+    logger.info(f"API simulée sur {server.url} ({args.accounts} compte(s) en attente)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
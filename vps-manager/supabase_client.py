@@ -5,6 +5,7 @@ Client pour communiquer avec l'API backend RendR
 import requests
 import logging
 from typing import List, Dict, Optional
+from metrics import API_REQUEST_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +26,8 @@ class SupabaseClient:
         """
         try:
             url = f"{self.api_url}/api/vps/pending-accounts"
-            response = requests.get(url, headers=self.headers, timeout=30)
+            with API_REQUEST_SECONDS.time(endpoint='pending-accounts'):
+                response = requests.get(url, headers=self.headers, timeout=30)
 
             if response.status_code == 200:
                 accounts = response.json()
@@ -70,7 +72,8 @@ class SupabaseClient:
             if error_message:
                 payload['error_message'] = error_message
 
-            response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+            with API_REQUEST_SECONDS.time(endpoint='account-status'):
+                response = requests.post(url, json=payload, headers=self.headers, timeout=30)
 
             if response.status_code == 200:
                 logger.info(f"Statut mis à jour pour {external_account_id}: {status}")
@@ -92,3 +95,125 @@ class SupabaseClient:
             logger.error("=" * 60)
             return False
 
+    def claim_pending_accounts(
+        self,
+        host_id: str,
+        capacity: int,
+        free_slots: int,
+        lease_ttl: int
+    ) -> List[Dict]:
+        """
+        Réclame un lot de comptes en attente avec un bail (lease)
+        Le backend limite le lot à la part de ce VPS selon ses emplacements libres
+        Args:
+            host_id: Identifiant du VPS
+            capacity: Nombre total de terminaux supportés par le VPS
+            free_slots: Emplacements de terminaux libres
+            lease_ttl: Durée du bail en secondes
+        Returns: Liste des comptes réclamés (même format que get_pending_accounts)
+        """
+        try:
+            url = f"{self.api_url}/api/vps/claim-accounts"
+            payload = {
+                'host_id': host_id,
+                'capacity': capacity,
+                'free_slots': free_slots,
+                'lease_ttl_seconds': lease_ttl
+            }
+
+            with API_REQUEST_SECONDS.time(endpoint='claim-accounts'):
+                response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+
+            if response.status_code == 200:
+                accounts = response.json()
+                if accounts:
+                    logger.info(f"Réclamation de {len(accounts)} compte(s) pour {host_id}")
+                return accounts
+            else:
+                logger.error(f"Erreur API: {response.status_code} - {response.text}")
+                return []
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Erreur de connexion à l'API lors de la réclamation des comptes ({url}): {str(e)}")
+            return []
+
+    def renew_leases(
+        self,
+        host_id: str,
+        external_account_ids: List[str],
+        lease_ttl: int
+    ) -> Optional[List[str]]:
+        """
+        Prolonge le bail des comptes en cours de configuration
+        Returns: Liste des comptes renouvelés, ou None si l'API est injoignable
+        """
+        try:
+            url = f"{self.api_url}/api/vps/renew-lease"
+            payload = {
+                'host_id': host_id,
+                'external_account_ids': external_account_ids,
+                'lease_ttl_seconds': lease_ttl
+            }
+
+            with API_REQUEST_SECONDS.time(endpoint='renew-lease'):
+                response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+
+            if response.status_code == 200:
+                return response.json().get('renewed', [])
+            else:
+                logger.error(f"Erreur lors du renouvellement du bail: {response.status_code} - {response.text}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Erreur de connexion à l'API lors du renouvellement du bail ({url}): {str(e)}")
+            return None
+
+    def get_leased_accounts(self, host_id: str, external_account_ids: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        Récupère les identifiants des comptes encore réservés à ce VPS (nouvelles tentatives)
+        Returns: {external_account_id: compte} (format de get_pending_accounts, les comptes
+                 qui ne sont plus en attente pour ce VPS sont absents), ou None si l'API
+                 est injoignable ou en erreur
+        """
+        try:
+            url = f"{self.api_url}/api/vps/leased-accounts"
+            payload = {'host_id': host_id, 'external_account_ids': external_account_ids}
+
+            with API_REQUEST_SECONDS.time(endpoint='leased-accounts'):
+                response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+
+            if response.status_code == 200:
+                return {account['external_account_id']: account for account in response.json()}
+            else:
+                logger.error(f"Erreur API: {response.status_code} - {response.text}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Erreur de connexion à l'API lors de la récupération des identifiants ({url}): {str(e)}")
+            return None
+
+    def get_accounts_state(self, external_account_ids: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        Récupère le statut et le VPS propriétaire d'une liste de comptes
+        Returns: {external_account_id: {'status', 'vps_host_id', 'vps_lease_expires_at'}} (les comptes supprimés
+                 sont absents), ou None si l'API est injoignable ou en erreur
+        """
+        try:
+            url = f"{self.api_url}/api/vps/accounts-state"
+            payload = {'external_account_ids': external_account_ids}
+
+            with API_REQUEST_SECONDS.time(endpoint='accounts-state'):
+                response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+
+            if response.status_code == 200:
+                return {
+                    account['external_account_id']: account
+                    for account in response.json().get('accounts', [])
+                }
+            else:
+                logger.error(f"Erreur API: {response.status_code} - {response.text}")
+                return None
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Erreur de connexion à l'API lors de la récupération des statuts ({url}): {str(e)}")
+            return None
@@ -0,0 +1,291 @@
+"""
+Registre des templates de terminaux par broker
+- Couche de base: template préconfiguré commun (MT4_PATH / MT5_PATH: WebRequest, profil RendR)
+- Couche broker: petit dossier par broker dans TEMPLATES_PATH/<MT4|MT5>/<nom>, avec la même
+  arborescence que le terminal (config/servers.dat, symboles, configuration)
+Le terminal d'un compte est la base recouverte par la couche de son broker: le serveur
+est connu dès le premier lancement et la connexion aboutit sans recherche de serveur.
+Les manifestes (dossiers et fichiers de chaque couche) sont calculés au démarrage:
+un clonage copie une liste de fichiers déjà connue, sans parcourir le template
+Les fichiers de la base jamais modifiés par un terminal (TEMPLATE_LINK_PATTERNS:
+exécutables, DLL, sons...) sont des liens physiques vers la base, le reste est copié
+"""
+
+import os
+import re
+import time
+import shutil
+import fnmatch
+import logging
+import threading
+import configparser
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY, Counter
+from state_store import PARTIAL_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_CLONES = REGISTRY.register(Counter(
+    'vps_template_clones_total', "Terminaux crees par template (base + couche broker)", ['template']))
+
+# Critères de sélection facultatifs d'une couche broker
+OVERLAY_CONFIG_NAME = 'template.ini'
+IGNORED_PATTERNS = ('*.log', '*.tmp')
+
+
+def _broker_key(name: Optional[str]) -> str:
+    """'IC Markets (SC)' -> 'icmarketssc'"""
+    return re.sub(r'[^a-z0-9]', '', (name or '').lower())
+
+
+class Manifest:
+    """Dossiers et fichiers d'une couche (chemins relatifs), calculés une seule fois"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.dirs: List[str] = []
+        # (chemin relatif, taille, date de modification)
+        self.files: List[Tuple[str, int, float]] = []
+        self.total_bytes = 0
+
+    @classmethod
+    def build(cls, root: Path, exclude: Tuple[str, ...] = ()) -> 'Manifest':
+        manifest = cls(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            if rel_dir != '.':
+                manifest.dirs.append(rel_dir)
+            for name in filenames:
+                if name in exclude or any(fnmatch.fnmatch(name, p) for p in IGNORED_PATTERNS):
+                    continue
+                stat = os.stat(os.path.join(dirpath, name))
+                rel = name if rel_dir == '.' else os.path.join(rel_dir, name)
+                manifest.files.append((rel, stat.st_size, stat.st_mtime))
+                manifest.total_bytes += stat.st_size
+        return manifest
+
+
+class Overlay:
+    """Couche broker et critères de sélection (serveurs, brokers)"""
+
+    def __init__(self, platform: str, name: str, manifest: Manifest,
+                 servers: List[str], brokers: List[str]):
+        self.platform = platform
+        self.name = name
+        self.manifest = manifest
+        self.servers = [pattern.lower() for pattern in servers]
+        self.brokers = {_broker_key(broker) for broker in brokers}
+
+    @classmethod
+    def load(cls, platform: str, root: Path) -> 'Overlay':
+        # Par défaut: serveurs dont le nom commence par celui du dossier, broker du même nom
+        servers = [f"{root.name}*"]
+        brokers = [root.name]
+        config_path = root / OVERLAY_CONFIG_NAME
+        if config_path.is_file():
+            parser = configparser.ConfigParser()
+            parser.read(config_path, encoding='utf-8')
+            if 'match' in parser:
+                servers = [s.strip() for s in parser['match'].get('servers', '').split(',') if s.strip()] or servers
+                brokers = [b.strip() for b in parser['match'].get('brokers', '').split(',') if b.strip()] or brokers
+        return cls(platform, root.name, Manifest.build(root, exclude=(OVERLAY_CONFIG_NAME,)), servers, brokers)
+
+    def server_match(self, server: Optional[str]) -> int:
+        """Longueur du motif de serveur correspondant le plus précis (0: aucun)"""
+        if not server:
+            return 0
+        server = server.lower()
+        return max((len(p) for p in self.servers if fnmatch.fnmatchcase(server, p)), default=0)
+
+
+class Template:
+    """Base d'une plateforme recouverte (ou non) par une couche broker"""
+
+    def __init__(self, platform: str, base: Optional[Manifest], overlay: Optional[Overlay],
+                 link_patterns: Tuple[str, ...] = ()):
+        self.platform = platform
+        self.base = base
+        self.overlay = overlay
+        self.name = f"{platform}/{overlay.name if overlay else 'base'}"
+        # Fusion des couches: un fichier de la couche broker remplace celui de la base
+        sources: Dict[str, Tuple[Path, int]] = {}
+        dirs = set()
+        for layer in (base, overlay.manifest if overlay else None):
+            if layer is None:
+                continue
+            dirs.update(layer.dirs)
+            for rel, size, _ in layer.files:
+                sources[rel] = (layer.root / rel, size)
+        self.dirs = sorted(dirs)
+        self.sources = sources
+        # Fichiers de la base en lecture seule (liens physiques): jamais ceux de la couche broker
+        overlay_files = {rel for rel, _, _ in overlay.manifest.files} if overlay else set()
+        self.links = {
+            rel for rel, _, _ in (base.files if base else [])
+            if rel not in overlay_files and any(fnmatch.fnmatch(rel, p) for p in link_patterns)
+        }
+        # Liens impossibles (autre volume, système de fichiers sans liens): copie
+        self._link_supported = True
+
+    @property
+    def available(self) -> bool:
+        return self.base is not None
+
+    def clone(self, terminal_dir: Path) -> int:
+        """
+        Crée le dossier terminal depuis le manifeste; retourne les octets copiés
+        (hors liens physiques)
+        La copie se fait dans un dossier temporaire renommé à la fin: une copie
+        interrompue ne laisse jamais un terminal incomplet
+        """
+        terminal_dir = Path(terminal_dir)
+        partial = terminal_dir.with_name(terminal_dir.name + PARTIAL_SUFFIX)
+        if partial.exists():
+            shutil.rmtree(partial)
+        partial.mkdir(parents=True)
+        copied = 0
+        try:
+            for rel in self.dirs:
+                (partial / rel).mkdir(parents=True, exist_ok=True)
+            for rel, (source, size) in self.sources.items():
+                if rel in self.links and self._link(source, partial / rel):
+                    continue
+                shutil.copy2(source, partial / rel)
+                copied += size
+            os.replace(partial, terminal_dir)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        TEMPLATE_CLONES.inc(template=self.name)
+        return copied
+
+    def _link(self, source: Path, dest: Path) -> bool:
+        if not self._link_supported:
+            return False
+        try:
+            os.link(source, dest)
+            return True
+        except OSError as e:
+            self._link_supported = False
+            logger.warning(f"Liens physiques impossibles pour le template {self.name} ({e}): copie complete")
+            return False
+
+    def apply_overlay(self, terminal_dir: Path) -> int:
+        """Met à jour la couche broker d'un terminal existant; retourne le nombre de fichiers copiés"""
+        if self.overlay is None:
+            return 0
+        updated = 0
+        for rel, size, mtime in self.overlay.manifest.files:
+            dest = Path(terminal_dir) / rel
+            try:
+                stat = dest.stat()
+                if stat.st_size == size and int(stat.st_mtime) == int(mtime):
+                    continue
+            except FileNotFoundError:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+            # Remplacement (pas d'écriture en place): dest peut être un lien vers la base
+            tmp_dest = dest.with_name(dest.name + '.tmp')
+            shutil.copy2(self.overlay.manifest.root / rel, tmp_dest)
+            os.replace(tmp_dest, dest)
+            updated += 1
+        return updated
+
+
+class TemplateRegistry:
+    def __init__(self, config):
+        self.base_paths = {'MT4': Path(config.MT4_PATH), 'MT5': Path(config.MT5_PATH)}
+        self.templates_path = Path(config.TEMPLATES_PATH) if config.TEMPLATES_PATH else None
+        self.link_patterns = tuple(p.strip() for p in config.TEMPLATE_LINK_PATTERNS.split(',') if p.strip())
+        self._lock = threading.Lock()
+        self._bases: Dict[str, Optional[Manifest]] = {}
+        self._overlays: Dict[str, List[Overlay]] = {}
+        self._templates: Dict[Tuple[str, Optional[str]], Template] = {}
+        # Serveurs sans couche broker déjà signalés
+        self._unmatched = set()
+
+    def load(self):
+        """Calcule les manifestes de toutes les couches (au démarrage)"""
+        start = time.monotonic()
+        bases: Dict[str, Optional[Manifest]] = {}
+        overlays: Dict[str, List[Overlay]] = {}
+        for platform, base_path in self.base_paths.items():
+            bases[platform] = Manifest.build(base_path) if base_path.is_dir() else None
+            overlays[platform] = []
+            platform_dir = self.templates_path / platform if self.templates_path else None
+            if platform_dir is not None and platform_dir.is_dir():
+                for entry in sorted(platform_dir.iterdir()):
+                    if entry.is_dir():
+                        overlays[platform].append(Overlay.load(platform, entry))
+        with self._lock:
+            self._bases = bases
+            self._overlays = overlays
+            self._templates = {}
+        for platform in self.base_paths:
+            base = bases[platform]
+            logger.info(
+                f"Templates {platform}: base {'absente' if base is None else f'{len(base.files)} fichiers'}, "
+                f"{len(overlays[platform])} couche(s) broker "
+                f"({', '.join(o.name for o in overlays[platform]) or 'aucune'})"
+            )
+        logger.info(f"Manifestes des templates calcules en {time.monotonic() - start:.2f}s")
+
+    def refresh(self):
+        """Recalcule les manifestes (template modifié sur le disque)"""
+        self.load()
+
+    def _match(self, platform: str, broker: Optional[str], server: Optional[str]) -> Optional[Overlay]:
+        """Couche du serveur (motif le plus précis), sinon couche du broker"""
+        overlays = self._overlays.get(platform, [])
+        best, best_score = None, 0
+        for overlay in overlays:
+            score = overlay.server_match(server)
+            if score > best_score:
+                best, best_score = overlay, score
+        if best is not None:
+            return best
+        key = _broker_key(broker)
+        if key:
+            for overlay in overlays:
+                if key in overlay.brokers:
+                    return overlay
+        return None
+
+    def resolve(self, platform: str, broker: Optional[str], server: Optional[str]) -> Template:
+        with self._lock:
+            overlay = self._match(platform, broker, server)
+            if overlay is None and (platform, server) not in self._unmatched:
+                self._unmatched.add((platform, server))
+                logger.warning(
+                    f"Aucune couche broker {platform} pour le serveur {server} ({broker}): "
+                    f"template de base seul, premiere connexion plus lente"
+                )
+            key = (platform, overlay.name if overlay else None)
+            template = self._templates.get(key)
+            if template is None:
+                template = Template(platform, self._bases.get(platform), overlay, self.link_patterns)
+                self._templates[key] = template
+            return template
+
+    def describe(self) -> List[Dict]:
+        """Couches chargées (commande templates)"""
+        rows = []
+        with self._lock:
+            for platform, base in self._bases.items():
+                rows.append({
+                    'template': f"{platform}/base",
+                    'path': str(self.base_paths[platform]),
+                    'files': len(base.files) if base else 0,
+                    'bytes': base.total_bytes if base else 0,
+                    'match': '' if base else 'absent',
+                })
+                for overlay in self._overlays.get(platform, []):
+                    rows.append({
+                        'template': f"{platform}/{overlay.name}",
+                        'path': str(overlay.manifest.root),
+                        'files': len(overlay.manifest.files),
+                        'bytes': overlay.manifest.total_bytes,
+                        'match': f"servers={','.join(overlay.servers)} brokers={','.join(sorted(overlay.brokers))}",
+                    })
+        return rows
@@ -0,0 +1,68 @@
+"""
+Tests de l'ordonnancement des lancements (sans MetaTrader)
+
+Usage (depuis vps-manager/):
+    python -m unittest discover tests
+"""
+
+import sys
+import time
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+VPS_MANAGER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(VPS_MANAGER_DIR))
+
+from launch_scheduler import LaunchScheduler  # noqa: E402
+
+
+def make_scheduler(spread_window: float) -> LaunchScheduler:
+    return LaunchScheduler(SimpleNamespace(
+        LAUNCH_MAX_CONCURRENT=10,
+        LAUNCH_MAX_LOAD=1000.0,
+        LAUNCH_MIN_INTERVAL=0.0,
+        LAUNCH_SPREAD_WINDOW=spread_window,
+        READINESS_TIMEOUT=60,
+        LAUNCH_LOW_PRIORITY=False,
+        LAUNCH_CPU_AFFINITY=0,
+    ))
+
+
+class SpreadTest(unittest.TestCase):
+    def test_launch_outside_batch_is_not_paced(self):
+        # Lot de 2 terminaux sur 4 s: un lancement du lot toutes les 2 s
+        scheduler = make_scheduler(spread_window=4.0)
+        with scheduler.spread(['resume-1', 'resume-2']):
+            scheduler.acquire('resume-1')
+            paced = threading.Thread(target=scheduler.acquire, args=('resume-2',))
+            paced.start()
+            # resume-2 attend en tête de file l'intervalle de son lot
+            time.sleep(0.2)
+
+            waited = scheduler.acquire('new-account')
+
+            self.assertLess(waited, 0.5)
+            self.assertTrue(paced.is_alive())
+            paced.join(timeout=5)
+            self.assertFalse(paced.is_alive())
+
+    def test_batch_launches_are_paced(self):
+        scheduler = make_scheduler(spread_window=1.0)
+        with scheduler.spread(['a', 'b']):
+            scheduler.acquire('a')
+            waited = scheduler.acquire('b')
+        self.assertGreaterEqual(waited, 0.4)
+
+    def test_overlapping_batches_keep_their_own_interval(self):
+        scheduler = make_scheduler(spread_window=2.0)
+        with scheduler.spread(['a', 'b']):
+            with scheduler.spread(['c', 'd', 'e', 'f']):
+                pass
+            self.assertEqual([batch.interval for batch in scheduler._batches], [1.0])
+        self.assertEqual(scheduler._batches, [])
+
+
+if __name__ == '__main__':
+    unittest.main()